@@ -0,0 +1,133 @@
+"""Deterministic synthetic ledgers for the benchmarks
+
+Everything is posted through AccountManager, so generated books go through
+the same code as real ones. The same seed and scale always give the same
+book.
+"""
+
+import datetime
+import random
+from decimal import Decimal
+from typing import NamedTuple
+
+from contador.core.entities import Account, Document, Payee, Transaction
+from contador.core.manager import AccountManager
+
+START = datetime.date(2021, 1, 1)
+DAYS = 365
+
+
+class Scale(NamedTuple):
+    """Extra expense accounts, payees and invoices of a synthetic book"""
+
+    accounts: int
+    payees: int
+    invoices: int
+
+    @property
+    def name(self) -> str:
+        return f"{self.accounts}x{self.payees}x{self.invoices}"
+
+    @classmethod
+    def parse(cls, value: str) -> "Scale":
+        """A scale from its name, or from a number of invoices alone"""
+        parts = [int(part) for part in value.split("x")]
+        if len(parts) == 1:
+            invoices = parts[0]
+            return cls(max(10, invoices // 500), max(10, invoices // 100), invoices)
+        return cls(*parts)
+
+
+class Generated(NamedTuple):
+    accounts: list[Account]
+    payees: list[Payee]
+    expense_invoices: list[Document]
+    sale_invoices: list[Document]
+
+
+class Generator:
+    """Post a synthetic year of activity through an account manager
+
+    For every invoice, expense and sale alternate; most are paid in full or
+    in part some days later, and expenses are split out to one of the extra
+    accounts. Every payee is paid a salary, with tax retained, each month.
+    """
+
+    def __init__(self, manager: AccountManager, seed: int = 0):
+        self.manager = manager
+        self.random = random.Random(seed)
+
+    def date(self, after: datetime.date = START, within: int = DAYS):
+        return after + datetime.timedelta(days=self.random.randrange(within))
+
+    def amount(self, low: int = 10, high: int = 10_000) -> Decimal:
+        return Decimal(self.random.randrange(low * 100, high * 100)) / 100
+
+    def accounts(self, count: int) -> list[Account]:
+        chart = self.manager.chart
+        return [
+            chart.add_account(f"Expenses {number:05}", "Expenses")
+            for number in range(count)
+        ]
+
+    def payees(self, count: int) -> list[Payee]:
+        return [Payee(name=f"Payee {number:05}") for number in range(count)]
+
+    def allocate(self, account: Account, date: datetime.date, amount: Decimal):
+        """Move an expense from Expenses to one of the extra accounts"""
+        manager = self.manager
+        with manager.unit_of_work():
+            transaction = Transaction(
+                date=date, description="Expense allocation", book=manager.book
+            )
+            transaction.add_entries(
+                [account.debit(amount), manager.chart.expenses.credit(amount)]
+            )
+
+    def generate(self, scale: Scale) -> Generated:
+        manager = self.manager
+        accounts = self.accounts(scale.accounts)
+        payees = self.payees(scale.payees)
+        expenses, sales = [], []
+
+        for number in range(scale.invoices):
+            date, amount = self.date(), self.amount()
+            payee = self.random.choice(payees)
+            paid = self.date(date, 60)
+            if number % 2 == 0:
+                invoice = manager.add_expense_invoice(
+                    date, f"E{number:07}", amount, f"//invoices/e/{number}", payee
+                )
+                self.allocate(self.random.choice(accounts), date, amount)
+                expenses.append(invoice)
+                pay = manager.pay_invoices
+            else:
+                tax = (amount * Decimal("0.21")).quantize(Decimal("0.01"))
+                invoice = manager.add_sale_invoice(
+                    date, f"S{number:07}", amount, f"//invoices/s/{number}", payee, tax
+                )
+                sales.append(invoice)
+                amount += tax
+                pay = manager.receive_payment
+
+            chance = self.random.random()
+            if chance < 0.7:
+                pay([invoice], paid, amount)
+            elif chance < 0.85:
+                pay([invoice], paid, (amount / 2).quantize(Decimal("0.01")))
+
+        for month in range(1, 13):
+            payday = datetime.date(START.year, month, 28)
+            for payee in payees:
+                salary = self.amount(1_000, 5_000)
+                retention = (salary * Decimal("0.1")).quantize(Decimal("0.01"))
+                manager.register_salary(payday, salary, payee)
+                manager.pay_salary(payday, salary - retention, payee, retention)
+            manager.pay_taxes(payday, self.amount(100, 1_000))
+
+        return Generated(accounts, payees, expenses, sales)
+
+
+def generate(manager: AccountManager, scale: Scale, seed: int = 0) -> Generated:
+    """Post a synthetic book of the given scale through manager"""
+    return Generator(manager, seed).generate(scale)
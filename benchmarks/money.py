@@ -0,0 +1,51 @@
+"""Compare Money against the Decimal arithmetic it replaced
+
+Run from the repository root with ``python benchmarks/money.py``.
+"""
+
+import random
+import timeit
+from decimal import Decimal
+
+from contador.core.money import Money
+
+N = 100_000
+REPEAT = 5
+
+
+def best(statement, **namespace) -> float:
+    return min(timeit.repeat(statement, globals=namespace, number=1, repeat=REPEAT))
+
+
+def main():
+    rng = random.Random(0)
+    values = [f"{rng.randint(-10**8, 10**8) / 100:.2f}" for _ in range(N)]
+    decimals = [Decimal(value) for value in values]
+    moneys = [Money(value) for value in values]
+
+    results = {
+        "build Decimal": best(
+            "[Decimal(v) for v in values]", Decimal=Decimal, values=values
+        ),
+        "build Money": best("[Money(v) for v in values]", Money=Money, values=values),
+        "sum(Decimal)": best(
+            "sum(decimals, Decimal(0))", Decimal=Decimal, decimals=decimals
+        ),
+        "sum(Money)": best("sum(moneys, Money(0))", Money=Money, moneys=moneys),
+        "Money.sum": best("Money.sum(moneys)", Money=Money, moneys=moneys),
+        "running Decimal total": best(
+            "t = Decimal(0)\nfor v in decimals: t += v",
+            Decimal=Decimal,
+            decimals=decimals,
+        ),
+        "running Money total": best(
+            "t = Money(0)\nfor v in moneys: t += v", Money=Money, moneys=moneys
+        ),
+    }
+
+    for name, seconds in results.items():
+        print(f"{name:<24}{seconds * 1e9 / N:>10.1f} ns/amount")
+
+
+if __name__ == "__main__":
+    main()
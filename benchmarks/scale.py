@@ -0,0 +1,234 @@
+"""Time account manager operations as synthetic books grow
+
+Run from the repository root with ``python benchmarks/scale.py``. Each scale
+is a number of invoices, or accounts x payees x invoices like 50x100x10000.
+Results are written as JSON with --output, and compared against an earlier
+run with --compare; the run fails when any result got slower or bigger by
+more than --threshold.
+"""
+
+import argparse
+import json
+import platform
+import subprocess
+import sys
+import time
+import tracemalloc
+from decimal import Decimal
+from pathlib import Path
+from typing import Callable, Iterator, Optional
+
+from generator import START, Generated, Scale, generate
+
+from contador.core.accounting import ChartOfAccounts
+from contador.core.entities import Book, Payee
+from contador.core.manager import AccountManager
+
+SCALES = ["1000", "10000"]
+CALLS = 200
+REPEAT = 5
+SECONDS = "s/op"
+BYTES = "bytes/entry"
+
+
+def best(function: Callable[[], None], calls: int = CALLS) -> float:
+    """Best time of a call to function over REPEAT rounds of calls"""
+    rounds = []
+    for _ in range(REPEAT):
+        start = time.perf_counter()
+        for _ in range(calls):
+            function()
+        rounds.append(time.perf_counter() - start)
+    return min(rounds) / calls
+
+
+def each(function: Callable[[int], None]) -> Callable[[], None]:
+    """A call that passes function a new number every time"""
+    numbers = iter(range(sys.maxsize))
+    return lambda: function(next(numbers))
+
+
+def count_entries(book: Book) -> int:
+    return sum(
+        sum(1 for _ in account.iter_entries()) for account in book.accounts.values()
+    )
+
+
+def build(scale: Scale, compact: bool = False) -> tuple[AccountManager, Generated]:
+    book = Book(name=f"Benchmark {scale.name}", period="2021")
+    if compact:
+        book.use_compact_entries()
+    manager = AccountManager(book)
+    return manager, generate(manager, scale)
+
+
+def traced(scale: Scale, compact: bool = False) -> float:
+    """Memory taken by a book of the given scale, per entry"""
+    tracemalloc.start()
+    try:
+        before = tracemalloc.get_traced_memory()[0]
+        manager, _ = build(scale, compact)
+        used = tracemalloc.get_traced_memory()[0] - before
+    finally:
+        tracemalloc.stop()
+    return used / count_entries(manager.book)
+
+
+def measure(scale: Scale) -> Iterator[tuple[str, float, str]]:
+    """Name, value and unit of every result at scale"""
+    start = time.perf_counter()
+    manager, generated = build(scale)
+    seconds = time.perf_counter() - start
+    entries = count_entries(manager.book)
+    yield "generate", seconds / entries, "s/entry"
+
+    yield "memory", traced(scale), BYTES
+    yield "memory (compact entries)", traced(scale, compact=True), BYTES
+
+    payee = Payee(name="Benchmark payee")
+    amount = Decimal("123.45")
+
+    def add_expense_invoice(number: int):
+        manager.add_expense_invoice(START, f"B{number}", amount, "//b", payee)
+
+    def add_sale_invoice(number: int):
+        manager.add_sale_invoice(START, f"BS{number}", amount, "//b", payee, amount)
+
+    operations = {
+        "add_expense_invoice": each(add_expense_invoice),
+        "add_sale_invoice": each(add_sale_invoice),
+        "register_salary": lambda: manager.register_salary(START, amount, payee),
+        "pay_salary": lambda: manager.pay_salary(START, amount, payee, amount),
+        "pay_taxes": lambda: manager.pay_taxes(START, amount),
+    }
+    for name, operation in operations.items():
+        yield name, best(operation), SECONDS
+
+    # The same invoices in one batch, per invoice to compare with the calls above
+    batches = iter(range(sys.maxsize))
+
+    def invoice_rows(prefix: str, **values) -> list[dict]:
+        batch = next(batches)
+        return [
+            {
+                "date": START,
+                "number": f"{prefix}{batch}-{number}",
+                "amount": amount,
+                "invoice_url": "//b",
+                "payee": payee,
+                **values,
+            }
+            for number in range(CALLS)
+        ]
+
+    yield "post_expense_invoices (per invoice)", best(
+        lambda: manager.post_expense_invoices(invoice_rows("BB")), 1
+    ) / CALLS, SECONDS
+    yield "post_sale_invoices (per invoice)", best(
+        lambda: manager.post_sale_invoices(invoice_rows("BBS", tax_amount=amount)), 1
+    ) / CALLS, SECONDS
+
+    # Payments settle invoices that are still open
+    expenses = iter(generated.expense_invoices * REPEAT)
+    sales = iter(generated.sale_invoices * REPEAT)
+    calls = min(CALLS, len(generated.expense_invoices), len(generated.sale_invoices))
+    yield "pay_invoices", best(
+        lambda: manager.pay_invoices([next(expenses)], START, amount), calls
+    ), SECONDS
+    yield "receive_payment", best(
+        lambda: manager.receive_payment([next(sales)], START, amount), calls
+    ), SECONDS
+
+    bank = manager.chart.bank_account
+    yield "Account.balance", best(lambda: bank.balance), SECONDS
+    expenses = manager.chart.expenses
+    yield "Account.total_balance", best(lambda: expenses.total_balance), SECONDS
+
+    invoices = generated.expense_invoices + generated.sale_invoices
+    yield "is_invoice_clear", best(
+        each(lambda number: manager.is_invoice_clear(invoices[number % len(invoices)]))
+    ), SECONDS
+    # A manager that did not post the invoices checks their entries
+    outside = AccountManager(manager.book)
+    yield "is_invoice_clear (entries)", best(
+        each(lambda number: outside.is_invoice_clear(invoices[number % len(invoices)]))
+    ), SECONDS
+
+    yield "ChartOfAccounts (new book)", best(
+        lambda: ChartOfAccounts(Book(name="Empty", period="2021"))
+    ), SECONDS
+    yield "ChartOfAccounts (existing book)", best(
+        lambda: ChartOfAccounts(manager.book)
+    ), SECONDS
+
+
+def commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(scales: list[Scale]) -> dict:
+    results = {}
+    for scale in scales:
+        for name, value, unit in measure(scale):
+            key = f"{scale.name}/{name}"
+            results[key] = {"value": value, "unit": unit}
+            print(f"{key:<56}{format_value(value, unit):>16}")
+    return {
+        "commit": commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "results": results,
+    }
+
+
+def format_value(value: float, unit: str) -> str:
+    if unit == BYTES:
+        return f"{value:.0f} B/entry"
+    return f"{value * 1e6:.2f} us{unit[1:]}"
+
+
+def compare(results: dict, baseline: dict, threshold: float) -> list[str]:
+    """Keys of the results that are worse than baseline by over threshold"""
+    regressions = []
+    print(f"\nAgainst {baseline.get('commit') or 'baseline'}:")
+    for key, result in results["results"].items():
+        before = baseline["results"].get(key)
+        if before is None or not before["value"]:
+            continue
+        ratio = result["value"] / before["value"]
+        flag = ""
+        if ratio > 1 + threshold:
+            regressions.append(key)
+            flag = "  REGRESSION"
+        print(f"{key:<56}{ratio:>9.2f}x{flag}")
+    return regressions
+
+
+def main(argv: Optional[list[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("scales", nargs="*", default=SCALES)
+    parser.add_argument("--output", type=Path, help="write the results as JSON")
+    parser.add_argument("--compare", type=Path, help="results of an earlier run")
+    parser.add_argument("--threshold", type=float, default=0.2)
+    arguments = parser.parse_args(argv)
+
+    results = run([Scale.parse(scale) for scale in arguments.scales])
+    if arguments.output is not None:
+        arguments.output.write_text(json.dumps(results, indent=2) + "\n")
+    if arguments.compare is not None:
+        baseline = json.loads(arguments.compare.read_text())
+        if compare(results, baseline, arguments.threshold):
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,4 +1,13 @@
+from typing import Mapping, Optional
+
 from .entities import Account, Book
+from .money import Money
+
+ASSET = "asset"
+LIABILITY = "liability"
+EQUITY = "equity"
+INCOME = "income"
+EXPENSE = "expense"
 
 
 class ChartOfAccounts:
@@ -14,18 +23,61 @@ class ChartOfAccounts:
         "Accounts Receivable",
     ]
 
-    def __init__(self, book: Book):
+    # Salaries and Taxes hold what is owed to employees and to the tax office
+    ACCOUNT_TYPES = {
+        "Expenses": EXPENSE,
+        "Revenue": INCOME,
+        "Assets": ASSET,
+        "Liabilities": LIABILITY,
+        "Bank Account": ASSET,
+        "Salaries": LIABILITY,
+        "Taxes": LIABILITY,
+        "Accounts Payable": LIABILITY,
+        "Accounts Receivable": ASSET,
+    }
+
+    # Parent of every account that is not at the top of the tree
+    ACCOUNT_PARENTS = {
+        "Bank Account": "Assets",
+        "Accounts Receivable": "Assets",
+        "Salaries": "Liabilities",
+        "Taxes": "Liabilities",
+        "Accounts Payable": "Liabilities",
+    }
+
+    def __init__(self, book: Book, parents: Optional[Mapping[str, str]] = None):
         self.book = book
+        self.parents = self.ACCOUNT_PARENTS if parents is None else parents
+
+        self._chart = {}
+        for name in self.ACCOUNT_NAMES:
+            self._chart[name] = self.add_account(name, self.parents.get(name))
+
+    def account(self, name: str) -> Optional[Account]:
+        return self._chart.get(name) or self.book.accounts.first("name", name)
+
+    def add_account(self, name: str, parent: Optional[str] = None) -> Account:
+        """The account named name, created under parent if it does not exist
 
-        self._chart = {name: None for name in self.ACCOUNT_NAMES}
+        Parents that do not exist yet are created at the top of the tree. An
+        existing account at the top of the tree is moved under parent, one
+        that already has a parent is left where it is.
+        """
+        if parent is not None:
+            parent = self.account(parent) or self.add_account(parent)
+        account = self.account(name)
+        if account is None:
+            return Account(name=name, book=self.book, parent=parent)
+        if account.parent is None and parent is not None:
+            account.move_to(parent)
+        return account
 
-        for account in book.accounts.values():
-            if account.name in self._chart:
-                self._chart[account.name] = account
+    def children(self, name: str) -> list[Account]:
+        return list(self.account(name).children.values())
 
-        for name, account in self._chart.items():
-            if not account:
-                self._chart[name] = Account(name=name, book=book)
+    def balance(self, name: str) -> Money:
+        """Balance of an account and all the accounts under it"""
+        return self.account(name).total_balance
 
     @property
     def expenses(self) -> Account:
@@ -0,0 +1,57 @@
+from typing import TYPE_CHECKING, Optional
+from uuid import UUID
+
+from .entities import Entry, new_uuid
+from .money import Money
+
+if TYPE_CHECKING:
+    from .entities import Account, Transaction
+
+
+class CompactEntry:
+    """Slotted stand-in for Entry, see Book.use_compact_entries()
+
+    Has no instance dict and none of the pydantic bookkeeping. Its uuid is
+    drawn up front like the one of an Entry, since collections key entries
+    by it. Like other plain objects, compact entries are equal and hash by
+    identity, which keeps comparing them cheap. Use to_model() where an Entry
+    is needed; Entry.model_validate() also takes compact entries with
+    from_attributes.
+    """
+
+    __slots__ = ("amount", "account", "transaction", "uuid")
+
+    def __init__(
+        self,
+        amount: Money,
+        account: "Account",
+        transaction: Optional["Transaction"] = None,
+        uuid: Optional[UUID] = None,
+    ):
+        self.amount = amount if isinstance(amount, Money) else Money(amount)
+        self.account = account
+        self.transaction = transaction
+        self.uuid = uuid if uuid is not None else new_uuid()
+
+    @classmethod
+    def trusted(cls, **values) -> "CompactEntry":
+        """Same as calling the class, for sites that build Entry.trusted()"""
+        return cls(**values)
+
+    @classmethod
+    def from_model(cls, entry: Entry) -> "CompactEntry":
+        return cls(entry.amount, entry.account, entry.transaction, entry.uuid)
+
+    def to_model(self) -> Entry:
+        return Entry.trusted(
+            uuid=self.uuid,
+            amount=self.amount,
+            account=self.account,
+            transaction=self.transaction,
+        )
+
+    def model_dump(self, **kwargs) -> dict:
+        return self.to_model().model_dump(**kwargs)
+
+    def __repr__(self) -> str:
+        return f"CompactEntry(amount={self.amount!r}, account={self.account.name!r})"
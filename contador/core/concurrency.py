@@ -0,0 +1,229 @@
+import asyncio
+import queue
+import threading
+from concurrent.futures import Future
+from copy import copy
+from itertools import islice
+from typing import Any, Callable, Iterable, Optional, TypeVar
+
+from .index import LayeredMap
+from .manager import AccountManager
+from .money import Money
+from .reconciliation import Reconciler
+
+T = TypeVar("T")
+
+# Put on the queue to stop the writer
+_STOP = object()
+# Queued by readers that need a view of the latest batch
+_PUBLISH = object()
+
+
+class PostingQueue:
+    """Single writer for an account manager shared by threads and tasks
+
+    Operations are put on a queue and applied one at a time by a writer
+    thread, so books, collections and running totals are only ever changed
+    by that thread and need no locks. Callers wait on a future: post() from
+    threads, post_async() from asyncio tasks. Every change to the book must
+    go through the queue once it is started.
+
+    Readers never touch what the writer changes. Between two batches the
+    writer publishes a read-only view of the manager: a snapshot of the book
+    with copies of its open items and payee balances. The transactions and
+    documents of the view stop at that batch, and so do the links between
+    them when read through book.transactions_of() and book.documents_of()
+    rather than from the entities. read() runs on the latest view, and when
+    batches ran since it was published, asks the writer for a new one first,
+    so it waits for the batch under way but the writer never waits for
+    readers. A view costs one step per account, plus one per open item,
+    payee and reconciled entry changed since the view before, and is only
+    made when a reader asks for it.
+
+    Readers run side by side. Reads that fill a cache on the view, such as
+    rollups and walks of the posted collections, build it aside and set it
+    in one step, so two readers at worst both build it.
+    """
+
+    def __init__(self, manager: AccountManager, max_batch: int = 256):
+        self.manager = manager
+        self.max_batch = max_batch
+        self._queue: queue.SimpleQueue = queue.SimpleQueue()
+        # Operations applied, and the view published with the count it follows
+        self._version = 0
+        self._view: Optional[tuple[int, AccountManager]] = None
+        # Reconciled entries of the last view, with the live dict they follow
+        self._reconciled: Optional[tuple[dict, LayeredMap]] = None
+        self._thread: Optional[threading.Thread] = None
+        # Set once _STOP is queued, so that nothing is queued after it
+        self._closed = False
+        self._lock = threading.Lock()
+
+    def __enter__(self) -> "PostingQueue":
+        self.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def start(self):
+        with self._lock:
+            if self._thread is None:
+                self._closed = False
+                self._thread = threading.Thread(
+                    target=self._run, name="contador-writer", daemon=True
+                )
+                self._thread.start()
+
+    def close(self):
+        """Apply what is already queued, then stop the writer
+
+        Operations submitted once closing has begun are refused.
+        """
+        with self._lock:
+            thread = self._thread
+            if thread is None:
+                return
+            if not self._closed:
+                self._closed = True
+                self._queue.put(_STOP)
+        thread.join()
+        with self._lock:
+            if self._thread is thread:
+                self._thread = None
+
+    def _put(self, item: tuple):
+        """Queue item for the writer, unless it is stopping or stopped"""
+        with self._lock:
+            if self._thread is None:
+                raise RuntimeError("The posting queue is not started")
+            if self._closed:
+                raise RuntimeError("The posting queue is closed")
+            self._queue.put(item)
+
+    def submit(self, operation: str, *args, **kwargs) -> Future:
+        """Queue a call to a public method of the manager"""
+        if operation.startswith("_") or not callable(
+            getattr(self.manager, operation, None)
+        ):
+            raise AttributeError(f"AccountManager has no operation {operation}")
+        future = Future()
+        self._put((future, operation, args, kwargs))
+        return future
+
+    def post(self, operation: str, *args, **kwargs) -> Any:
+        """Apply an operation through the writer and return its result"""
+        return self.submit(operation, *args, **kwargs).result()
+
+    async def post_async(self, operation: str, *args, **kwargs) -> Any:
+        return await asyncio.wrap_future(self.submit(operation, *args, **kwargs))
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            while len(batch) < self.max_batch:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            published = []
+            for item in batch:
+                if item is _STOP:
+                    continue
+                if item[1] is _PUBLISH:
+                    published.append(item[0])
+                    continue
+                self._apply(*item)
+                self._version += 1
+            if published:
+                self._publish(published)
+            if any(item is _STOP for item in batch):
+                return
+
+    def _publish(self, futures: list[Future]):
+        try:
+            if self._view is None or self._view[0] != self._version:
+                self._view = self._version, self._reader_view()
+        except BaseException as error:
+            for future in futures:
+                future.set_exception(error)
+        else:
+            for future in futures:
+                future.set_result(None)
+
+    def _reader_view(self) -> AccountManager:
+        """Read-only copy of the manager, made by the writer"""
+        manager = self.manager
+        view = copy(manager)
+        view.book = book = manager.book.snapshot()
+        view.chart = chart = copy(manager.chart)
+        chart.book = book
+        chart._chart = {
+            name: book.accounts[account.uuid.hex]
+            for name, account in manager.chart._chart.items()
+        }
+        view.open_items = manager.open_items.snapshot()
+        view.payees = manager.payees.snapshot()
+        view.reconciler = Reconciler(chart.bank_account)
+        view.reconciler.reconciled = self._reconciled_view()
+        view.journal = None
+        return view
+
+    def _reconciled_view(self) -> LayeredMap:
+        """Reconciled entries, adding only the ones since the last view
+
+        Entries are only ever added to the reconciled dict, so the new ones
+        are the last ones.
+        """
+        reconciled = self.manager.reconciler.reconciled
+        if self._reconciled is None or self._reconciled[0] is not reconciled:
+            published = LayeredMap(reconciled)
+        else:
+            published = self._reconciled[1]
+            added = len(reconciled) - len(published)
+            if added:
+                new = list(islice(reversed(reconciled.items()), added))
+                published = published.changed(dict(reversed(new)))
+        self._reconciled = reconciled, published
+        return published
+
+    def _apply(self, future: Future, operation: str, args: tuple, kwargs: dict):
+        if not future.set_running_or_notify_cancel():
+            return
+        try:
+            result = getattr(self.manager, operation)(*args, **kwargs)
+        except BaseException as error:
+            future.set_exception(error)
+        else:
+            future.set_result(result)
+
+    def read(self, function: Callable[[AccountManager], T]) -> T:
+        """Result of function on a view of the manager after the latest batch
+
+        The view is read-only; operations that change it raise TypeError.
+        Before the queue is started, function runs on the manager itself.
+        While it is closing, a new view can no longer be asked for.
+        """
+        if self._thread is None:
+            return function(self.manager)
+        view = self._view
+        if view is None or view[0] != self._version:
+            future = Future()
+            self._put((future, _PUBLISH, (), {}))
+            future.result()
+            view = self._view
+        return function(view[1])
+
+    def balances(self, names: Optional[Iterable[str]] = None) -> dict[str, Money]:
+        """Balance of every account, or of the named ones, at the same point"""
+
+        def read(manager: AccountManager) -> dict[str, Money]:
+            accounts = manager.book.accounts
+            if names is None:
+                selected = list(accounts.values())
+            else:
+                selected = [accounts.first("name", name) for name in names]
+            return {account.name: account.balance for account in selected}
+
+        return self.read(read)
@@ -0,0 +1,138 @@
+import os
+from concurrent.futures import Executor, ProcessPoolExecutor
+from datetime import datetime
+from itertools import islice
+from typing import Iterable, Iterator, Optional, Protocol, Union
+from uuid import UUID, uuid5
+
+from pydantic import BaseModel
+
+from .accounting import ChartOfAccounts
+from .entities import Book
+from .index import as_datetime
+from .money import Money
+from .reports import AccountTotal, ReportEngine, TrialBalance
+
+# Consolidated lines get uuids derived from the account name under this one
+CONSOLIDATED = UUID("5f0c4c3e-8d52-4d2e-9a39-7c0b1b6d2a61")
+
+# Account name to its type and total, the only thing a worker sends back
+Partial = dict[str, tuple[Optional[str], Money]]
+
+
+class BookSource(Protocol):
+    """Loads a book inside a worker process; must be picklable"""
+
+    def load(self) -> Book: ...
+
+
+class BinaryFile(BaseModel):
+    """A book written by storage.binary.dump()"""
+
+    path: str
+
+    def load(self) -> Book:
+        from ..storage.binary import load
+
+        with open(self.path, "rb") as file:
+            return load(file, columnar=True)
+
+
+class SQLiteBook(BaseModel):
+    """A book saved in an SQLite database"""
+
+    path: str
+    uuid: UUID
+
+    def load(self) -> Book:
+        from ..storage.sqlite import SQLiteStore
+
+        return SQLiteStore(self.path).load(self.uuid)
+
+
+def partial(book: Book, as_of: Optional[datetime] = None) -> Partial:
+    """Total of every account of book by name, as of a date"""
+    result = {}
+    for total in ReportEngine(book).account_totals(as_of):
+        _, balance = result.get(total.name, (None, Money(0)))
+        result[total.name] = (total.type_, balance + total.balance)
+    return result
+
+
+def merge(into: Partial, other: Partial) -> Partial:
+    for name, (type_, balance) in other.items():
+        known, total = into.get(name, (None, Money(0)))
+        into[name] = (known or type_, total + balance)
+    return into
+
+
+def _shard(sources: list[Union[BookSource, Book]], as_of: Optional[datetime]):
+    """Merged partial of a shard of books, run in a worker"""
+    result = {}
+    for source in sources:
+        book = source if isinstance(source, Book) else source.load()
+        merge(result, partial(book, as_of))
+    return result
+
+
+def _shards(sources: list, size: int) -> Iterator[list]:
+    iterator = iter(sources)
+    while shard := list(islice(iterator, size)):
+        yield shard
+
+
+def _position(name: str) -> tuple[int, str]:
+    names = ChartOfAccounts.ACCOUNT_NAMES
+    return (names.index(name) if name in names else len(names), name)
+
+
+def consolidate(
+    sources: Iterable[Union[BookSource, Book]],
+    as_of: Optional[datetime.date] = None,
+    max_workers: Optional[int] = None,
+    shard_size: Optional[int] = None,
+    executor: Optional[Executor] = None,
+) -> TrialBalance:
+    """Combined trial balance of many books, matching accounts by name
+
+    Book sources are sharded across a process pool, or the given executor.
+    Every worker loads the books of its shard itself and sends back only
+    the merged totals by account name, which are merged again here. Books
+    that are already in memory are added up in this process instead, since
+    shipping them to a worker would cost more than reading their totals.
+    With max_workers=0 everything runs in this process.
+
+    Lines follow the order of ChartOfAccounts.ACCOUNT_NAMES, then the other
+    names in alphabetical order.
+    """
+    as_of = as_datetime(as_of, end_of_day=True) if as_of else None
+    books, remote = [], []
+    for source in sources:
+        (books if isinstance(source, Book) else remote).append(source)
+
+    result = _shard(books, as_of)
+    if max_workers == 0:
+        merge(result, _shard(remote, as_of))
+    elif remote:
+        workers = max_workers or os.cpu_count() or 1
+        # A few shards per worker keep them all busy when books differ in size
+        size = shard_size or max(1, -(-len(remote) // (workers * 4)))
+        shards = list(_shards(remote, size))
+        pool = executor or ProcessPoolExecutor(min(workers, len(shards)))
+        try:
+            futures = [pool.submit(_shard, shard, as_of) for shard in shards]
+            for future in futures:
+                merge(result, future.result())
+        finally:
+            if executor is None:
+                pool.shutdown()
+
+    lines = [
+        AccountTotal(
+            uuid=uuid5(CONSOLIDATED, name), name=name, type_=type_, balance=balance
+        )
+        for name, (type_, balance) in sorted(
+            result.items(), key=lambda item: _position(item[0])
+        )
+    ]
+    return TrialBalance(as_of=as_of, lines=lines)
@@ -1,80 +1,605 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
 from datetime import datetime
-from decimal import Decimal, getcontext
-from typing import Annotated, Dict, Generic, Iterable, Optional, TypeVar
-from uuid import UUID, uuid4
-
-from pydantic import BaseModel, Field
+from functools import cache, partial
+from itertools import count, islice
+from sys import intern
+from typing import (
+    TYPE_CHECKING,
+    Annotated,
+    Any,
+    Callable,
+    ClassVar,
+    Dict,
+    Generic,
+    Hashable,
+    Iterable,
+    Iterator,
+    Mapping,
+    Optional,
+    TypeVar,
+)
+from uuid import UUID, uuid4, uuid5
+
+from pydantic import AfterValidator, BaseModel, Field
 from pydantic_core import core_schema
 
-getcontext().prec = 4
+from . import instrumentation
+from .index import DateIndex, Rollup
+from .instrumentation import hooks, instrumented
+from .money import Money
+
+if TYPE_CHECKING:
+    from .ledger import ColumnarLedger
+    from .posting import UnitOfWork
+    from .query import Query
+    from .snapshot import BookSnapshot
+
+
+_uuids: ContextVar[Optional[Iterator[UUID]]] = ContextVar("uuids", default=None)
+
+
+def new_uuid() -> UUID:
+    """A random uuid, or the next derived one inside derived_uuids()"""
+    uuids = _uuids.get()
+    if uuids is not None:
+        return next(uuids)
+    return uuid4()
+
+
+def new_uuids(count: int) -> list[UUID]:
+    """The next count uuids new_uuid() would give, drawn at once"""
+    uuids = _uuids.get()
+    if uuids is not None:
+        return list(islice(uuids, count))
+    return [uuid4() for _ in range(count)]
+
+
+@contextmanager
+def derived_uuids(seed: UUID) -> Iterator[None]:
+    """Give the entities created inside the block uuids derived from seed
+
+    The same seed yields the same sequence of uuids, so replaying a journaled
+    operation rebuilds entities that are identical to the original ones.
+    """
+    token = _uuids.set(uuid5(seed, str(position)) for position in count())
+    try:
+        yield
+    finally:
+        _uuids.reset(token)
 
 
 class Entity(BaseModel):
-    uuid: UUID = Field(..., default_factory=uuid4)
+    uuid: UUID = Field(..., default_factory=new_uuid)
+
+    @instrumented
+    def __init__(self, **data):
+        # Times model validation on its own, apart from what subclasses do next
+        super().__init__(**data)
+
+    @classmethod
+    def trusted(cls, **values):
+        """Build an entity from values that are known to be valid
+
+        Skips validation and __init__, so the entity is not registered
+        anywhere. Meant for bulk paths that already validated their input.
+        """
+        return trusted_model(cls, values)
+
+
+ModelType = TypeVar("ModelType", bound=BaseModel)
+
+# Slots of every pydantic 2 model, which trusted_model() fills in itself
+MODEL_SLOTS = (
+    "__dict__",
+    "__pydantic_fields_set__",
+    "__pydantic_extra__",
+    "__pydantic_private__",
+)
+_new = object.__new__
+_set = object.__setattr__
+
+
+def trusted_model(cls: type[ModelType], values: dict[str, Any]) -> ModelType:
+    """A model of cls holding values, built without validation
+
+    Fields left out take their default, and Interned fields are interned as
+    validation would. model_construct() does the same but inspects the
+    signature of every default factory on each call, which made bulk
+    posting slower than posting one invoice at a time. Filling in the
+    MODEL_SLOTS of the instance directly relies on the layout of pydantic 2
+    models, which pyproject.toml pins; test_trusted_model checks that it
+    still matches model_construct().
+    """
+    defaults, factories, private, interned = _trusted_template(cls)
+    data = {**defaults, **values}
+    for name, factory in factories:
+        if name not in values:
+            data[name] = factory()
+    for name in interned:
+        if name in values:
+            data[name] = intern(data[name])
+
+    model = _new(cls)
+    _set(model, "__dict__", data)
+    _set(model, "__pydantic_fields_set__", set(values))
+    _set(model, "__pydantic_extra__", None)
+    if private:
+        private = {
+            name: default if factory is None else factory()
+            for name, default, factory in private
+        }
+    _set(model, "__pydantic_private__", private or None)
+    return model
+
+
+@cache
+def _trusted_template(cls: type[BaseModel]):
+    defaults = {}
+    factories = []
+    for name, field in cls.model_fields.items():
+        if field.default_factory is not None:
+            defaults[name] = None
+            factories.append((name, field.default_factory))
+        else:
+            defaults[name] = field.default
+    # Plain private defaults are immutable here, so they can be shared
+    private = [
+        (name, attribute.default, attribute.default_factory)
+        for name, attribute in cls.__private_attributes__.items()
+    ]
+    # Interned fields, which validation would intern
+    interned = tuple(
+        name
+        for name, field in cls.model_fields.items()
+        if any(getattr(item, "func", None) is intern for item in field.metadata)
+    )
+    return defaults, tuple(factories), private, interned
 
 
 EntityType = TypeVar("EntityType", bound=Entity)
 
 
+def index_key(value: Any) -> Hashable:
+    """Entities are indexed by their uuid, anything else by its own value"""
+    return value.uuid if isinstance(value, Entity) else value
+
+
+def day(value: Any) -> Hashable:
+    """Index key for datetimes that only keeps the day"""
+    return value.date() if isinstance(value, datetime) else value
+
+
 class CollectionType(Dict[str, EntityType], Generic[EntityType]):
+    """Entities keyed by their uuid hex, with optional secondary indexes
+
+    Each index is named after an attribute of the entities and maps a key,
+    built from the attribute value by the index function, to the entities
+    holding it. Indexes follow additions and removals; call reindex() after
+    changing an indexed attribute of an entity already in the collection.
+    """
+
+    # Shared by collections without indexes, and by any collection until
+    # __init__ runs, e.g. while unpickling
+    _indexes: Mapping[str, tuple[Callable, dict]] = {}
+
+    def __init__(self, *args, indexes: Mapping[str, Callable] = None, **kwargs):
+        if args or kwargs:
+            super().__init__(*args, **kwargs)
+        if not indexes:
+            return
+        self._indexes: dict[str, tuple[Callable, dict]] = {
+            name: (function, {}) for name, function in indexes.items()
+        }
+        self._keys: dict[str, dict[str, Hashable]] = {
+            name: {} for name in self._indexes
+        }
+        for key, entity in super().items():
+            self._index(key, entity)
+
+    @property
+    def indexes(self) -> dict[str, Callable]:
+        """Index functions of the collection, by attribute name"""
+        return {name: function for name, (function, _) in self._indexes.items()}
+
+    def _index(self, key: str, entity: EntityType):
+        for name, (function, index) in self._indexes.items():
+            value = function(getattr(entity, name, None))
+            index.setdefault(value, {})[key] = entity
+            self._keys[name][key] = value
+
+    def _unindex(self, key: str):
+        for name, (_, index) in self._indexes.items():
+            value = self._keys[name].pop(key, None)
+            bucket = index.get(value)
+            if bucket is not None:
+                bucket.pop(key, None)
+                if not bucket:
+                    del index[value]
+
+    def __setitem__(self, key: str, entity: EntityType):
+        if self._indexes:
+            if super().__contains__(key):
+                self._unindex(key)
+            self._index(key, entity)
+        super().__setitem__(key, entity)
+
+    def __delitem__(self, key: str):
+        super().__delitem__(key)
+        if self._indexes:
+            self._unindex(key)
+
+    def pop(self, key: str, *default):
+        if self._indexes and super().__contains__(key):
+            self._unindex(key)
+        return super().pop(key, *default)
+
+    def popitem(self) -> tuple[str, EntityType]:
+        key, entity = super().popitem()
+        if self._indexes:
+            self._unindex(key)
+        return key, entity
+
+    def clear(self):
+        super().clear()
+        for name, (_, index) in self._indexes.items():
+            index.clear()
+            self._keys[name].clear()
+
+    def update(self, *args, **kwargs):
+        if not self._indexes:
+            super().update(*args, **kwargs)
+            return
+        entities = dict(*args, **kwargs)
+        if not self.keys().isdisjoint(entities):
+            for key, entity in entities.items():
+                self[key] = entity
+            return
+
+        # All new, so each index is extended in one pass
+        super().update(entities)
+        for name, (function, index) in self._indexes.items():
+            keys = self._keys[name]
+            for key, entity in entities.items():
+                value = keys[key] = function(getattr(entity, name, None))
+                bucket = index.get(value)
+                if bucket is None:
+                    bucket = index[value] = {}
+                bucket[key] = entity
+
+    def setdefault(self, key: str, default: EntityType = None) -> EntityType:
+        if key not in self:
+            self[key] = default
+        return self[key]
+
     def add(self, entity: EntityType):
         self[entity.uuid.hex] = entity
 
+    def remove(self, entity: EntityType):
+        del self[entity.uuid.hex]
+
+    def reindex(self, entity: EntityType):
+        self[entity.uuid.hex] = entity
+
+    def by(self, name: str, value: Any) -> list[EntityType]:
+        """Entities whose indexed attribute matches value"""
+        function, index = self._indexes[name]
+        return list(index.get(function(value), {}).values())
+
+    def first(self, name: str, value: Any) -> Optional[EntityType]:
+        function, index = self._indexes[name]
+        return next(iter(index.get(function(value), {}).values()), None)
+
     @classmethod
     def __get_pydantic_core_schema__(cls, source_type, handler):
         return core_schema.no_info_after_validator_function(cls, handler(dict))
 
 
+# Strings repeated across many entities, kept once in memory
+Interned = Annotated[str, AfterValidator(intern)]
+
 Collection = Annotated[
     CollectionType[EntityType],
     Field(default_factory=CollectionType, exclude=True, repr=False),
 ]
 
 
+def indexed_by(*names: str, **functions: Callable):
+    """Field of a collection with secondary indexes on the given attributes
+
+    Collections given to the model are validated into one with the same
+    indexes as the default.
+    """
+    indexes = {name: index_key for name in names}
+    indexes.update(functions)
+    field = Field(
+        default_factory=partial(CollectionType, indexes=indexes),
+        exclude=True,
+        repr=False,
+    )
+    field.metadata.append(
+        AfterValidator(lambda value: CollectionType(value, indexes=indexes))
+    )
+    return field
+
+
 class Payee(Entity):
     name: str
 
 
 class Entry(Entity):
-    amount: Decimal
+    amount: Money
     account: "Account"
     transaction: Optional["Transaction"] = None
 
 
+class AccountState:
+    """Running totals and date index of an account, moved by every posting
+
+    Kept in the instance dict of the account rather than in private
+    attributes of the model, which are read through BaseModel.__getattr__
+    and cost microseconds on every access. The totals are plain integers of
+    minor units at a scale shared by both, widened when an amount with more
+    decimal places comes in.
+    """
+
+    __slots__ = ("entries_units", "descendants_units", "scale", "date_index", "rollup")
+
+    def __init__(self):
+        self.entries_units = 0
+        # Balance of all the descendants, moved by every posting below the account
+        self.descendants_units = 0
+        self.scale = Money.DEFAULT_SCALE
+        self.date_index = DateIndex()
+        # Built on first use, then kept up by every dated posting
+        self.rollup: Optional[Rollup] = None
+
+    def units(self, amount: Money) -> int:
+        """The amount in units of the totals, widening them first if needed"""
+        if amount.scale > self.scale:
+            factor = 10 ** (amount.scale - self.scale)
+            self.entries_units *= factor
+            self.descendants_units *= factor
+            self.scale = amount.scale
+        return amount.units_at(self.scale)
+
+    @property
+    def entries_total(self) -> Money:
+        return Money.from_units(self.entries_units, self.scale)
+
+    @entries_total.setter
+    def entries_total(self, total: Money):
+        self.entries_units = self.units(total)
+
+    @property
+    def descendants_total(self) -> Money:
+        return Money.from_units(self.descendants_units, self.scale)
+
+    @descendants_total.setter
+    def descendants_total(self, total: Money):
+        self.descendants_units = self.units(total)
+
+
 class Account(Entity):
     name: str
-    initial_balance: Decimal = Decimal(0.0)
+    initial_balance: Money = Money(0)
     book: Optional["Book"] = None
+    parent: Optional["Account"] = Field(default=None, exclude=True, repr=False)
     entries: Collection["Entry"]
+    children: Collection["Account"]
+
+    # Recompute the balance from the entries on every access and raise on drift
+    verify_balances: ClassVar[bool] = False
+
+    # The AccountState of the account is _state, set when it is built
 
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
+        self.__dict__["_state"] = AccountState()
+        self._state.entries_total = self._sum_entries()
+        for entry in self.entries.values():
+            if entry.transaction:
+                self._index_entry(entry)
         if self.book:
             self.book.add_account(self)
+        parent, self.parent = self.parent, None
+        if parent is not None:
+            self.move_to(parent)
+
+    @classmethod
+    def trusted(cls, **values) -> "Account":
+        account = super().trusted(**values)
+        account.__dict__["_state"] = AccountState()
+        return account
+
+    def __setattr__(self, name: str, value: Any):
+        if name != "initial_balance":
+            super().__setattr__(name, value)
+            return
+
+        # Already part of the cached balance of every ancestor
+        if not isinstance(value, Money):
+            value = Money(value)
+        previous = self.initial_balance
+        super().__setattr__(name, value)
+        if self.parent is not None:
+            self.parent._push(value - previous)
+        if self.book is not None:
+            self.book._state.version += 1
+
+    @property
+    def _ledger(self) -> Optional["ColumnarLedger"]:
+        book = self.book
+        return book._state.ledger if book is not None else None
+
+    def iter_entries(self) -> Iterator["Entry"]:
+        """Entries of the account, including the ones held by the book ledger"""
+        yield from self.entries.values()
+        if self._ledger is not None:
+            yield from self._ledger.entries(account=self)
+
+    def _sum_entries(self) -> Money:
+        total = Money.sum(entry.amount for entry in self.entries.values())
+        if self._ledger is not None:
+            total += self._ledger.account_total(self)
+        return total
+
+    @property
+    def balance(self) -> Money:
+        if self.verify_balances:
+            self.verify_balance()
+        return self.initial_balance + self._state.entries_total
 
     @property
-    def balance(self) -> Decimal:
-        return self.initial_balance + sum(
-            [entry.amount for entry in self.entries.values()]
-        )
+    def total_balance(self) -> Money:
+        """Balance of the account and all its descendants"""
+        return self.balance + self._state.descendants_total
+
+    def ancestors(self) -> Iterator["Account"]:
+        account = self.parent
+        while account is not None:
+            yield account
+            account = account.parent
+
+    def move_to(self, parent: Optional["Account"]):
+        """Make the account a child of parent, or a root account with None"""
+        lineage = [parent, *parent.ancestors()] if parent is not None else []
+        if any(account is self for account in lineage):
+            raise ValueError(f"Account {self.name} cannot be its own ancestor")
+        total = self.total_balance
+        if self.parent is not None:
+            self.parent.children.pop(self.uuid.hex, None)
+            self.parent._push(-total)
+        self.parent = parent
+        if parent is not None:
+            parent.children.add(self)
+            parent._push(total)
+
+    def _push(self, amount: Money):
+        account = self
+        while account is not None:
+            state = account._state
+            # Widened before the total is read
+            units = state.units(amount)
+            state.descendants_units += units
+            account = account.parent
+
+    def verify_balance(self, fix: bool = False) -> Money:
+        """Recompute the running totals and compare them with the kept ones
+
+        The entries total is recomputed from the entries, the descendants
+        total from the total balance of the children. Returns the drift found
+        in the total balance. Raises ValueError on drift unless fix is set, in
+        which case the running totals are reset to the recomputed ones.
+        """
+        state = self._state
+        total = self._sum_entries()
+        drift = total - state.entries_total
+        descendants = Money.sum(child.total_balance for child in self.children.values())
+        descendants_drift = descendants - state.descendants_total
+        if drift or descendants_drift:
+            if not fix:
+                raise ValueError(
+                    f"Balance drift of {drift} and descendants drift of "
+                    f"{descendants_drift} on account {self.name}"
+                )
+            state.entries_total = total
+            state.descendants_total = descendants
+            if self.parent is not None:
+                self.parent._push(drift + descendants_drift)
+            if self.book is not None:
+                self.book._state.version += 1
+        return drift + descendants_drift
+
+    def balance_as_of(self, date: datetime.date) -> Money:
+        """Balance including the entries dated up to and including date
+
+        Entries that are not part of a transaction have no date and are left out.
+        """
+        if self._ledger is not None:
+            return self.initial_balance + self._ledger.account_total_between(
+                self, None, date
+            )
+        return self.initial_balance + self._state.date_index.total_until(date)
+
+    def balance_between(self, start: datetime.date, end: datetime.date) -> Money:
+        """Net movement of the entries dated between start and end, inclusive"""
+        if self._ledger is not None:
+            return self._ledger.account_total_between(self, start, end)
+        return self._state.date_index.total_between(start, end)
 
-    def add_entry(self, amount: Decimal) -> Entry:
-        entry = Entry(amount=amount, account=self)
+    @property
+    def rollup(self) -> Rollup:
+        """Totals of the dated entries by day, month and quarter"""
+        state = self._state
+        if state.rollup is None:
+            rollup = Rollup()
+            for date, amount in state.date_index.amounts():
+                rollup.add(date, amount)
+            if self._ledger is not None:
+                for date, amount in self._ledger.daily_totals(self).items():
+                    rollup.add(date, amount)
+            state.rollup = rollup
+        return state.rollup
+
+    def _roll_up(self, date: datetime, amount: Money):
+        rollup = self._state.rollup
+        if rollup is not None:
+            rollup.add(date, amount)
+
+    def _apply_amount(self, amount: Money):
+        """Move the running totals; callers bump the book version once"""
+        state = self._state
+        if amount.scale == state.scale:
+            state.entries_units += amount.units
+        else:
+            units = state.units(amount)
+            state.entries_units += units
+        if self.parent is not None:
+            self.parent._push(amount)
+
+    def _apply_entry(self, entry: "Entry"):
         self.entries.add(entry)
+        self._apply_amount(entry.amount)
+        if hooks:
+            instrumentation.entries(1)
+
+    def _index_entry(self, entry: "Entry"):
+        ledger = self._ledger
+        if ledger is not None:
+            # The ledger takes over the entry once it is dated
+            ledger.append(self, entry.transaction, entry.amount)
+            self.entries.pop(entry.uuid.hex, None)
+        else:
+            self._state.date_index.add(entry.transaction.date, entry, entry.amount)
+        self._roll_up(entry.transaction.date, entry.amount)
+
+    def add_entry(self, amount: Money) -> Entry:
+        book = self.book
+        state = book._state if book is not None else None
+        entry_type = state.entry_type if state is not None else Entry
+        entry = entry_type(amount=amount, account=self)
+        unit_of_work = state.unit_of_work if state is not None else None
+        if unit_of_work is not None:
+            unit_of_work.add_entry(entry)
+        else:
+            self._apply_entry(entry)
+            if state is not None:
+                state.version += 1
         return entry
 
-    def credit(self, amount: Decimal) -> Entry:
+    def credit(self, amount: Money) -> Entry:
         """Take money out of the account"""
         return self.add_entry(-1 * amount)
 
-    def debit(self, amount: Decimal) -> Entry:
+    def debit(self, amount: Money) -> Entry:
         """Put money into the account"""
         return self.add_entry(amount)
 
 
 class Transaction(Entity):
     date: datetime
-    description: str
+    description: Interned
     book: Optional["Book"] = None
     entries: Collection["Entry"]
     documents: Collection["Document"]
@@ -84,40 +609,260 @@ class Transaction(Entity):
         if self.book:
             self.book.add_transaction(self)
 
+    @property
+    def _ledger(self) -> Optional["ColumnarLedger"]:
+        return self.book.ledger if self.book else None
+
+    def iter_entries(self) -> Iterator["Entry"]:
+        """Entries of the transaction, including the ones held by the book ledger"""
+        yield from self.entries.values()
+        if self._ledger is not None:
+            yield from self._ledger.entries(transaction=self)
+
+    @instrumented
     def validate_entries(self):
-        total = sum([entry.amount for entry in self.entries.values()])
+        total = Money.sum(entry.amount for entry in self.entries.values())
+        if self._ledger is not None:
+            total += self._ledger.transaction_total(self)
         if total != 0:
             raise ValueError("Entries are unbalanced")
 
     def add_entries(self, entries: Iterable[Entry]):
+        unit_of_work = self.book.active_unit_of_work if self.book else None
+        if unit_of_work is not None:
+            # Validated once when the unit of work commits
+            unit_of_work.add_entries(self, entries)
+            return
+
+        ledger = self._ledger
         for entry in entries:
-            self.entries.add(entry)
+            if ledger is None:
+                self.entries.add(entry)
             entry.transaction = self
+            entry.account._index_entry(entry)
         self.validate_entries()
 
+    def add_document(self, document: "Document"):
+        """Link a document and the transaction both ways"""
+        unit_of_work = self.book.active_unit_of_work if self.book else None
+        if unit_of_work is not None:
+            unit_of_work.link(self, document)
+            return
+
+        self.documents.add(document)
+        document.transactions.add(self)
+
 
 class Document(Entity):
     date: datetime
     number: str
-    type_: str
-    amount: Decimal
-    tax_amount: Decimal = Decimal(0.0)
+    type_: Interned
+    amount: Money
+    tax_amount: Money = Money(0)
     payee: Optional[Payee] = None
     location: Optional[str] = None
     book: "Book"
     transactions: Collection[Transaction]
 
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.book.add_document(self)
+
+
+class BookState:
+    """Ledger, unit of work and version of a book, see AccountState"""
+
+    __slots__ = ("ledger", "unit_of_work", "version", "entry_type", "posted")
+
+    def __init__(self):
+        self.ledger: Optional["ColumnarLedger"] = None
+        self.unit_of_work: Optional["UnitOfWork"] = None
+        # Bumped by every change to the accounts, transactions and documents
+        self.version = 0
+        # Class of the entries made for the book, see use_compact_entries()
+        self.entry_type: type = Entry
+        # Posting order of the transactions and documents by uuid, see snapshot()
+        self.posted: dict[UUID, int] = {}
+
+    def post(self, entities: Iterable[Entity]):
+        """Number entities after the ones posted so far"""
+        posted = self.posted
+        for entity in entities:
+            posted.setdefault(entity.uuid, len(posted))
+
 
 class Book(Entity):
     name: str
     period: str
-    accounts: Collection[Account]
-    transactions: Collection[Transaction]
+    accounts: Annotated[CollectionType[Account], indexed_by("name")]
+    transactions: Annotated[CollectionType[Transaction], indexed_by(date=day)]
+    documents: Annotated[
+        CollectionType[Document], indexed_by("number", "type_", "payee", date=day)
+    ]
+
+    # The BookState of the book is _state, set when it is built
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.__dict__["_state"] = BookState()
+
+    @classmethod
+    def trusted(cls, **values) -> "Book":
+        book = super().trusted(**values)
+        book.__dict__["_state"] = BookState()
+        return book
+
+    @property
+    def version(self) -> int:
+        return self._state.version
+
+    def snapshot(self) -> "BookSnapshot":
+        """Read-only view of the book as it is now, for long running reports
+
+        Costs one step per account whatever the number of entries: the date
+        indexes and the columnar ledger only grow at the end, so the view
+        shares them and stops at their current length. Transactions and
+        documents are numbered as they are posted, and the view leaves out
+        the ones numbered after it, also from the links between them read
+        through transactions_of() and documents_of(). The view keeps the
+        version of the book it was taken at. Take it between postings, e.g.
+        through PostingQueue.read().
+        """
+        from .snapshot import snapshot
+
+        return snapshot(self)
+
+    @property
+    def ledger(self) -> Optional["ColumnarLedger"]:
+        return self._state.ledger
+
+    @property
+    def entry_type(self) -> type:
+        return self._state.entry_type
+
+    @property
+    def active_unit_of_work(self) -> Optional["UnitOfWork"]:
+        return self._state.unit_of_work
+
+    @contextmanager
+    def unit_of_work(self) -> Iterator["UnitOfWork"]:
+        """Buffer postings and apply them together when the block exits
+
+        Nested blocks join the outermost one. If the block raises, everything
+        buffered is discarded and the book is left untouched.
+        """
+        if self._state.unit_of_work is not None:
+            yield self._state.unit_of_work
+            return
+
+        from .posting import UnitOfWork
+
+        unit_of_work = UnitOfWork(self)
+        self._state.unit_of_work = unit_of_work
+        try:
+            yield unit_of_work
+        finally:
+            self._state.unit_of_work = None
+        unit_of_work.commit()
+
+    def use_ledger(self, ledger: "ColumnarLedger") -> "ColumnarLedger":
+        """Hand the dated entries of the book over to a ledger
+
+        Any object with the interface of ColumnarLedger will do, such as the
+        SQLite ledger of contador.storage.
+        """
+        if self.transactions:
+            raise ValueError("The ledger must be chosen before posting transactions")
+        self._state.ledger = ledger
+        return ledger
+
+    def use_compact_entries(self):
+        """Make entries as slotted CompactEntry objects instead of Entry models
+
+        For books that keep many entries as objects, see
+        contador.core.compact. Must be chosen before posting transactions.
+        """
+        if self.transactions:
+            raise ValueError(
+                "The entry type must be chosen before posting transactions"
+            )
+
+        from .compact import CompactEntry
+
+        self._state.entry_type = CompactEntry
+
+    def use_columnar_ledger(self, scale: int = 2) -> "ColumnarLedger":
+        """Store the entries of the book column-wise instead of as Entry objects"""
+        from .ledger import ColumnarLedger
+
+        return self.use_ledger(ColumnarLedger(scale=scale))
+
+    def close_period(self, period: str) -> "Book":
+        """Open the book of the next period, with the accounts at their balance
+
+        The accounts keep their uuid, name and parent, and their closing balance,
+        read from the running totals, becomes their initial balance. Nothing
+        else is carried over, so the new book starts without entries; a
+        columnar ledger is replaced by an empty one of the same scale.
+        """
+        if self._state.unit_of_work is not None:
+            raise ValueError("Cannot close a period inside a unit of work")
+
+        from .ledger import ColumnarLedger
+
+        book = Book(name=self.name, period=period)
+        book._state.entry_type = self._state.entry_type
+        if isinstance(self.ledger, ColumnarLedger):
+            book.use_columnar_ledger(scale=self.ledger.scale)
+        for account in self.accounts.values():
+            Account(
+                uuid=account.uuid,
+                name=account.name,
+                initial_balance=account.balance,
+                book=book,
+            )
+        for account in self.accounts.values():
+            if account.parent is not None:
+                book.accounts[account.uuid.hex].move_to(
+                    book.accounts[account.parent.uuid.hex]
+                )
+        return book
+
+    def transactions_of(self, document: Document) -> CollectionType[Transaction]:
+        """Transactions linked to document, as far as the book has seen them"""
+        return document.transactions
+
+    def documents_of(self, transaction: Transaction) -> CollectionType[Document]:
+        """Documents linked to transaction, as far as the book has seen them"""
+        return transaction.documents
+
+    def query(self) -> "Query":
+        """A lazy query over the dated entries of the book"""
+        from .query import Query
+
+        return Query(self)
 
     def add_account(self, account: Account):
         self.accounts.add(account)
         account.book = self
+        self._state.version += 1
+
+    def add_document(self, document: Document):
+        document.book = self
+        state = self._state
+        state.version += 1
+        if state.unit_of_work is not None:
+            state.unit_of_work.add_document(document)
+        else:
+            self.documents.add(document)
+            state.post((document,))
 
     def add_transaction(self, transaction: Transaction):
-        self.transactions.add(transaction)
         transaction.book = self
+        state = self._state
+        state.version += 1
+        if state.unit_of_work is not None:
+            state.unit_of_work.add_transaction(transaction)
+        else:
+            self.transactions.add(transaction)
+            state.post((transaction,))
@@ -0,0 +1,325 @@
+import csv
+import json
+import time
+from collections import OrderedDict
+from datetime import datetime
+from itertools import islice
+from pathlib import Path
+from typing import Any, Callable, Hashable, Iterable, Iterator, Optional, Union
+
+from pydantic import BaseModel, ValidationError
+
+from .entities import Account, Payee, Transaction
+from .manager import AccountManager, ExpenseInvoiceRow, SalaryRow, SaleInvoiceRow
+from .money import Money
+
+# A row of the source file with its line number
+Record = tuple[int, dict]
+
+
+class BankStatementRow(BaseModel):
+    date: datetime
+    amount: Money
+    # Number of the invoice the movement pays
+    reference: str
+    description: str = ""
+
+
+class Rejection(BaseModel):
+    line: int
+    row: dict
+    reason: str
+
+
+class ImportReport(BaseModel):
+    read: int = 0
+    posted: int = 0
+    duplicates: int = 0
+    rejected: int = 0
+    # Only the first rejections are kept, the count covers all of them
+    rejections: list[Rejection] = []
+    seconds: float = 0.0
+
+    @property
+    def rate(self) -> float:
+        """Rows read per second"""
+        return self.read / self.seconds if self.seconds else 0.0
+
+
+def read_csv(file: Iterable[str]) -> Iterator[Record]:
+    for line, row in enumerate(csv.DictReader(file), start=2):
+        yield line, row
+
+
+class Unreadable(dict):
+    """Row of a line that is not a JSON object, holding the text of the line"""
+
+    def __init__(self, text: str, reason: str):
+        super().__init__(text=text)
+        self.reason = reason
+
+
+def read_jsonl(file: Iterable[str]) -> Iterator[Record]:
+    """Records of the JSON lines of file
+
+    Lines that are not a JSON object are given as Unreadable rows, which the
+    importer rejects, so that one bad line does not stop the others.
+    """
+    for line, text in enumerate(file, start=1):
+        if not text.strip():
+            continue
+        try:
+            row = json.loads(text)
+        except ValueError as error:
+            yield line, Unreadable(text.rstrip("\r\n"), f"Invalid JSON: {error}")
+            continue
+        if not isinstance(row, dict):
+            row = Unreadable(text.rstrip("\r\n"), "Not a JSON object")
+        yield line, row
+
+
+def read_file(path: Union[str, Path]) -> Iterator[Record]:
+    """Records of a .csv or .jsonl file, read one line at a time"""
+    path = Path(path)
+    reader = read_jsonl if path.suffix in (".jsonl", ".ndjson") else read_csv
+    with open(path, newline="", encoding="utf-8") as file:
+        yield from reader(file)
+
+
+class ImportKind:
+    """How rows of one kind are validated, keyed for deduplication and posted"""
+
+    def __init__(
+        self,
+        model: type[BaseModel],
+        key: Callable[[BaseModel], Hashable],
+        post: Callable[[AccountManager, list[BaseModel]], Any],
+        exists: Optional[Callable[[AccountManager, BaseModel], bool]] = None,
+    ):
+        self.model = model
+        self.key = key
+        self.post = post
+        self.exists = exists
+
+
+def _payee_name(payee: Optional[Payee]) -> Optional[str]:
+    return payee.name if payee else None
+
+
+def _invoice_exists(type_: str):
+    def exists(manager: AccountManager, row: BaseModel) -> bool:
+        name = _payee_name(row.payee)
+        return any(
+            document.type_ == type_ and _payee_name(document.payee) == name
+            for document in manager.book.documents.by("number", row.number)
+        )
+
+    return exists
+
+
+def _posted(
+    manager: AccountManager,
+    date: datetime,
+    account: Account,
+    amount: Money,
+    matches: Callable[[Transaction], bool],
+) -> bool:
+    """Whether a matching transaction on date moves account by amount"""
+    return any(
+        transaction.date == date
+        and matches(transaction)
+        and any(
+            entry.account is account and entry.amount == amount
+            for entry in transaction.iter_entries()
+        )
+        for transaction in manager.book.transactions.by("date", date)
+    )
+
+
+def _salary_exists(manager: AccountManager, row: SalaryRow) -> bool:
+    description = f"Salary for {row.payee.name}"
+    return _posted(
+        manager,
+        row.date,
+        manager.chart.salaries,
+        -row.amount,
+        lambda transaction: transaction.description == description,
+    )
+
+
+def _payment_exists(manager: AccountManager, row: BankStatementRow) -> bool:
+    return _posted(
+        manager,
+        row.date,
+        manager.chart.bank_account,
+        row.amount,
+        lambda transaction: any(
+            document.number == row.reference
+            for document in transaction.documents.values()
+        ),
+    )
+
+
+def _post_bank_rows(manager: AccountManager, rows: list[BankStatementRow]):
+    for row in rows:
+        # Money in settles sale invoices, money out expense invoices
+        type_ = "sale invoice" if row.amount > 0 else "expense invoice"
+        invoices = [
+            document
+            for document in manager.book.documents.by("number", row.reference)
+            if document.type_ == type_
+        ]
+        if not invoices:
+            raise LookupError(f"No {type_} numbered {row.reference}")
+        if row.amount > 0:
+            manager.receive_payment(invoices, row.date, row.amount)
+        else:
+            manager.pay_invoices(invoices, row.date, -row.amount)
+
+
+KINDS = {
+    "expense_invoice": ImportKind(
+        ExpenseInvoiceRow,
+        key=lambda row: (row.number, _payee_name(row.payee)),
+        post=AccountManager.post_expense_invoices,
+        exists=_invoice_exists("expense invoice"),
+    ),
+    "sale_invoice": ImportKind(
+        SaleInvoiceRow,
+        key=lambda row: (row.number, row.payee.name),
+        post=AccountManager.post_sale_invoices,
+        exists=_invoice_exists("sale invoice"),
+    ),
+    "salary": ImportKind(
+        SalaryRow,
+        key=lambda row: (row.date, row.payee.name, row.amount),
+        post=AccountManager.register_salaries,
+        exists=_salary_exists,
+    ),
+    "bank_statement": ImportKind(
+        BankStatementRow,
+        key=lambda row: (row.date, row.amount, row.reference),
+        post=_post_bank_rows,
+        exists=_payment_exists,
+    ),
+}
+
+
+class Importer:
+    """Import rows into a book through the posting methods of a manager
+
+    Rows flow through generator stages, parse, normalise, deduplicate and
+    post, so only one chunk of rows is held at a time. Each chunk is posted
+    in a unit of work; if it fails, its rows are retried one by one and the
+    failing ones are rejected. Duplicates are looked for in the book and in
+    a window of the most recent window keys of the stream.
+    """
+
+    def __init__(
+        self,
+        manager: AccountManager,
+        kind: str,
+        chunk_size: int = 1000,
+        window: int = 100_000,
+        keep_rejections: int = 1000,
+        progress: Optional[Callable[[ImportReport], None]] = None,
+    ):
+        self.manager = manager
+        self.kind = KINDS[kind]
+        self.chunk_size = chunk_size
+        self.window = window
+        self.keep_rejections = keep_rejections
+        self.progress = progress
+        self.report = ImportReport()
+        self._payees: dict[str, Payee] = {}
+
+    def reject(self, line: int, row: dict, reason: str):
+        self.report.rejected += 1
+        if len(self.report.rejections) < self.keep_rejections:
+            self.report.rejections.append(Rejection(line=line, row=row, reason=reason))
+
+    def _payee(self, name: str) -> Payee:
+        payee = self._payees.get(name)
+        if payee is None:
+            payee = self._payees[name] = Payee(name=name)
+        return payee
+
+    def normalise(
+        self, records: Iterable[Record]
+    ) -> Iterator[tuple[int, dict, BaseModel]]:
+        """Validate rows into the model of the kind, rejecting invalid ones
+
+        Strings are stripped, empty values dropped and payee names turned
+        into one Payee per name.
+        """
+        for line, row in records:
+            self.report.read += 1
+            if isinstance(row, Unreadable):
+                self.reject(line, row, row.reason)
+                continue
+            values = {}
+            for name, value in row.items():
+                if isinstance(value, str):
+                    value = value.strip()
+                if value not in ("", None):
+                    values[name] = value
+            if isinstance(values.get("payee"), str):
+                values["payee"] = self._payee(values["payee"])
+            try:
+                model = self.kind.model.model_validate(values)
+            except ValidationError as error:
+                reason = "; ".join(
+                    f"{'.'.join(map(str, detail['loc']))}: {detail['msg']}"
+                    for detail in error.errors()
+                )
+                self.reject(line, row, reason)
+                continue
+            yield line, row, model
+
+    def deduplicate(
+        self, rows: Iterable[tuple[int, dict, BaseModel]]
+    ) -> Iterator[tuple[int, dict, BaseModel]]:
+        recent = OrderedDict()
+        for line, row, model in rows:
+            key = self.kind.key(model)
+            exists = self.kind.exists
+            if key in recent or (exists and exists(self.manager, model)):
+                self.report.duplicates += 1
+                continue
+            recent[key] = None
+            if len(recent) > self.window:
+                recent.popitem(last=False)
+            yield line, row, model
+
+    def post(self, rows: Iterable[tuple[int, dict, BaseModel]]) -> Iterator[int]:
+        """Post the rows in chunks, yielding the number posted by each chunk"""
+        rows = iter(rows)
+        while chunk := list(islice(rows, self.chunk_size)):
+            try:
+                with self.manager.unit_of_work():
+                    self.kind.post(self.manager, [model for _, _, model in chunk])
+                posted = len(chunk)
+            except (ValueError, LookupError):
+                posted = 0
+                for line, row, model in chunk:
+                    try:
+                        with self.manager.unit_of_work():
+                            self.kind.post(self.manager, [model])
+                        posted += 1
+                    except (ValueError, LookupError) as error:
+                        self.reject(line, row, str(error))
+            self.report.posted += posted
+            yield posted
+
+    def run(self, records: Iterable[Record]) -> ImportReport:
+        """Import records and return the report, calling progress after each chunk"""
+        start = time.perf_counter()
+        for _ in self.post(self.deduplicate(self.normalise(records))):
+            self.report.seconds = time.perf_counter() - start
+            if self.progress is not None:
+                self.progress(self.report)
+        self.report.seconds = time.perf_counter() - start
+        return self.report
+
+    def import_file(self, path: Union[str, Path]) -> ImportReport:
+        return self.run(read_file(path))
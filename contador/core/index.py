@@ -0,0 +1,358 @@
+from bisect import bisect_left, bisect_right
+from collections.abc import Mapping
+from datetime import date, datetime, time, timedelta
+from heapq import merge
+from itertools import islice
+from operator import itemgetter
+from typing import Any, Iterable, Iterator, Optional, TypeVar
+
+from .money import Money
+
+
+def as_datetime(value: date, end_of_day: bool = False) -> datetime:
+    """Dates are widened to the start (or end) of the day they name"""
+    if isinstance(value, datetime):
+        return value
+    return datetime.combine(value, time.max if end_of_day else time.min)
+
+
+class DateIndex:
+    """Entries sorted by date with prefix sums of their amounts
+
+    Postings in date order are appended in O(1). Backdated postings are set
+    aside and merged in a single pass on the next query, which also marks
+    the prefix sums from the earliest of them as stale.
+
+    The lists are only ever appended to or replaced by new ones, never
+    changed in place, so snapshot() can share them with a read-only view.
+    """
+
+    def __init__(self):
+        self._dates: list[datetime] = []
+        self._entries: list[Any] = []
+        self._amounts: list[Money] = []
+        self._totals: list[Money] = []
+        self._backdated: list[tuple[datetime, Any, Money]] = []
+        # Number of rows a snapshot sees, None for the live index
+        self._size: Optional[int] = None
+
+    def __len__(self) -> int:
+        return self._count + len(self._backdated)
+
+    @property
+    def _count(self) -> int:
+        return len(self._dates) if self._size is None else self._size
+
+    def snapshot(self) -> "DateIndex":
+        """Read-only view of the index as it is now, sharing its lists"""
+        self._merge()
+        self._refresh()
+        view = DateIndex()
+        view._dates = self._dates
+        view._entries = self._entries
+        view._amounts = self._amounts
+        view._totals = self._totals
+        view._size = len(self._dates)
+        return view
+
+    def add(self, date: datetime, entry: Any, amount: Money):
+        if self._size is not None:
+            raise TypeError("A date index snapshot is read-only")
+        if self._backdated or (self._dates and date < self._dates[-1]):
+            self._backdated.append((date, entry, amount))
+            return
+
+        self._dates.append(date)
+        self._entries.append(entry)
+        self._amounts.append(amount)
+        if len(self._totals) == len(self._dates) - 1:
+            previous = self._totals[-1] if self._totals else Money(0)
+            self._totals.append(previous + amount)
+
+    def extend(self, rows: Iterable[tuple[datetime, Any, Money]]):
+        """Add many postings at once, as (date, entry, amount) rows
+
+        Rows that all come after the last posting are appended in one go and
+        their prefix sums are left for the next query; the others are merged
+        on the next query like any backdated posting.
+        """
+        if self._size is not None:
+            raise TypeError("A date index snapshot is read-only")
+        rows = sorted(rows, key=itemgetter(0))
+        if not rows:
+            return
+        if self._backdated or (self._dates and rows[0][0] < self._dates[-1]):
+            self._backdated.extend(rows)
+            return
+
+        dates, entries, amounts = zip(*rows)
+        self._dates.extend(dates)
+        self._entries.extend(entries)
+        self._amounts.extend(amounts)
+
+    def _merge(self):
+        if not self._backdated:
+            return
+        # Stable, so entries with the same date keep the order they came in
+        backdated = sorted(self._backdated, key=itemgetter(0))
+        self._backdated = []
+        stale = bisect_right(self._dates, backdated[0][0])
+        self._totals = self._totals[:stale]
+
+        rows = list(
+            merge(
+                zip(self._dates, self._entries, self._amounts),
+                backdated,
+                key=itemgetter(0),
+            )
+        )
+        self._dates = [row[0] for row in rows]
+        self._entries = [row[1] for row in rows]
+        self._amounts = [row[2] for row in rows]
+
+    def _refresh(self):
+        totals = self._totals
+        start = len(totals)
+        total = totals[-1] if totals else Money(0)
+        for amount in self._amounts[start:]:
+            total += amount
+            totals.append(total)
+
+    def _total_to(self, position: int) -> Money:
+        if not position:
+            return Money(0)
+        if position > len(self._totals):
+            self._refresh()
+        return self._totals[position - 1]
+
+    def total_until(self, date: date) -> Money:
+        """Sum of the amounts dated up to and including date"""
+        self._merge()
+        end = as_datetime(date, end_of_day=True)
+        return self._total_to(bisect_right(self._dates, end, 0, self._count))
+
+    def total_between(self, start: date, end: date) -> Money:
+        """Sum of the amounts dated between start and end, inclusive"""
+        self._merge()
+        first = bisect_left(self._dates, as_datetime(start), 0, self._count)
+        last = bisect_right(
+            self._dates, as_datetime(end, end_of_day=True), 0, self._count
+        )
+        if last <= first:
+            return Money(0)
+        return self._total_to(last) - self._total_to(first)
+
+    def entries_between(self, start: date, end: date) -> Iterator[Any]:
+        """Entries dated between start and end, inclusive, in date order"""
+        self._merge()
+        first = bisect_left(self._dates, as_datetime(start), 0, self._count)
+        last = bisect_right(
+            self._dates, as_datetime(end, end_of_day=True), 0, self._count
+        )
+        for position in range(first, last):
+            yield self._entries[position]
+
+    def amounts(self) -> Iterator[tuple[datetime, Money]]:
+        """Every date and amount, in date order"""
+        self._merge()
+        return islice(zip(self._dates, self._amounts), self._count)
+
+
+DAY = "day"
+MONTH = "month"
+QUARTER = "quarter"
+
+
+def as_date(value: date) -> date:
+    return value.date() if isinstance(value, datetime) else value
+
+
+def _month_end(day: date) -> date:
+    following = date(day.year + day.month // 12, day.month % 12 + 1, 1)
+    return following - timedelta(days=1)
+
+
+def _quarter_end(day: date) -> date:
+    return _month_end(date(day.year, (day.month - 1) // 3 * 3 + 3, 1))
+
+
+def _bucket_end(unit: str, day: date) -> date:
+    if unit == DAY:
+        return day
+    if unit == MONTH:
+        return _month_end(day)
+    if unit == QUARTER:
+        return _quarter_end(day)
+    raise ValueError(f"Unknown rollup unit {unit}")
+
+
+def bucket_label(unit: str, day: date) -> str:
+    if unit == MONTH:
+        return f"{day.year}-{day.month:02}"
+    if unit == QUARTER:
+        return f"{day.year}-Q{(day.month - 1) // 3 + 1}"
+    return day.isoformat()
+
+
+class Rollup:
+    """Totals of amounts by day, month and quarter, kept up as amounts come in
+
+    Range totals add up the largest buckets that fit in the range, so a year
+    costs a handful of lookups however many amounts were added.
+    """
+
+    def __init__(self):
+        self._days: dict[int, Money] = {}
+        self._months: dict[tuple[int, int], Money] = {}
+        self._quarters: dict[tuple[int, int], Money] = {}
+
+    def __len__(self) -> int:
+        return len(self._days)
+
+    def add(self, day: date, amount: Money):
+        day = as_date(day)
+        for buckets, key in (
+            (self._days, day.toordinal()),
+            (self._months, (day.year, day.month)),
+            (self._quarters, (day.year, (day.month - 1) // 3)),
+        ):
+            total = buckets.get(key)
+            buckets[key] = amount if total is None else total + amount
+
+    def _bounds(self, start: Optional[date], end: Optional[date]):
+        """First and last day of the range, or None when either is unknown
+
+        A bound left out is taken from the days with amounts, so an empty
+        rollup only has bounds when both are given.
+        """
+        first = as_date(start) if start else None
+        last = as_date(end) if end else None
+        if self._days and (first is None or last is None):
+            first = first or date.fromordinal(min(self._days))
+            last = last or date.fromordinal(max(self._days))
+        if first is None or last is None:
+            return None, None
+        return first, last
+
+    def total_between(
+        self, start: Optional[date] = None, end: Optional[date] = None
+    ) -> Money:
+        """Total of the amounts dated between start and end, inclusive"""
+        first, last = self._bounds(start, end)
+        total = Money(0)
+        if first is None:
+            return total
+
+        day = first
+        while day <= last:
+            if day.day == 1:
+                end_of_quarter = _quarter_end(day)
+                if day.month % 3 == 1 and end_of_quarter <= last:
+                    key = (day.year, (day.month - 1) // 3)
+                    total += self._quarters.get(key, Money(0))
+                    day = end_of_quarter + timedelta(days=1)
+                    continue
+                end_of_month = _month_end(day)
+                if end_of_month <= last:
+                    total += self._months.get((day.year, day.month), Money(0))
+                    day = end_of_month + timedelta(days=1)
+                    continue
+            total += self._days.get(day.toordinal(), Money(0))
+            day += timedelta(days=1)
+        return total
+
+    def series(
+        self, unit: str, start: Optional[date] = None, end: Optional[date] = None
+    ) -> dict[str, Money]:
+        """Total of every day, month or quarter between start and end
+
+        Buckets are labelled like 2021-01-31, 2021-01 or 2021-Q1. The first and
+        last ones only count the days inside the range.
+        """
+        first, last = self._bounds(start, end)
+        series = {}
+        day = first
+        while day is not None and day <= last:
+            end_of_bucket = _bucket_end(unit, day)
+            series[bucket_label(unit, day)] = self.total_between(
+                day, min(end_of_bucket, last)
+            )
+            day = end_of_bucket + timedelta(days=1)
+        return series
+
+
+K = TypeVar("K")
+V = TypeVar("V")
+
+# Value of a key taken out of a LayeredMap, see LayeredMap.changed()
+REMOVED: Any = object()
+_MISSING = object()
+
+
+class LayeredMap(Mapping[K, V]):
+    """Read-only mapping stacked from the changes made to an earlier one
+
+    changed() returns a new map with the changes as a layer on top and
+    leaves the old map as it is, so each map can be handed to readers while
+    later changes are published as new maps, for a cost that follows the
+    number of changes rather than the size of the map. A layer is merged
+    into the one below it while that one is no more than twice its size, so
+    lookups go through about log n layers and every key is copied about
+    log n times however often changes are published.
+
+    Keys keep the position of the layer they were first seen in.
+    """
+
+    __slots__ = ("_layers", "_size")
+
+    def __init__(self, items: Optional[Mapping[K, V]] = None):
+        self._layers: tuple[dict, ...] = (dict(items),) if items else ()
+        self._size = len(items) if items else 0
+
+    def changed(self, changes: Mapping[K, V]) -> "LayeredMap[K, V]":
+        """A new map with changes on top; keys set to REMOVED are taken out"""
+        size = self._size
+        top = {}
+        for key, value in changes.items():
+            present = key in self
+            if value is REMOVED and not present:
+                continue
+            size += (value is not REMOVED) - present
+            top[key] = value
+
+        layers = list(self._layers)
+        while layers and len(layers[-1]) <= 2 * len(top):
+            top = {**layers.pop(), **top}
+        if not layers:
+            top = {key: value for key, value in top.items() if value is not REMOVED}
+
+        layered = LayeredMap()
+        layered._layers = (*layers, top) if top else tuple(layers)
+        layered._size = size
+        return layered
+
+    def get(self, key: K, default: Optional[V] = None) -> Optional[V]:
+        for layer in reversed(self._layers):
+            value = layer.get(key, _MISSING)
+            if value is not _MISSING:
+                return default if value is REMOVED else value
+        return default
+
+    def __getitem__(self, key: K) -> V:
+        value = self.get(key, _MISSING)
+        if value is _MISSING:
+            raise KeyError(key)
+        return value
+
+    def __contains__(self, key: object) -> bool:
+        return self.get(key, _MISSING) is not _MISSING
+
+    def __iter__(self) -> Iterator[K]:
+        layers = self._layers
+        for depth, layer in enumerate(layers):
+            for key in layer:
+                if key in self and not any(key in lower for lower in layers[:depth]):
+                    yield key
+
+    def __len__(self) -> int:
+        return self._size
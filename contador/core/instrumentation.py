@@ -0,0 +1,228 @@
+import threading
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+from inspect import isgeneratorfunction
+from time import perf_counter
+from typing import Iterator, Optional, Protocol
+
+from pydantic import BaseModel
+
+# Upper bounds of the latency buckets: 1µs doubling up to about 17 minutes
+BUCKETS = tuple(1e-6 * 2**power for power in range(31))
+
+ENTRIES = "entries"
+
+
+class Hook(Protocol):
+    """Receives measurements while it is registered with add_hook()"""
+
+    def timing(self, name: str, seconds: float): ...
+
+    def count(self, name: str, value: int = 1): ...
+
+
+# Registered hooks. Instrumented code only checks that the list is empty when
+# there are none, so it is changed in place and never rebound.
+hooks: list[Hook] = []
+
+_operation: ContextVar[Optional[str]] = ContextVar("operation", default=None)
+
+
+def add_hook(hook: Hook):
+    hooks.append(hook)
+
+
+def remove_hook(hook: Hook):
+    hooks.remove(hook)
+
+
+@contextmanager
+def hooked(hook: Hook) -> Iterator[Hook]:
+    """Register hook for the duration of the block"""
+    add_hook(hook)
+    try:
+        yield hook
+    finally:
+        remove_hook(hook)
+
+
+def timing(name: str, seconds: float):
+    for hook in hooks:
+        hook.timing(name, seconds)
+
+
+def count(name: str, value: int = 1):
+    for hook in hooks:
+        hook.count(name, value)
+
+
+def entries(value: int):
+    """Count entries posted, also against the operation that posted them"""
+    count(ENTRIES, value)
+    operation = _operation.get()
+    if operation is not None:
+        count(f"{operation}.{ENTRIES}", value)
+
+
+def instrumented(method):
+    """Time every call to method and count the ones that fail
+
+    Measurements are named after the qualified name of method. Entries
+    posted during the call are also counted against the outermost
+    instrumented call. With no hooks registered the only cost is a check
+    that the hook list is empty. Generators are timed over their whole
+    iteration, counting only the time spent inside them.
+    """
+    name = method.__qualname__
+    if isgeneratorfunction(method):
+        return _instrumented_generator(method, name)
+
+    @wraps(method)
+    def wrapper(*args, **kwargs):
+        if not hooks:
+            return method(*args, **kwargs)
+
+        token = _operation.set(name) if _operation.get() is None else None
+        start = perf_counter()
+        try:
+            return method(*args, **kwargs)
+        except Exception:
+            count(f"{name}.errors")
+            raise
+        finally:
+            timing(name, perf_counter() - start)
+            if token is not None:
+                _operation.reset(token)
+
+    return wrapper
+
+
+def _instrumented_generator(method, name: str):
+    @wraps(method)
+    def wrapper(*args, **kwargs):
+        if not hooks:
+            yield from method(*args, **kwargs)
+            return
+
+        iterator = method(*args, **kwargs)
+        seconds = 0.0
+        try:
+            while True:
+                token = _operation.set(name) if _operation.get() is None else None
+                start = perf_counter()
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    return
+                except Exception:
+                    count(f"{name}.errors")
+                    raise
+                finally:
+                    seconds += perf_counter() - start
+                    if token is not None:
+                        _operation.reset(token)
+                yield item
+        finally:
+            # Also when the consumer stops early
+            timing(name, seconds)
+
+    return wrapper
+
+
+class HistogramSnapshot(BaseModel):
+    count: int
+    total: float
+    minimum: float
+    maximum: float
+    # Upper bound of each bucket in seconds and the calls that fell in it
+    buckets: list[tuple[float, int]]
+
+    @property
+    def mean(self) -> float:
+        return self.total / self.count if self.count else 0.0
+
+    def quantile(self, q: float) -> float:
+        """Upper bound of the bucket holding the q quantile"""
+        rank = q * self.count
+        seen = 0
+        for bound, calls in self.buckets:
+            seen += calls
+            if seen >= rank:
+                return min(bound, self.maximum)
+        return self.maximum
+
+
+class MetricsSnapshot(BaseModel):
+    counters: dict[str, int]
+    histograms: dict[str, HistogramSnapshot]
+
+
+class Histogram:
+    """Latencies in buckets of doubling width"""
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.minimum = float("inf")
+        self.maximum = 0.0
+
+    def add(self, seconds: float):
+        self.counts[bisect_left(BUCKETS, seconds)] += 1
+        self.count += 1
+        self.total += seconds
+        self.minimum = min(self.minimum, seconds)
+        self.maximum = max(self.maximum, seconds)
+
+    def snapshot(self) -> HistogramSnapshot:
+        bounds = BUCKETS + (float("inf"),)
+        return HistogramSnapshot(
+            count=self.count,
+            total=self.total,
+            minimum=self.minimum if self.count else 0.0,
+            maximum=self.maximum,
+            buckets=[
+                (bound, calls) for bound, calls in zip(bounds, self.counts) if calls
+            ],
+        )
+
+
+class Metrics:
+    """Hook that keeps counters and latency histograms in memory
+
+    Take a snapshot() to export them; it is safe to take one while other
+    threads are posting.
+    """
+
+    def __init__(self):
+        self.counters: dict[str, int] = {}
+        self.histograms: dict[str, Histogram] = {}
+        self._lock = threading.Lock()
+
+    def timing(self, name: str, seconds: float):
+        with self._lock:
+            histogram = self.histograms.get(name)
+            if histogram is None:
+                histogram = self.histograms[name] = Histogram()
+            histogram.add(seconds)
+
+    def count(self, name: str, value: int = 1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def snapshot(self) -> MetricsSnapshot:
+        with self._lock:
+            return MetricsSnapshot(
+                counters=dict(self.counters),
+                histograms={
+                    name: histogram.snapshot()
+                    for name, histogram in self.histograms.items()
+                },
+            )
+
+    def reset(self):
+        with self._lock:
+            self.counters.clear()
+            self.histograms.clear()
@@ -0,0 +1,411 @@
+from array import array
+from collections import defaultdict
+from copy import copy
+from datetime import date
+from itertools import islice
+from typing import TYPE_CHECKING, Iterable, Iterator, Optional
+from uuid import UUID, uuid5
+
+from . import instrumentation
+from .index import as_datetime
+from .instrumentation import hooks
+from .money import Money
+
+try:
+    import numpy
+except ImportError:  # pragma: no cover
+    numpy = None
+
+if TYPE_CHECKING:
+    from .entities import Account, Entry, Transaction
+
+UUID_SIZE = 16
+
+
+def date_key(value: date) -> int:
+    """Seconds since 0001-01-01, the integer form of a date in the date column"""
+    value = as_datetime(value, end_of_day=True)
+    return (
+        value.toordinal() * 86400 + value.hour * 3600 + value.minute * 60 + value.second
+    )
+
+
+class ColumnarLedger:
+    """Entries of a book stored column-wise in flat integer arrays
+
+    Each row holds an account id, a transaction id, the amount in minor units
+    and the transaction date as seconds. Accounts and transactions are kept
+    once in lookup tables and rows refer to them by position. Entry objects
+    are only built when iterating over them, and balances are reductions over
+    the columns, vectorized through NumPy when it is installed.
+
+    Entry uuids are derived from the transaction and the row number, except
+    for rows loaded with the uuid of an entry that was stored elsewhere:
+    uuids holds theirs, 16 bytes per row, for the first rows of the ledger.
+    """
+
+    def __init__(self, scale: int = 2):
+        self.scale = scale
+        self.account_ids = array("q")
+        self.transaction_ids = array("q")
+        self.amounts = array("q")
+        self.dates = array("q")
+        self.uuids = b""
+
+        self._accounts: list["Account"] = []
+        self._account_ids: dict[str, int] = {}
+        self._transactions: list["Transaction"] = []
+        self._transaction_ids: dict[str, int] = {}
+        # Number of rows a snapshot sees, None for the live ledger
+        self._limit: Optional[int] = None
+        # Row count and NumPy copies of the columns, see _columns()
+        self._frozen: Optional[tuple[int, tuple]] = None
+        # Units of every transaction id over the first _totalled rows
+        self._transaction_units: list[int] = []
+        self._totalled = 0
+
+    def __len__(self) -> int:
+        return len(self.amounts) if self._limit is None else self._limit
+
+    def snapshot(self) -> "ColumnarLedger":
+        """Read-only view of the rows stored so far, sharing the columns
+
+        Rows are only ever appended, so the view stops at the current number
+        of rows instead of copying them.
+        """
+        view = copy(self)
+        view._limit = len(self)
+        return view
+
+    def _check_writable(self):
+        if self._limit is not None:
+            raise TypeError("A ledger snapshot is read-only")
+
+    def to_units(self, amount: Money) -> int:
+        if isinstance(amount, Money) and amount.scale == self.scale:
+            return amount.units
+        return Money(amount, scale=self.scale).units
+
+    def from_units(self, units: int) -> Money:
+        return Money.from_units(int(units), self.scale)
+
+    def account_id(self, account: "Account") -> int:
+        key = account.uuid.hex
+        if key not in self._account_ids:
+            self._account_ids[key] = len(self._accounts)
+            self._accounts.append(account)
+        return self._account_ids[key]
+
+    def transaction_id(self, transaction: "Transaction") -> int:
+        key = transaction.uuid.hex
+        if key not in self._transaction_ids:
+            self._transaction_ids[key] = len(self._transactions)
+            self._transactions.append(transaction)
+        return self._transaction_ids[key]
+
+    def append(
+        self, account: "Account", transaction: "Transaction", amount: Money
+    ) -> int:
+        """Store one entry and return its row number"""
+        self._check_writable()
+        self.account_ids.append(self.account_id(account))
+        self.transaction_ids.append(self.transaction_id(transaction))
+        self.amounts.append(self.to_units(amount))
+        self.dates.append(date_key(transaction.date))
+        return len(self.amounts) - 1
+
+    def extend(self, rows: Iterable[tuple["Account", "Transaction", Money]]):
+        """Store the entries of several rows, all of them or none"""
+        self._check_writable()
+        rows = [
+            (account, transaction, self.to_units(amount))
+            for account, transaction, amount in rows
+        ]
+        length = len(self.amounts)
+        try:
+            for account, transaction, units in rows:
+                self.account_ids.append(self.account_id(account))
+                self.transaction_ids.append(self.transaction_id(transaction))
+                self.amounts.append(units)
+                self.dates.append(date_key(transaction.date))
+        except BaseException:
+            # Dates first, as readers take their row count from them
+            columns = (self.dates, self.account_ids, self.transaction_ids, self.amounts)
+            for column in columns:
+                del column[length:]
+            raise
+
+    def post(
+        self,
+        transaction: "Transaction",
+        postings: Iterable[tuple["Account", Money]],
+    ):
+        """Store balanced postings without building Entry objects"""
+        self._check_writable()
+        postings = [(account, self.to_units(amount)) for account, amount in postings]
+        if sum(units for _, units in postings) != 0:
+            raise ValueError("Entries are unbalanced")
+
+        transaction_id = self.transaction_id(transaction)
+        key = date_key(transaction.date)
+        for account, units in postings:
+            self.account_ids.append(self.account_id(account))
+            self.transaction_ids.append(transaction_id)
+            self.amounts.append(units)
+            self.dates.append(key)
+            amount = self.from_units(units)
+            account._apply_amount(amount)
+            account._roll_up(transaction.date, amount)
+        if postings and account.book is not None:
+            account.book._state.version += 1
+        if hooks:
+            instrumentation.entries(len(postings))
+
+    def _columns(self):
+        """NumPy arrays over a copy of the columns, as of the last full row
+
+        The live arrays are never exported: a view over them would stop the
+        writer from growing them for as long as it is alive. The copy is kept
+        until another row is stored.
+        """
+        # Dates are appended last, so every column has at least that many rows
+        rows = len(self.dates) if self._limit is None else self._limit
+        if self._frozen is None or self._frozen[0] != rows:
+            columns = (self.account_ids, self.transaction_ids, self.amounts, self.dates)
+            self._frozen = rows, tuple(
+                numpy.frombuffer(column[:rows], dtype=numpy.int64) for column in columns
+            )
+        return self._frozen[1]
+
+    def _rows(self, *columns: array) -> Iterator[tuple]:
+        return islice(zip(*columns), len(self))
+
+    def _total(
+        self,
+        account_id: Optional[int] = None,
+        transaction_id: Optional[int] = None,
+        start: Optional[int] = None,
+        end: Optional[int] = None,
+    ) -> int:
+        if not len(self):
+            return 0
+
+        if numpy is not None:
+            accounts, transactions, amounts, dates = self._columns()
+            mask = numpy.ones(len(amounts), dtype=bool)
+            if account_id is not None:
+                mask &= accounts == account_id
+            if transaction_id is not None:
+                mask &= transactions == transaction_id
+            if start is not None:
+                mask &= dates >= start
+            if end is not None:
+                mask &= dates <= end
+            return int(amounts[mask].sum())
+
+        total = 0
+        rows = self._rows(
+            self.account_ids, self.transaction_ids, self.amounts, self.dates
+        )
+        for row_account, row_transaction, units, key in rows:
+            if account_id is not None and row_account != account_id:
+                continue
+            if transaction_id is not None and row_transaction != transaction_id:
+                continue
+            if start is not None and key < start:
+                continue
+            if end is not None and key > end:
+                continue
+            total += units
+        return total
+
+    def account_total(self, account: "Account") -> Money:
+        account_id = self._account_ids.get(account.uuid.hex)
+        if account_id is None:
+            return self.from_units(0)
+        return self.from_units(self._total(account_id=account_id))
+
+    def account_total_between(
+        self, account: "Account", start: Optional[date], end: date
+    ) -> Money:
+        account_id = self._account_ids.get(account.uuid.hex)
+        if account_id is None:
+            return self.from_units(0)
+        start = date_key(as_datetime(start)) if start else None
+        total = self._total(account_id=account_id, start=start, end=date_key(end))
+        return self.from_units(total)
+
+    def _catch_up(self) -> list[int]:
+        """Units of every transaction id, adding up the rows stored since last time
+
+        Called on every posting, so each row is added once instead of the
+        columns being scanned again. Rows taken back by a failed extend()
+        start the totals over.
+        """
+        rows = len(self.dates)
+        units = self._transaction_units
+        if rows < self._totalled:
+            units.clear()
+            self._totalled = 0
+        units.extend([0] * (len(self._transactions) - len(units)))
+        new = islice(zip(self.transaction_ids, self.amounts), self._totalled, rows)
+        for transaction_id, amount in new:
+            units[transaction_id] += amount
+        self._totalled = rows
+        return units
+
+    def transaction_total(self, transaction: "Transaction") -> Money:
+        transaction_id = self._transaction_ids.get(transaction.uuid.hex)
+        if transaction_id is None:
+            return self.from_units(0)
+        if self._limit is not None:
+            return self.from_units(self._total(transaction_id=transaction_id))
+        return self.from_units(self._catch_up()[transaction_id])
+
+    def totals_by_account(
+        self, start: Optional[date] = None, end: Optional[date] = None
+    ) -> dict[str, Money]:
+        """Entries total of every account, keyed by uuid hex, in a single reduction
+
+        start and end restrict the totals to the entries dated between them.
+        """
+        start = date_key(as_datetime(start)) if start else None
+        end = date_key(end) if end else None
+
+        if numpy is not None:
+            accounts, _, amounts, dates = self._columns()
+            if start is not None or end is not None:
+                mask = numpy.ones(len(amounts), dtype=bool)
+                if start is not None:
+                    mask &= dates >= start
+                if end is not None:
+                    mask &= dates <= end
+                accounts, amounts = accounts[mask], amounts[mask]
+            totals = numpy.zeros(len(self._accounts), dtype=numpy.int64)
+            numpy.add.at(totals, accounts, amounts)
+            units = totals.tolist()
+        else:
+            units = [0] * len(self._accounts)
+            rows = self._rows(self.account_ids, self.amounts, self.dates)
+            for account_id, amount, key in rows:
+                if start is not None and key < start:
+                    continue
+                if end is not None and key > end:
+                    continue
+                units[account_id] += amount
+
+        return {
+            account.uuid.hex: self.from_units(total)
+            for account, total in zip(self._accounts, units)
+        }
+
+    def daily_totals(self, account: "Account") -> dict[date, Money]:
+        """Entries total of an account for every day it has entries on"""
+        account_id = self._account_ids.get(account.uuid.hex)
+        if account_id is None or not len(self):
+            return {}
+
+        if numpy is not None:
+            accounts, _, amounts, dates = self._columns()
+            mask = accounts == account_id
+            days, positions = numpy.unique(dates[mask] // 86400, return_inverse=True)
+            totals = numpy.zeros(len(days), dtype=numpy.int64)
+            numpy.add.at(totals, positions, amounts[mask])
+            units = dict(zip(days.tolist(), totals.tolist()))
+        else:
+            units = defaultdict(int)
+            rows = self._rows(self.account_ids, self.amounts, self.dates)
+            for row_account, amount, key in rows:
+                if row_account == account_id:
+                    units[key // 86400] += amount
+
+        return {
+            date.fromordinal(day): self.from_units(total)
+            for day, total in units.items()
+        }
+
+    def rows_by_account(self) -> dict[str, array]:
+        """Rows of every account in date order, keyed by uuid hex
+
+        Rows with the same date keep the order they were stored in.
+        """
+        if numpy is not None:
+            accounts, _, _, dates = self._columns()
+            # Stable, sorting by account and then by date
+            order = numpy.lexsort((dates, accounts))
+            bounds = numpy.searchsorted(
+                accounts[order], numpy.arange(len(self._accounts) + 1)
+            ).tolist()
+            order = array("q", order.astype(numpy.int64).tobytes())
+        else:
+            order = array(
+                "q",
+                sorted(
+                    range(len(self)),
+                    key=lambda row: (self.account_ids[row], self.dates[row]),
+                ),
+            )
+            bounds = [0] * (len(self._accounts) + 1)
+            for row in order:
+                bounds[self.account_ids[row] + 1] += 1
+            for position in range(1, len(bounds)):
+                bounds[position] += bounds[position - 1]
+        return {
+            account.uuid.hex: order[start:end]
+            for account, start, end in zip(self._accounts, bounds, bounds[1:])
+        }
+
+    def transaction_of(self, row: int) -> "Transaction":
+        return self._transactions[self.transaction_ids[row]]
+
+    def row_uuid(self, row: int) -> UUID:
+        """uuid of the Entry object built for row"""
+        start = UUID_SIZE * row
+        end = start + UUID_SIZE
+        if end <= len(self.uuids):
+            return UUID(bytes=self.uuids[start:end])
+        return uuid5(self.transaction_of(row).uuid, str(row))
+
+    def _entry(self, row: int) -> "Entry":
+        from .entities import Entry
+
+        return Entry.trusted(
+            uuid=self.row_uuid(row),
+            amount=self.from_units(self.amounts[row]),
+            account=self._accounts[self.account_ids[row]],
+            transaction=self.transaction_of(row),
+        )
+
+    def entries(
+        self,
+        account: Optional["Account"] = None,
+        transaction: Optional["Transaction"] = None,
+    ) -> Iterator["Entry"]:
+        """Build Entry objects for the matching rows, one at a time"""
+        if account is not None:
+            account_id = self._account_ids.get(account.uuid.hex)
+            if account_id is None:
+                return
+        if transaction is not None:
+            transaction_id = self._transaction_ids.get(transaction.uuid.hex)
+            if transaction_id is None:
+                return
+
+        if numpy is not None and len(self):
+            accounts, transactions, _, _ = self._columns()
+            mask = numpy.ones(len(accounts), dtype=bool)
+            if account is not None:
+                mask &= accounts == account_id
+            if transaction is not None:
+                mask &= transactions == transaction_id
+            rows = numpy.flatnonzero(mask).tolist()
+        else:
+            rows = (
+                row
+                for row in range(len(self))
+                if (account is None or self.account_ids[row] == account_id)
+                and (transaction is None or self.transaction_ids[row] == transaction_id)
+            )
+
+        for row in rows:
+            yield self._entry(row)
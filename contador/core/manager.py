@@ -1,17 +1,130 @@
+import inspect
 from datetime import datetime
-from decimal import Decimal
+from functools import wraps
+from typing import (
+    IO,
+    TYPE_CHECKING,
+    Callable,
+    ContextManager,
+    Iterable,
+    Iterator,
+    Optional,
+    TypeVar,
+)
+from uuid import uuid4
+
+from pydantic import BaseModel, TypeAdapter
 
 from .accounting import ChartOfAccounts
-from .entities import Account, Book, Document, Entry, Payee, Transaction
+from .entities import Account, Book, Document, Entry, Payee, Transaction, derived_uuids
+from .instrumentation import instrumented
+from .money import Money
+from .posting import PostingBatch, UnitOfWork
+from .reconciliation import Reconciler, ReconciliationReport, StatementLine
+from .subledger import PAYABLE, RECEIVABLE, SALARIES, OpenItems, PayeeLedger
+
+if TYPE_CHECKING:
+    from ..storage.journal import Journal
+
+
+RowType = TypeVar("RowType", bound=BaseModel)
+
+
+class ExpenseInvoiceRow(BaseModel):
+    date: datetime
+    number: str
+    amount: Money
+    invoice_url: str
+    payee: Optional[Payee] = None
+
+
+class SaleInvoiceRow(BaseModel):
+    date: datetime
+    number: str
+    amount: Money
+    invoice_url: str
+    payee: Payee
+    tax_amount: Money = Money(0)
+
+
+class SalaryRow(BaseModel):
+    date: datetime
+    amount: Money
+    payee: Payee
+
+
+ExpenseInvoiceRows = TypeAdapter(list[ExpenseInvoiceRow])
+SaleInvoiceRows = TypeAdapter(list[SaleInvoiceRow])
+SalaryRows = TypeAdapter(list[SalaryRow])
+
+
+@instrumented
+def validate_rows(
+    model: type[RowType], adapter: TypeAdapter, rows: Iterable[RowType | dict]
+) -> list[RowType]:
+    """Rows as models of the given type, validating the dicts in one call
+
+    Rows that already are models, such as the ones of the importer, are
+    taken as they are.
+    """
+    rows = list(rows)
+    dicts = [position for position, row in enumerate(rows) if type(row) is not model]
+    if dicts:
+        validated = adapter.validate_python([rows[position] for position in dicts])
+        for position, row in zip(dicts, validated):
+            rows[position] = row
+    return rows
+
+
+def journaled(method):
+    """Write the operation to the manager journal once its postings commit
+
+    Entities created by the operation get uuids derived from a random seed
+    that is journaled along with the arguments, so replaying the journal
+    rebuilds the very same entities.
+    """
+    signature = inspect.signature(method)
+
+    @wraps(method)
+    def wrapper(self, *args, **kwargs):
+        if self.journal is None:
+            return method(self, *args, **kwargs)
+
+        bound = signature.bind(self, *args, **kwargs)
+        # Rows given as iterators would be used up before being journaled
+        for name, value in bound.arguments.items():
+            if isinstance(value, Iterator):
+                bound.arguments[name] = list(value)
+        seed = uuid4()
+        with derived_uuids(seed):
+            result = method(*bound.args, **bound.kwargs)
+        arguments = dict(bound.arguments)
+        del arguments["self"]
+        self._on_commit(lambda: self.journal.record(method.__name__, seed, arguments))
+        unit_of_work = self.book.active_unit_of_work
+        if unit_of_work is not None:
+            # Once every operation of the outermost unit of work is journaled
+            unit_of_work.after_commit(self._checkpoint)
+        else:
+            self._checkpoint()
+        return result
+
+    return wrapper
 
 
 class AccountManager:
-    def __init__(self, book: Book):
+    def __init__(self, book: Book, journal: Optional["Journal"] = None):
         self.book = book
         self.chart = ChartOfAccounts(book)
+        self.open_items = OpenItems()
+        self.payees = PayeeLedger()
+        self.reconciler = Reconciler(self.chart.bank_account)
+        self.journal = None
+        if journal is not None:
+            journal.attach(self)
 
     def put_expense(
-        self, payable_account: Account, amount: Decimal
+        self, payable_account: Account, amount: Money
     ) -> tuple[Entry, Entry]:
         """Put expenses into a payable account"""
         credit = payable_account.credit(amount)
@@ -19,189 +132,462 @@ class AccountManager:
         return (credit, debit)
 
     def get_revenue(
-        self, receivable_account: Account, amount: Decimal
+        self, receivable_account: Account, amount: Money
     ) -> tuple[Entry, Entry]:
         """Get money from revenue into a receivable account"""
         credit = self.chart.revenue.credit(amount)  # take money out of revenue
         debit = receivable_account.debit(amount)
         return (credit, debit)
 
+    def unit_of_work(self) -> ContextManager[UnitOfWork]:
+        """Apply every posting made inside the block at once, or none of them"""
+        return self.book.unit_of_work()
+
+    def _checkpoint(self):
+        self.journal.checkpoint(self)
+
+    def _on_commit(self, callback: Callable[[], None]):
+        unit_of_work = self.book.active_unit_of_work
+        if unit_of_work is not None:
+            unit_of_work.on_commit(callback)
+        else:
+            callback()
+
+    @instrumented
+    @journaled
     def add_expense_invoice(
         self,
         date: datetime.date,
         number: str,
-        amount: Decimal,
+        amount: Money,
         invoice_url: str,
         payee: Payee = None,
     ) -> Document:
-        invoice = Document(
-            date=date,
-            number=number,
-            type_="expense invoice",
-            amount=amount,
-            location=invoice_url,
-            book=self.book,
-            payee=payee,
-        )
-
-        transaction = Transaction(
-            date=date,
-            description=f"Invoice {number}",
-            book=self.book,
-        )
-
-        transaction.add_entries(self.put_expense(self.chart.accounts_payable, amount))
-
-        invoice.transactions.add(transaction)
-        transaction.documents.add(invoice)
+        with self.unit_of_work():
+            invoice = Document(
+                date=date,
+                number=number,
+                type_="expense invoice",
+                amount=amount,
+                location=invoice_url,
+                book=self.book,
+                payee=payee,
+            )
+
+            transaction = Transaction(
+                date=date,
+                description=f"Invoice {number}",
+                book=self.book,
+            )
+
+            transaction.add_entries(
+                self.put_expense(self.chart.accounts_payable, amount)
+            )
+            transaction.add_document(invoice)
+            self._on_commit(
+                lambda: self._open_invoice(invoice, PAYABLE, invoice.amount)
+            )
 
         return invoice
 
+    @instrumented
+    @journaled
     def pay_invoices(
-        self, invoices: list[Document], date: datetime.date, amount: Decimal
+        self, invoices: list[Document], date: datetime.date, amount: Money
     ) -> Document:
-        transaction = Transaction(
-            date=date,
-            description="Payment for invoices",
-            book=self.book,
-        )
-
-        credit = self.chart.bank_account.credit(amount)
-        debit = self.chart.accounts_payable.debit(amount)
-        transaction.add_entries([credit, debit])
-
-        for invoice in invoices:
-            transaction.documents.add(invoice)
-            invoice.transactions.add(transaction)
+        with self.unit_of_work():
+            transaction = Transaction(
+                date=date,
+                description="Payment for invoices",
+                book=self.book,
+            )
+
+            credit = self.chart.bank_account.credit(amount)
+            debit = self.chart.accounts_payable.debit(amount)
+            transaction.add_entries([credit, debit])
+
+            for invoice in invoices:
+                transaction.add_document(invoice)
+            self._on_commit(
+                lambda: self._settle(invoices, Money(amount), PAYABLE, transaction)
+            )
 
         return transaction
 
+    @instrumented
+    @journaled
     def register_salary(
-        self, date: datetime.date, amount: Decimal, payee: Payee
+        self, date: datetime.date, amount: Money, payee: Payee
     ) -> Transaction:
-        transaction = Transaction(
-            date=date,
-            description=f"Salary for {payee.name}",
-            book=self.book,
-        )
-
-        transaction.add_entries(self.put_expense(self.chart.salaries, amount))
+        with self.unit_of_work():
+            transaction = Transaction(
+                date=date,
+                description=f"Salary for {payee.name}",
+                book=self.book,
+            )
+
+            transaction.add_entries(self.put_expense(self.chart.salaries, amount))
+            self._on_commit(
+                lambda: self._post_salary(payee, Money(amount), transaction)
+            )
 
         return transaction
 
+    @instrumented
+    @journaled
     def pay_salary(
         self,
         date: datetime.date,
-        amount: Decimal,
+        amount: Money,
         payee: Payee,
-        tax_retention: Decimal = Decimal(0.0),
+        tax_retention: Money = Money(0),
     ) -> Transaction:
-        transaction = Transaction(
-            date=date,
-            description=f"Salary payment to {payee.name}",
-            book=self.book,
-        )
-
-        credit = self.chart.bank_account.credit(amount)
-        if tax_retention:
-            tax = self.chart.taxes.credit(tax_retention)
-        debit = self.chart.salaries.debit(amount + tax_retention)
-        transaction.add_entries([credit, tax, debit])
+        # Rounded before adding up so the salary debit matches the credits
+        amount, tax_retention = Money(amount), Money(tax_retention)
+        with self.unit_of_work():
+            transaction = Transaction(
+                date=date,
+                description=f"Salary payment to {payee.name}",
+                book=self.book,
+            )
+
+            entries = [self.chart.bank_account.credit(amount)]
+            if tax_retention:
+                entries.append(self.chart.taxes.credit(tax_retention))
+            entries.append(self.chart.salaries.debit(amount + tax_retention))
+            transaction.add_entries(entries)
+            self._on_commit(
+                lambda: self._post_salary(payee, -(amount + tax_retention), transaction)
+            )
 
         return transaction
 
+    @instrumented
+    @journaled
     def add_sale_invoice(
         self,
         date: datetime.date,
         number: str,
-        amount: Decimal,
+        amount: Money,
         invoice_url: str,
         payee: Payee,
-        tax_amount: Decimal = Decimal(0.0),
+        tax_amount: Money = Money(0),
     ) -> Document:
-        invoice = Document(
-            date=date,
-            number=number,
-            type_="sale invoice",
-            amount=amount,
-            tax_amount=tax_amount,
-            location=invoice_url,
-            book=self.book,
-            payee=payee,
-        )
-
-        transaction = Transaction(
-            date=date,
-            description=f"Invoice {number}",
-            book=self.book,
-        )
-
-        transaction.add_entries(
-            self.get_revenue(self.chart.accounts_receivable, amount)
-        )
-        if tax_amount:
-            tax_credit = self.chart.taxes.credit(tax_amount)
-            tax_debit = self.chart.accounts_receivable.debit(tax_amount)
-            transaction.add_entries([tax_debit, tax_credit])
-
-        invoice.transactions.add(transaction)
-        transaction.documents.add(invoice)
+        with self.unit_of_work():
+            invoice = Document(
+                date=date,
+                number=number,
+                type_="sale invoice",
+                amount=amount,
+                tax_amount=tax_amount,
+                location=invoice_url,
+                book=self.book,
+                payee=payee,
+            )
+
+            transaction = Transaction(
+                date=date,
+                description=f"Invoice {number}",
+                book=self.book,
+            )
+
+            transaction.add_entries(
+                self.get_revenue(self.chart.accounts_receivable, amount)
+            )
+            if tax_amount:
+                tax_credit = self.chart.taxes.credit(tax_amount)
+                tax_debit = self.chart.accounts_receivable.debit(tax_amount)
+                transaction.add_entries([tax_debit, tax_credit])
+
+            transaction.add_document(invoice)
+            self._on_commit(
+                lambda: self._open_invoice(
+                    invoice, RECEIVABLE, invoice.amount + invoice.tax_amount
+                )
+            )
 
         return invoice
 
+    @instrumented
+    @journaled
     def receive_payment(
-        self, invoices: list[Document], date: datetime.date, amount: Decimal
+        self, invoices: list[Document], date: datetime.date, amount: Money
     ) -> Transaction:
-        transaction = Transaction(
-            date=date,
-            description="Payment for invoices",
-            book=self.book,
-        )
-
-        credit = self.chart.bank_account.debit(amount)
-        debit = self.chart.accounts_receivable.credit(amount)
-        transaction.add_entries([credit, debit])
-
-        for invoice in invoices:
-            transaction.documents.add(invoice)
-            invoice.transactions.add(transaction)
+        with self.unit_of_work():
+            transaction = Transaction(
+                date=date,
+                description="Payment for invoices",
+                book=self.book,
+            )
+
+            credit = self.chart.bank_account.debit(amount)
+            debit = self.chart.accounts_receivable.credit(amount)
+            transaction.add_entries([credit, debit])
+
+            for invoice in invoices:
+                transaction.add_document(invoice)
+            self._on_commit(
+                lambda: self._settle(invoices, Money(amount), RECEIVABLE, transaction)
+            )
 
         return transaction
 
-    def pay_taxes(self, date: datetime.date, amount: Decimal) -> Transaction:
-        transaction = Transaction(
-            date=date,
-            description="Payment for taxes",
-            book=self.book,
-        )
+    @instrumented
+    @journaled
+    def pay_taxes(self, date: datetime.date, amount: Money) -> Transaction:
+        with self.unit_of_work():
+            transaction = Transaction(
+                date=date,
+                description="Payment for taxes",
+                book=self.book,
+            )
 
-        credit = self.chart.bank_account.credit(amount)
-        debit = self.chart.taxes.debit(amount)
-        transaction.add_entries([credit, debit])
+            credit = self.chart.bank_account.credit(amount)
+            debit = self.chart.taxes.debit(amount)
+            transaction.add_entries([credit, debit])
 
         return transaction
 
+    @instrumented
+    def close_period(
+        self, period: str, archive: Optional[IO[bytes]] = None
+    ) -> "AccountManager":
+        """Close the book and return a manager for the book of the next period
+
+        Accounts open the new book at their closing balance, and invoices
+        that are not settled are carried over, as copies that keep their uuid,
+        with what they still owe. Payee balances are brought forward. With
+        archive, the closed book is written to it in the binary format of
+        contador.storage.binary. Once the old manager is dropped, only the new
+        period is held in memory. A journal is not carried over, since it
+        replays the closed book.
+        """
+        book = self.book.close_period(period)
+        if archive is not None:
+            from ..storage.binary import dump
+
+            dump(self.book, archive)
+
+        manager = AccountManager(book)
+        for item in self.open_items.items():
+            document = item.document
+            copy = Document(
+                uuid=document.uuid,
+                date=document.date,
+                number=document.number,
+                type_=document.type_,
+                amount=document.amount,
+                tax_amount=document.tax_amount,
+                payee=document.payee,
+                location=document.location,
+                book=book,
+            )
+            manager.open_items.open(copy, item.kind, item.outstanding)
+        for payee, kind, balance in self.payees.outstanding():
+            manager.payees.bring_forward(payee, kind, balance)
+        return manager
+
+    @instrumented
+    def reconcile_bank_statement(
+        self,
+        lines: Iterable[StatementLine | dict],
+        days: int = 3,
+        amount_tolerance: Money = Money(0),
+    ) -> ReconciliationReport:
+        """Match statement lines to the entries of the bank account"""
+        lines = [StatementLine.model_validate(line) for line in lines]
+        return self.reconciler.reconcile(lines, days, amount_tolerance)
+
+    @instrumented
     def is_invoice_clear(self, invoice: Document) -> bool:
         """Check if entries on accounts payable and receivable are cleared"""
-        entries = []
-        for transaction in invoice.transactions.values():
-            entries.extend(transaction.entries.values())
+        clear = self.open_items.is_clear(invoice)
+        if clear is not None:
+            return clear
 
+        # Invoices posted outside this manager are checked from their entries
+        payable = self.chart.accounts_payable
+        receivable = self.chart.accounts_receivable
         account_payable_entries = []
         account_receivable_entries = []
 
-        for entry in entries:
-            if entry.account == self.chart.accounts_payable:
-                account_payable_entries.append(entry)
-            elif entry.account == self.chart.accounts_receivable:
-                account_receivable_entries.append(entry)
+        for transaction in self.book.transactions_of(invoice).values():
+            for entry in transaction.iter_entries():
+                if entry.account is payable:
+                    account_payable_entries.append(entry.amount)
+                elif entry.account is receivable:
+                    account_receivable_entries.append(entry.amount)
 
         # If entries indicate a negative balance, the invoice is not clear
-        if sum([entry.amount for entry in account_payable_entries]) < 0:
+        if Money.sum(account_payable_entries) < 0:
             return False
 
         # If entries indicate a positive balance, the invoice is not clear
-        if sum([entry.amount for entry in account_receivable_entries]) > 0:
+        if Money.sum(account_receivable_entries) > 0:
             return False
 
         return True
+
+    def _open_invoice(self, invoice: Document, kind: str, amount: Money):
+        """Track what the invoice is owed, also against its payee"""
+        self.open_items.open(invoice, kind, amount)
+        if invoice.payee is not None:
+            transaction = next(iter(invoice.transactions.values()), None)
+            self.payees.post(
+                invoice.payee,
+                kind,
+                amount,
+                invoice.date,
+                f"Invoice {invoice.number}",
+                transaction,
+                invoice,
+            )
+
+    def _settle(
+        self,
+        invoices: list[Document],
+        amount: Money,
+        kind: str,
+        transaction: Transaction,
+    ):
+        """Allocate a payment to the invoices and to their payees"""
+        for invoice, applied in self.open_items.settle(invoices, amount):
+            if invoice.payee is not None:
+                self.payees.post(
+                    invoice.payee,
+                    kind,
+                    -applied,
+                    transaction.date,
+                    transaction.description,
+                    transaction,
+                    invoice,
+                )
+
+    def _post_salary(self, payee: Payee, amount: Money, transaction: Transaction):
+        self.payees.post(
+            payee,
+            SALARIES,
+            amount,
+            transaction.date,
+            transaction.description,
+            transaction,
+        )
+
+    def _open_documents(self, documents: Iterable[Document]):
+        """Open items and payee postings of a batch of invoices, in bulk"""
+        items = []
+        postings = []
+        for document in documents:
+            if document.type_ == "sale invoice":
+                kind, amount = RECEIVABLE, document.amount + document.tax_amount
+            else:
+                kind, amount = PAYABLE, document.amount
+            items.append((document, kind, amount))
+            if document.payee is not None:
+                transaction = next(iter(document.transactions.values()), None)
+                postings.append(
+                    (
+                        document.payee,
+                        kind,
+                        amount,
+                        document.date,
+                        f"Invoice {document.number}",
+                        transaction,
+                        document,
+                    )
+                )
+        self.open_items.open_many(items)
+        self.payees.post_many(postings)
+
+    @instrumented
+    @journaled
+    def post_expense_invoices(
+        self, rows: Iterable[ExpenseInvoiceRow | dict]
+    ) -> list[Document]:
+        """Add a batch of expense invoices, validating the input once"""
+        batch = PostingBatch(self.book)
+        payable = self.chart.accounts_payable
+        expenses = self.chart.expenses
+
+        for row in validate_rows(ExpenseInvoiceRow, ExpenseInvoiceRows, rows):
+            transaction = batch.transaction(
+                date=row.date, description=f"Invoice {row.number}"
+            )
+            batch.post([(payable, -row.amount), (expenses, row.amount)])
+            batch.document(
+                transaction,
+                date=row.date,
+                number=row.number,
+                type_="expense invoice",
+                amount=row.amount,
+                location=row.invoice_url,
+                payee=row.payee,
+            )
+
+        batch.commit()
+        self._on_commit(lambda: self._open_documents(batch.documents))
+        return batch.documents
+
+    @instrumented
+    @journaled
+    def post_sale_invoices(
+        self, rows: Iterable[SaleInvoiceRow | dict]
+    ) -> list[Document]:
+        """Add a batch of sale invoices, validating the input once"""
+        batch = PostingBatch(self.book)
+        receivable = self.chart.accounts_receivable
+        revenue = self.chart.revenue
+        taxes = self.chart.taxes
+
+        for row in validate_rows(SaleInvoiceRow, SaleInvoiceRows, rows):
+            transaction = batch.transaction(
+                date=row.date, description=f"Invoice {row.number}"
+            )
+            batch.post([(revenue, -row.amount), (receivable, row.amount)])
+            if row.tax_amount:
+                batch.post([(receivable, row.tax_amount), (taxes, -row.tax_amount)])
+            batch.document(
+                transaction,
+                date=row.date,
+                number=row.number,
+                type_="sale invoice",
+                amount=row.amount,
+                tax_amount=row.tax_amount,
+                location=row.invoice_url,
+                payee=row.payee,
+            )
+
+        batch.commit()
+        self._on_commit(lambda: self._open_documents(batch.documents))
+        return batch.documents
+
+    @instrumented
+    @journaled
+    def register_salaries(self, rows: Iterable[SalaryRow | dict]) -> list[Transaction]:
+        """Register a batch of salaries, validating the input once"""
+        batch = PostingBatch(self.book)
+        salaries = self.chart.salaries
+        expenses = self.chart.expenses
+
+        rows = validate_rows(SalaryRow, SalaryRows, rows)
+        for row in rows:
+            batch.transaction(date=row.date, description=f"Salary for {row.payee.name}")
+            batch.post([(salaries, -row.amount), (expenses, row.amount)])
+
+        batch.commit()
+
+        self._on_commit(
+            lambda: self.payees.post_many(
+                (
+                    row.payee,
+                    SALARIES,
+                    row.amount,
+                    transaction.date,
+                    transaction.description,
+                    transaction,
+                    None,
+                )
+                for row, transaction in zip(rows, batch.transactions)
+            )
+        )
+        return batch.transactions
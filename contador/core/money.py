@@ -0,0 +1,239 @@
+from decimal import ROUND_HALF_UP, Context, Decimal
+from typing import Iterable, Union
+
+from pydantic_core import core_schema
+
+# Conversions must never be rounded by whatever the global decimal context is
+_context = Context(prec=60)
+
+Number = Union["Money", Decimal, int, float, str]
+
+_new = object.__new__
+
+
+class Money:
+    """An amount of money stored as an integer number of minor units
+
+    scale is the number of decimal places kept, 2 unless told otherwise.
+    Values are rounded once, when they are turned into Money, using the
+    rounding rule given (half up by default). Sums and differences of Money
+    are exact integer arithmetic; mixing scales widens to the larger one.
+    Comparisons are exact: Money equals an int, Decimal or float only when it
+    has the very same value, so that equal values also hash the same.
+    """
+
+    __slots__ = ("units", "scale")
+
+    DEFAULT_SCALE = 2
+    ROUNDING = ROUND_HALF_UP
+
+    def __init__(
+        self, value: Number = 0, scale: int = DEFAULT_SCALE, rounding: str = ROUNDING
+    ):
+        if isinstance(value, Money):
+            units = value.units_at(scale, rounding)
+        elif isinstance(value, int) and not isinstance(value, bool):
+            units = value * 10**scale
+        elif isinstance(value, (Decimal, float, str)):
+            if isinstance(value, float):
+                # repr gives the shortest decimal that reads back as the float
+                value = repr(value)
+            value = Decimal(value).scaleb(scale, _context)
+            if not value.is_finite():
+                raise ValueError(f"{value} is not an amount of money")
+            units = int(value.to_integral_value(rounding=rounding, context=_context))
+        else:
+            raise TypeError(f"Cannot build Money from {type(value).__name__}")
+
+        self.units = units
+        self.scale = scale
+
+    @classmethod
+    def from_units(cls, units: int, scale: int = DEFAULT_SCALE) -> "Money":
+        money = _new(cls)
+        money.units = units
+        money.scale = scale
+        return money
+
+    @classmethod
+    def sum(cls, amounts: Iterable["Money"], scale: int = DEFAULT_SCALE) -> "Money":
+        """Add up amounts as plain integers while they share a scale"""
+        total = 0
+        for amount in amounts:
+            if not isinstance(amount, Money):
+                amount = Money(amount, scale=scale)
+            if amount.scale == scale:
+                total += amount.units
+                continue
+
+            if amount.scale > scale:
+                total *= 10 ** (amount.scale - scale)
+                scale = amount.scale
+            total += amount.units_at(scale)
+        return cls.from_units(total, scale)
+
+    def units_at(self, scale: int, rounding: str = ROUNDING) -> int:
+        """The amount expressed in minor units of another scale"""
+        if scale >= self.scale:
+            return self.units * 10 ** (scale - self.scale)
+        value = Decimal(self.units).scaleb(scale - self.scale, _context)
+        return int(value.to_integral_value(rounding=rounding, context=_context))
+
+    def _align(self, other: Number) -> tuple[int, int, int]:
+        if not isinstance(other, Money):
+            other = Money(other, scale=self.scale)
+        scale = max(self.scale, other.scale)
+        return self.units_at(scale), other.units_at(scale), scale
+
+    def to_decimal(self) -> Decimal:
+        return Decimal(self.units).scaleb(-self.scale, _context)
+
+    def __add__(self, other: Number) -> "Money":
+        if type(other) is Money and other.scale == self.scale:
+            money = _new(Money)
+            money.units = self.units + other.units
+            money.scale = self.scale
+            return money
+        try:
+            units, other_units, scale = self._align(other)
+        except TypeError:
+            return NotImplemented
+        return Money.from_units(units + other_units, scale)
+
+    __radd__ = __add__
+
+    def __sub__(self, other: Number) -> "Money":
+        if type(other) is Money and other.scale == self.scale:
+            money = _new(Money)
+            money.units = self.units - other.units
+            money.scale = self.scale
+            return money
+        try:
+            units, other_units, scale = self._align(other)
+        except TypeError:
+            return NotImplemented
+        return Money.from_units(units - other_units, scale)
+
+    def __rsub__(self, other: Number) -> "Money":
+        return -self + other
+
+    def __neg__(self) -> "Money":
+        return Money.from_units(-self.units, self.scale)
+
+    def __pos__(self) -> "Money":
+        return self
+
+    def __abs__(self) -> "Money":
+        return Money.from_units(abs(self.units), self.scale)
+
+    def __mul__(self, factor: Union[Decimal, int, float]) -> "Money":
+        if isinstance(factor, int) and not isinstance(factor, bool):
+            return Money.from_units(self.units * factor, self.scale)
+        if isinstance(factor, (Decimal, float)):
+            if isinstance(factor, float):
+                factor = Decimal(repr(factor))
+            return Money(self.to_decimal() * factor, scale=self.scale)
+        return NotImplemented
+
+    __rmul__ = __mul__
+
+    def __truediv__(self, divisor: Union[Decimal, int, float]) -> "Money":
+        if isinstance(divisor, (Decimal, int, float)) and not isinstance(divisor, bool):
+            if isinstance(divisor, float):
+                divisor = Decimal(repr(divisor))
+            return Money(self.to_decimal() / Decimal(divisor), scale=self.scale)
+        return NotImplemented
+
+    def _compare(self, other: Number):
+        """Both values as integers that compare like them, else None
+
+        Nothing is rounded: Money of another scale is widened to the larger
+        one and plain numbers are compared through their exact ratio.
+        """
+        if type(other) is Money:
+            if other.scale == self.scale:
+                return self.units, other.units
+            scale = max(self.scale, other.scale)
+            return self.units_at(scale), other.units_at(scale)
+        # Strings would compare equal without hashing the same
+        if isinstance(other, bool) or not isinstance(other, (int, Decimal, float)):
+            return None
+        try:
+            numerator, denominator = other.as_integer_ratio()
+        except (ValueError, OverflowError, ArithmeticError):
+            return None
+        return self.units * denominator, numerator * 10**self.scale
+
+    def __eq__(self, other: object) -> bool:
+        aligned = self._compare(other)
+        if aligned is None:
+            return NotImplemented
+        return aligned[0] == aligned[1]
+
+    def __lt__(self, other: Number) -> bool:
+        aligned = self._compare(other)
+        if aligned is None:
+            return NotImplemented
+        return aligned[0] < aligned[1]
+
+    def __le__(self, other: Number) -> bool:
+        aligned = self._compare(other)
+        if aligned is None:
+            return NotImplemented
+        return aligned[0] <= aligned[1]
+
+    def __gt__(self, other: Number) -> bool:
+        aligned = self._compare(other)
+        if aligned is None:
+            return NotImplemented
+        return aligned[0] > aligned[1]
+
+    def __ge__(self, other: Number) -> bool:
+        aligned = self._compare(other)
+        if aligned is None:
+            return NotImplemented
+        return aligned[0] >= aligned[1]
+
+    def __hash__(self) -> int:
+        # Same hash as the equal Decimal and int values
+        return hash(self.to_decimal())
+
+    def __bool__(self) -> bool:
+        return self.units != 0
+
+    def __float__(self) -> float:
+        return self.units / 10**self.scale
+
+    def __str__(self) -> str:
+        return str(self.to_decimal())
+
+    def __repr__(self) -> str:
+        return f"Money('{self}')"
+
+    def __format__(self, format_spec: str) -> str:
+        return format(self.to_decimal(), format_spec)
+
+    def __reduce__(self):
+        return (Money.from_units, (self.units, self.scale))
+
+    @classmethod
+    def _validate(cls, value) -> "Money":
+        if isinstance(value, Money):
+            return value
+        try:
+            return cls(value)
+        except (TypeError, ArithmeticError) as error:
+            raise ValueError(f"Invalid amount of money: {value!r}") from error
+
+    @classmethod
+    def __get_pydantic_core_schema__(cls, source_type, handler):
+        # JSON takes numbers or numeric strings, read exactly as decimals
+        return core_schema.json_or_python_schema(
+            json_schema=core_schema.no_info_after_validator_function(
+                cls._validate, core_schema.decimal_schema()
+            ),
+            python_schema=core_schema.no_info_plain_validator_function(cls._validate),
+            serialization=core_schema.plain_serializer_function_ser_schema(
+                str, return_schema=core_schema.str_schema(), when_used="json"
+            ),
+        )
@@ -0,0 +1,264 @@
+from collections import defaultdict
+from typing import Callable, Iterable
+
+from . import instrumentation
+from .entities import Account, Book, Document, Entry, Transaction, new_uuids
+from .instrumentation import hooks, instrumented
+from .money import Money
+
+
+class PostingBatch:
+    """Transactions built with trusted construction and posted together
+
+    Postings are only collected until commit, which checks that every
+    transaction of the batch balances in a single pass over the amounts and
+    then applies them. Nothing is written to the accounts if any transaction
+    is unbalanced.
+    """
+
+    def __init__(self, book: Book):
+        self.book = book
+        self.transactions: list[Transaction] = []
+        self.documents: list[Document] = []
+        self.postings: list[tuple[int, Account, Money]] = []
+
+    def transaction(self, **values) -> Transaction:
+        transaction = Transaction.trusted(book=self.book, **values)
+        self.transactions.append(transaction)
+        return transaction
+
+    def document(self, transaction: Transaction, **values) -> Document:
+        document = Document.trusted(book=self.book, **values)
+        document.transactions.add(transaction)
+        transaction.documents.add(document)
+        self.documents.append(document)
+        return document
+
+    def post(self, postings: Iterable[tuple[Account, Money]]):
+        """Add postings to the last transaction of the batch"""
+        position = len(self.transactions) - 1
+        self.postings.extend(
+            (position, account, amount if isinstance(amount, Money) else Money(amount))
+            for account, amount in postings
+        )
+
+    @instrumented
+    def validate(self):
+        scale = max(
+            (amount.scale for _, _, amount in self.postings),
+            default=Money.DEFAULT_SCALE,
+        )
+        totals = [0] * len(self.transactions)
+        for position, _, amount in self.postings:
+            totals[position] += amount.units_at(scale)
+
+        unbalanced = [
+            self.transactions[position].description
+            for position, total in enumerate(totals)
+            if total != 0
+        ]
+        if unbalanced:
+            raise ValueError(f"Entries are unbalanced: {', '.join(unbalanced)}")
+
+    @instrumented
+    def commit(self):
+        self.validate()
+
+        unit_of_work = self.book.active_unit_of_work
+        if unit_of_work is not None:
+            self._stage(unit_of_work)
+            return
+
+        book = self.book
+        transactions = self.transactions
+        postings = self.postings
+        ledger = book.ledger
+        if ledger is not None:
+            # Stored first, so a failing ledger leaves the book as it was
+            ledger.extend(
+                (account, transactions[position], amount)
+                for position, account, amount in postings
+            )
+        book.transactions.update(
+            (transaction.uuid.hex, transaction) for transaction in transactions
+        )
+        book.documents.update(
+            (document.uuid.hex, document) for document in self.documents
+        )
+        book._state.post(transactions)
+        book._state.post(self.documents)
+
+        # Rows of every account, so that each account is updated once
+        rows: dict[int, tuple[Account, list]] = {}
+        if ledger is None:
+            trusted = book.entry_type.trusted
+            for (position, account, amount), uuid in zip(
+                postings, new_uuids(len(postings))
+            ):
+                transaction = transactions[position]
+                entry = trusted(
+                    uuid=uuid, amount=amount, account=account, transaction=transaction
+                )
+                key = uuid.hex
+                transaction.entries[key] = entry
+                group = rows.get(id(account))
+                if group is None:
+                    group = rows[id(account)] = (account, [])
+                group[1].append((transaction.date, entry, amount, key))
+        else:
+            for position, account, amount in postings:
+                group = rows.get(id(account))
+                if group is None:
+                    group = rows[id(account)] = (account, [])
+                group[1].append((transactions[position].date, None, amount, None))
+
+        for account, group in rows.values():
+            state = account._state
+            if ledger is None:
+                account.entries.update((row[3], row[1]) for row in group)
+                state.date_index.extend(row[:3] for row in group)
+            if state.rollup is not None:
+                for date, _, amount, _ in group:
+                    state.rollup.add(date, amount)
+            # Running totals are moved once per account instead of once per entry
+            account._apply_amount(Money.sum(row[2] for row in group))
+        book._state.version += 1
+        if hooks:
+            instrumentation.entries(len(postings))
+
+    def _stage(self, unit_of_work: "UnitOfWork"):
+        entry_type = self.book.entry_type
+        entries = defaultdict(list)
+        for position, account, amount in self.postings:
+            transaction = self.transactions[position]
+            entries[position].append(
+                entry_type.trusted(
+                    amount=amount, account=account, transaction=transaction
+                )
+            )
+
+        for position, transaction in enumerate(self.transactions):
+            unit_of_work.add_transaction(transaction)
+            unit_of_work.add_entries(transaction, entries[position], validated=True)
+        for document in self.documents:
+            unit_of_work.add_document(document)
+
+
+class UnitOfWork:
+    """Postings buffered until they can be applied to the book all at once
+
+    Entries, new transactions and document links are only recorded while the
+    unit of work is open. On commit each transaction is validated once, and
+    only when all of them balance are the entries attached to their accounts.
+    Use it through Book.unit_of_work().
+    """
+
+    def __init__(self, book: Book):
+        self.book = book
+        self.transactions: list[Transaction] = []
+        self.documents: list[Document] = []
+        self.unattached: dict[int, Entry] = {}
+        self.pending: dict[int, tuple[Transaction, list[Entry]]] = {}
+        self.links: list[tuple[Transaction, Document]] = []
+        self.callbacks: list[Callable[[], None]] = []
+        self.finalizers: list[Callable[[], None]] = []
+        self._new: set[int] = set()
+        self._validated: set[int] = set()
+
+    def add_transaction(self, transaction: Transaction):
+        self.transactions.append(transaction)
+        self._new.add(id(transaction))
+
+    def add_document(self, document: Document):
+        self.documents.append(document)
+
+    def add_entry(self, entry: Entry):
+        """Entry created on an account, waiting for a transaction to take it"""
+        self.unattached[id(entry)] = entry
+
+    def add_entries(
+        self, transaction: Transaction, entries: Iterable[Entry], validated=False
+    ):
+        _, pending = self.pending.setdefault(id(transaction), (transaction, []))
+        for entry in entries:
+            self.unattached.pop(id(entry), None)
+            pending.append(entry)
+        if validated:
+            self._validated.add(id(transaction))
+
+    def link(self, transaction: Transaction, document: Document):
+        self.links.append((transaction, document))
+
+    def on_commit(self, callback: Callable[[], None]):
+        """Run callback once the postings have been applied"""
+        self.callbacks.append(callback)
+
+    def after_commit(self, callback: Callable[[], None]):
+        """Run callback once, after every on_commit() callback"""
+        if callback not in self.finalizers:
+            self.finalizers.append(callback)
+
+    @instrumented
+    def validate(self):
+        ledger = self.book.ledger
+        for key, (transaction, entries) in self.pending.items():
+            if key in self._validated:
+                continue
+
+            total = Money.sum(entry.amount for entry in entries)
+            if key not in self._new:
+                total += Money.sum(
+                    entry.amount for entry in transaction.entries.values()
+                )
+                if ledger is not None:
+                    total += ledger.transaction_total(transaction)
+            if total != 0:
+                raise ValueError(f"Entries are unbalanced: {transaction.description}")
+
+    @instrumented
+    def commit(self):
+        self.validate()
+
+        ledger = self.book.ledger
+        if ledger is not None:
+            # Stored before anything else, so a failing ledger leaves the book
+            # as it was
+            ledger.extend(
+                (entry.account, transaction, entry.amount)
+                for transaction, entries in self.pending.values()
+                for entry in entries
+            )
+        for transaction in self.transactions:
+            self.book.add_transaction(transaction)
+        for document in self.documents:
+            self.book.add_document(document)
+
+        for entry in self.unattached.values():
+            entry.account._apply_entry(entry)
+
+        for transaction, entries in self.pending.values():
+            for entry in entries:
+                entry.transaction = transaction
+                account = entry.account
+                if ledger is None:
+                    transaction.entries.add(entry)
+                    account._apply_entry(entry)
+                    account._index_entry(entry)
+                else:
+                    account._apply_amount(entry.amount)
+                    account._roll_up(transaction.date, entry.amount)
+
+        for transaction, document in self.links:
+            transaction.documents.add(document)
+            document.transactions.add(transaction)
+        self.book._state.version += 1
+
+        if hooks and ledger is not None:
+            # The ledger takes these entries without applying them one by one
+            instrumentation.entries(
+                sum(len(entries) for _, entries in self.pending.values())
+            )
+        for callback in self.callbacks:
+            callback()
+        for callback in self.finalizers:
+            callback()
@@ -0,0 +1,407 @@
+from collections import defaultdict
+from datetime import date, datetime
+from heapq import merge
+from itertools import islice
+from typing import TYPE_CHECKING, Iterator, Optional, Union
+
+from .entities import Account, Book, Entry, Payee, Transaction
+from .index import MONTH, as_datetime, bucket_label
+from .ledger import ColumnarLedger, date_key, numpy
+from .money import Money
+
+if TYPE_CHECKING:
+    from .entities import Document
+
+ACCOUNT = "account"
+GROUPS = (ACCOUNT, MONTH)
+
+
+def _entry_date(entry: Entry) -> datetime:
+    return entry.transaction.date
+
+
+def _money(value) -> Optional[Money]:
+    if value is None or isinstance(value, Money):
+        return value
+    return Money(value)
+
+
+class Query:
+    """Lazy filter over the dated entries of a book
+
+    Filters return a new query and nothing is read until the query is
+    iterated or aggregated. The entries to look at are picked through the
+    indexes: documents by type and payee, then their transactions, or else
+    the date index of every account, narrowed to the date range. Books with
+    a columnar ledger are filtered over its columns instead, as NumPy masks
+    or else in a scan of the arrays, and their aggregates never build Entry
+    objects. A ledger with a select() method, like SQLiteLedger, is handed
+    the filters and answers the query and its aggregates itself.
+
+    Entries outside any transaction have no date and are never returned.
+    """
+
+    def __init__(self, book: Book, **filters):
+        self.book = book
+        self.accounts: Optional[tuple[Account, ...]] = filters.get("accounts")
+        self.start: Optional[datetime] = filters.get("start")
+        self.end: Optional[datetime] = filters.get("end")
+        self.payees: Optional[tuple[Union[Payee, str], ...]] = filters.get("payees")
+        self.types: Optional[tuple[str, ...]] = filters.get("types")
+        self.minimum: Optional[Money] = filters.get("minimum")
+        self.maximum: Optional[Money] = filters.get("maximum")
+        self._account_keys = (
+            {account.uuid.hex for account in self.accounts}
+            if self.accounts is not None
+            else None
+        )
+
+    def _with(self, **changes) -> "Query":
+        filters = {
+            name: getattr(self, name)
+            for name in (
+                "accounts",
+                "start",
+                "end",
+                "payees",
+                "types",
+                "minimum",
+                "maximum",
+            )
+        }
+        filters.update(changes)
+        return Query(self.book, **filters)
+
+    def account(self, *accounts: Union[Account, str]) -> "Query":
+        """Entries of any of the accounts, given as accounts or names"""
+        resolved = []
+        for account in accounts:
+            if isinstance(account, str):
+                found = self.book.accounts.by("name", account)
+                if not found:
+                    raise LookupError(f"There is no account {account}")
+                resolved.extend(found)
+            else:
+                resolved.append(account)
+        return self._with(accounts=tuple(resolved))
+
+    def between(
+        self, start: Optional[date] = None, end: Optional[date] = None
+    ) -> "Query":
+        """Entries dated between start and end, inclusive"""
+        return self._with(
+            start=as_datetime(start) if start else None,
+            end=as_datetime(end, end_of_day=True) if end else None,
+        )
+
+    def payee(self, *payees: Union[Payee, str]) -> "Query":
+        """Entries of transactions linked to a document of any of the payees
+
+        Payees are looked up in the document index; names are compared with
+        the payee of every candidate document, since the index is by uuid.
+        """
+        return self._with(payees=payees)
+
+    def document_type(self, *types: str) -> "Query":
+        """Entries of transactions linked to a document of any of the types"""
+        return self._with(types=types)
+
+    def amount(
+        self, minimum: Optional[Money] = None, maximum: Optional[Money] = None
+    ) -> "Query":
+        """Entries whose amount is between minimum and maximum, inclusive"""
+        return self._with(minimum=_money(minimum), maximum=_money(maximum))
+
+    def _documents(self) -> Iterator["Document"]:
+        documents = self.book.documents
+        names = {payee for payee in self.payees or () if isinstance(payee, str)}
+        uuids = {payee.uuid for payee in self.payees or () if isinstance(payee, Payee)}
+
+        if self.types is not None:
+            candidates = (
+                document
+                for type_ in self.types
+                for document in documents.by("type_", type_)
+            )
+        elif names:
+            candidates = documents.values()
+        else:
+            candidates = (
+                document
+                for payee in self.payees
+                for document in documents.by("payee", payee)
+            )
+
+        for document in candidates:
+            if self.payees is None:
+                yield document
+            elif document.payee is not None and (
+                document.payee.uuid in uuids or document.payee.name in names
+            ):
+                yield document
+
+    def _transactions(self) -> Optional[list[Transaction]]:
+        """Transactions the document filters leave, in date order, if any"""
+        if self.payees is None and self.types is None:
+            return None
+        transactions = {}
+        for document in self._documents():
+            for transaction in self.book.transactions_of(document).values():
+                transactions.setdefault(transaction.uuid.hex, transaction)
+        return sorted(transactions.values(), key=lambda transaction: transaction.date)
+
+    def _matches(self, entry: Entry) -> bool:
+        keys = self._account_keys
+        if keys is not None and entry.account.uuid.hex not in keys:
+            return False
+        when = entry.transaction.date
+        if (self.start is not None and when < self.start) or (
+            self.end is not None and when > self.end
+        ):
+            return False
+        if self.minimum is not None and entry.amount < self.minimum:
+            return False
+        if self.maximum is not None and entry.amount > self.maximum:
+            return False
+        return True
+
+    def _entries(self) -> Iterator[Entry]:
+        transactions = self._transactions()
+        if transactions is not None:
+            candidates = (
+                entry
+                for transaction in transactions
+                for entry in transaction.iter_entries()
+            )
+        else:
+            accounts = self.accounts or tuple(self.book.accounts.values())
+            start, end = self.start or datetime.min, self.end or datetime.max
+            candidates = merge(
+                *(
+                    account._state.date_index.entries_between(start, end)
+                    for account in accounts
+                ),
+                key=_entry_date,
+            )
+        return (entry for entry in candidates if self._matches(entry))
+
+    def _filters(self) -> dict:
+        """Filters in the terms of SQLiteLedger.select() and its aggregates"""
+        return {
+            "accounts": self.accounts,
+            "transactions": self._transactions(),
+            "start": self.start,
+            "end": self.end,
+            "minimum": self.minimum,
+            "maximum": self.maximum,
+        }
+
+    def _rows(self):
+        """Rows of a columnar ledger that match, in date order
+
+        A NumPy array when NumPy is installed, else a list from a scan over
+        the columns.
+        """
+        ledger = self.book.ledger
+        if numpy is None:
+            return self._scan_rows()
+        accounts, transactions, amounts, dates = ledger._columns()
+        mask = numpy.ones(len(amounts), dtype=bool)
+        if self.accounts is not None:
+            ids = [
+                ledger._account_ids.get(account.uuid.hex) for account in self.accounts
+            ]
+            mask &= numpy.isin(accounts, [key for key in ids if key is not None])
+        if self.start is not None:
+            mask &= dates >= date_key(self.start)
+        if self.end is not None:
+            mask &= dates <= date_key(self.end)
+        if self.minimum is not None:
+            mask &= amounts >= self.minimum.units_at(ledger.scale)
+        if self.maximum is not None:
+            mask &= amounts <= self.maximum.units_at(ledger.scale)
+        selected = self._transactions()
+        if selected is not None:
+            ids = [ledger._transaction_ids.get(key.uuid.hex) for key in selected]
+            mask &= numpy.isin(transactions, [key for key in ids if key is not None])
+        rows = numpy.flatnonzero(mask)
+        return rows[numpy.argsort(dates[rows], kind="stable")]
+
+    def _scan_rows(self) -> list[int]:
+        ledger = self.book.ledger
+        accounts = transactions = None
+        if self.accounts is not None:
+            accounts = {ledger._account_ids.get(key) for key in self._account_keys}
+        selected = self._transactions()
+        if selected is not None:
+            transactions = {
+                ledger._transaction_ids.get(transaction.uuid.hex)
+                for transaction in selected
+            }
+        start = date_key(self.start) if self.start is not None else None
+        end = date_key(self.end) if self.end is not None else None
+        minimum = maximum = None
+        if self.minimum is not None:
+            minimum = self.minimum.units_at(ledger.scale)
+        if self.maximum is not None:
+            maximum = self.maximum.units_at(ledger.scale)
+
+        rows = []
+        columns = ledger._rows(
+            ledger.account_ids, ledger.transaction_ids, ledger.amounts, ledger.dates
+        )
+        for row, (account, transaction, units, key) in enumerate(columns):
+            if accounts is not None and account not in accounts:
+                continue
+            if transactions is not None and transaction not in transactions:
+                continue
+            if (start is not None and key < start) or (end is not None and key > end):
+                continue
+            if (minimum is not None and units < minimum) or (
+                maximum is not None and units > maximum
+            ):
+                continue
+            rows.append(row)
+        # Stable, so rows of the same date keep the order they were stored in
+        rows.sort(key=ledger.dates.__getitem__)
+        return rows
+
+    @property
+    def _columnar(self) -> bool:
+        ledger = self.book.ledger
+        return isinstance(ledger, ColumnarLedger) and bool(ledger)
+
+    @property
+    def _selectable(self) -> bool:
+        """Whether the ledger filters and adds up entries itself, like SQLiteLedger"""
+        return hasattr(self.book.ledger, "select")
+
+    def __iter__(self) -> Iterator[Entry]:
+        ledger = self.book.ledger
+        if ledger is None:
+            return self._entries()
+        if self._columnar:
+            rows = self._rows()
+            return map(ledger._entry, rows if numpy is None else rows.tolist())
+        if self._selectable:
+            return ledger.select(**self._filters())
+        return self._ledger_entries(ordered=True)
+
+    def _ledger_entries(self, ordered: bool = False) -> Iterator[Entry]:
+        """Entries of any other ledger, in date order only if ordered
+
+        The ledger is read in a single pass, so only the entries that match
+        are kept, and only to sort them.
+        """
+        transactions = self._transactions()
+        if transactions is not None:
+            candidates = (
+                entry
+                for transaction in transactions
+                for entry in transaction.iter_entries()
+            )
+            ordered = False
+        else:
+            candidates = self.book.ledger.entries()
+        matches = (
+            entry
+            for entry in candidates
+            if entry.transaction is not None and self._matches(entry)
+        )
+        if ordered:
+            return iter(sorted(matches, key=_entry_date))
+        return matches
+
+    def _unordered(self) -> Iterator[Entry]:
+        """Matching entries in any order, for the aggregates"""
+        if self.book.ledger is not None and not self._selectable:
+            return self._ledger_entries()
+        return iter(self)
+
+    def page(self, number: int, size: int = 100) -> list[Entry]:
+        """Entries of the page, counting from 0"""
+        return list(islice(iter(self), number * size, (number + 1) * size))
+
+    def first(self) -> Optional[Entry]:
+        return next(iter(self), None)
+
+    def count(self) -> int:
+        if self._columnar:
+            return len(self._rows())
+        if self._selectable:
+            return self.book.ledger.select_count(**self._filters())
+        return sum(1 for _ in self._unordered())
+
+    def sum(self) -> Money:
+        ledger = self.book.ledger
+        if self._columnar:
+            rows = self._rows()
+            if numpy is None:
+                return ledger.from_units(sum(map(ledger.amounts.__getitem__, rows)))
+            _, _, units, _ = ledger._columns()
+            return ledger.from_units(int(units[rows].sum()))
+        if self._selectable:
+            return ledger.select_total(**self._filters())
+        return Money.sum(entry.amount for entry in self._unordered())
+
+    def group_by(self, group: str) -> dict[str, Money]:
+        """Total of the entries by account name or by month, like 2021-03"""
+        if group not in GROUPS:
+            raise ValueError(f"Cannot group entries by {group}")
+        if self._columnar:
+            return self._group_columns(group)
+        if self._selectable:
+            return self._group_selected(group)
+
+        totals = defaultdict(Money)
+        for entry in self._unordered():
+            if group == ACCOUNT:
+                key = entry.account.name
+            else:
+                key = bucket_label(MONTH, entry.transaction.date)
+            totals[key] += entry.amount
+        return dict(totals)
+
+    def _group_selected(self, group: str) -> dict[str, Money]:
+        totals = self.book.ledger.select_totals(group, **self._filters())
+        if group != ACCOUNT:
+            return totals
+        result = defaultdict(Money)
+        for key, total in totals.items():
+            result[self.book.accounts[key].name] += total
+        return dict(result)
+
+    def _group_columns(self, group: str) -> dict[str, Money]:
+        ledger = self.book.ledger
+        if numpy is None:
+            units = defaultdict(int)
+            for row in self._scan_rows():
+                if group == ACCOUNT:
+                    key = ledger.account_ids[row]
+                else:
+                    day = date.fromordinal(ledger.dates[row] // 86400)
+                    key = (day.year - 1970) * 12 + day.month - 1
+                units[key] += ledger.amounts[row]
+            groups = units.items()
+        else:
+            accounts, _, amounts, dates = ledger._columns()
+            rows = self._rows()
+            if group == ACCOUNT:
+                keys = accounts[rows]
+            else:
+                # Days since 0001-01-01 to months since 1970-01
+                days = dates[rows] // 86400 - date(1970, 1, 1).toordinal()
+                keys = days.astype("datetime64[D]").astype("datetime64[M]").astype(int)
+            found, positions = numpy.unique(keys, return_inverse=True)
+            totals = numpy.zeros(len(found), dtype=numpy.int64)
+            numpy.add.at(totals, positions, amounts[rows])
+            groups = zip(found.tolist(), totals.tolist())
+
+        result = {}
+        for key, units in groups:
+            if group == ACCOUNT:
+                label = ledger._accounts[key].name
+            else:
+                label = f"{1970 + key // 12}-{key % 12 + 1:02}"
+            result[label] = result.get(label, Money(0)) + ledger.from_units(units)
+        return result
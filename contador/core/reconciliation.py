@@ -0,0 +1,198 @@
+from collections import defaultdict
+from datetime import datetime
+from typing import Iterable, Optional
+
+from pydantic import BaseModel
+
+from .entities import Account, Entry
+from .money import Money
+
+
+class StatementLine(BaseModel):
+    date: datetime
+    # Money in is positive, as a debit to the bank account
+    amount: Money
+    reference: Optional[str] = None
+    description: str = ""
+
+
+class Match(BaseModel):
+    line: StatementLine
+    entry: Entry
+    # Same amount and day, as opposed to a match within the tolerances
+    exact: bool
+
+
+class ReconciliationReport(BaseModel):
+    matches: list[Match] = []
+    unmatched_lines: list[StatementLine] = []
+    unmatched_entries: list[Entry] = []
+
+    @property
+    def is_complete(self) -> bool:
+        return not self.unmatched_lines and not self.unmatched_entries
+
+
+# A statement line or an entry as (amount in minor units, day ordinal, position)
+Key = tuple[int, int, int]
+
+
+class Reconciler:
+    """Match statement lines to the dated entries of a bank account
+
+    Matching runs in passes that each take what the previous one left:
+
+    - a hash join on the exact amount and day;
+    - for each amount, lines and entries sorted by day and merged, pairing
+      those no more than days apart;
+    - with an amount tolerance, lines and entries sorted by amount and swept
+      together, pairing those within both tolerances.
+
+    The first two passes are a hash join and a sort-merge, so they run in
+    O(n log n) whatever the number of lines and entries; the last one only
+    looks at the window of amounts around each line it has left. Matched
+    entries are marked as reconciled and left out of later runs.
+    """
+
+    def __init__(self, account: Account):
+        self.account = account
+        # Statement line of every reconciled entry, by entry uuid hex
+        self.reconciled: dict[str, StatementLine] = {}
+
+    def is_reconciled(self, entry: Entry) -> bool:
+        return entry.uuid.hex in self.reconciled
+
+    def unreconciled(self) -> list[Entry]:
+        """Dated entries of the account that are not reconciled yet"""
+        return [
+            entry
+            for entry in self.account.iter_entries()
+            if entry.transaction is not None and not self.is_reconciled(entry)
+        ]
+
+    def reconcile(
+        self,
+        lines: Iterable[StatementLine],
+        days: int = 3,
+        amount_tolerance: Money = Money(0),
+    ) -> ReconciliationReport:
+        """Match lines to unreconciled entries and mark the matched entries"""
+        lines = list(lines)
+        entries = self.unreconciled()
+        scale = max(
+            (item.amount.scale for item in [*lines, *entries]),
+            default=Money.DEFAULT_SCALE,
+        )
+        line_keys = [
+            (line.amount.units_at(scale), line.date.toordinal(), position)
+            for position, line in enumerate(lines)
+        ]
+        entry_keys = [
+            (entry.amount.units_at(scale), entry.transaction.date.toordinal(), position)
+            for position, entry in enumerate(entries)
+        ]
+
+        pairs, line_keys, entry_keys = _exact(line_keys, entry_keys)
+        matches = [(pair, True) for pair in pairs]
+        pairs, line_keys, entry_keys = _by_amount(line_keys, entry_keys, days)
+        matches += [(pair, False) for pair in pairs]
+        tolerance = Money(amount_tolerance).units_at(scale)
+        if tolerance > 0:
+            pairs, line_keys, entry_keys = _within(
+                line_keys, entry_keys, days, tolerance
+            )
+            matches += [(pair, False) for pair in pairs]
+
+        report = ReconciliationReport()
+        for (line, entry), exact in matches:
+            match = Match.model_construct(
+                line=lines[line], entry=entries[entry], exact=exact
+            )
+            report.matches.append(match)
+            self.reconciled[entries[entry].uuid.hex] = lines[line]
+        report.unmatched_lines = [lines[key[2]] for key in sorted(line_keys)]
+        report.unmatched_entries = [entries[key[2]] for key in sorted(entry_keys)]
+        return report
+
+
+def _exact(
+    lines: list[Key], entries: list[Key]
+) -> tuple[list[tuple[int, int]], list[Key], list[Key]]:
+    """Hash join on amount and day, pairing equal keys in order"""
+    buckets = defaultdict(list)
+    for key in reversed(entries):
+        buckets[key[:2]].append(key)
+    pairs = []
+    unmatched = []
+    for key in lines:
+        bucket = buckets.get(key[:2])
+        if bucket:
+            pairs.append((key[2], bucket.pop()[2]))
+        else:
+            unmatched.append(key)
+    left = [key for bucket in buckets.values() for key in bucket]
+    return pairs, unmatched, left
+
+
+def _by_amount(
+    lines: list[Key], entries: list[Key], days: int
+) -> tuple[list[tuple[int, int]], list[Key], list[Key]]:
+    """Merge lines and entries of the same amount in day order
+
+    Pairing the earliest line with the earliest entry in reach gives the
+    largest number of pairs when every line reaches the same number of days.
+    """
+    lines, entries = sorted(lines), sorted(entries)
+    pairs, unmatched_lines, unmatched_entries = [], [], []
+    i = j = 0
+    while i < len(lines) and j < len(entries):
+        line, entry = lines[i], entries[j]
+        if entry[0] < line[0] or (entry[0] == line[0] and entry[1] < line[1] - days):
+            unmatched_entries.append(entry)
+            j += 1
+        elif line[0] < entry[0] or line[1] < entry[1] - days:
+            unmatched_lines.append(line)
+            i += 1
+        else:
+            pairs.append((line[2], entry[2]))
+            i += 1
+            j += 1
+    unmatched_lines += lines[i:]
+    unmatched_entries += entries[j:]
+    return pairs, unmatched_lines, unmatched_entries
+
+
+def _within(
+    lines: list[Key], entries: list[Key], days: int, tolerance: int
+) -> tuple[list[tuple[int, int]], list[Key], list[Key]]:
+    """Sweep lines and entries sorted by amount, within both tolerances
+
+    Each line takes the closest unmatched entry in the window of amounts
+    around it whose day is in reach, preferring the smaller amount difference.
+    """
+    lines, entries = sorted(lines), sorted(entries)
+    taken = [False] * len(entries)
+    pairs, unmatched_lines = [], []
+    start = 0
+    for line in lines:
+        while start < len(entries) and (
+            taken[start] or entries[start][0] < line[0] - tolerance
+        ):
+            start += 1
+        best = None
+        for position in range(start, len(entries)):
+            entry = entries[position]
+            if entry[0] > line[0] + tolerance:
+                break
+            if taken[position] or abs(entry[1] - line[1]) > days:
+                continue
+            distance = (abs(entry[0] - line[0]), abs(entry[1] - line[1]))
+            if best is None or distance < best[0]:
+                best = (distance, position)
+        if best is None:
+            unmatched_lines.append(line)
+            continue
+        taken[best[1]] = True
+        pairs.append((line[2], entries[best[1]][2]))
+    unmatched_entries = [key for key, done in zip(entries, taken) if not done]
+    return pairs, unmatched_lines, unmatched_entries
@@ -0,0 +1,234 @@
+from collections import defaultdict
+from datetime import datetime
+from typing import Iterable, Iterator, Mapping, Optional
+from uuid import UUID
+
+from pydantic import BaseModel
+
+from .accounting import ASSET, EQUITY, EXPENSE, INCOME, LIABILITY, ChartOfAccounts
+from .entities import Account, Book, Transaction
+from .index import as_datetime
+from .instrumentation import instrumented
+from .money import Money
+
+
+class AccountTotal(BaseModel):
+    uuid: UUID
+    name: str
+    type_: Optional[str] = None
+    balance: Money
+
+    @property
+    def debit(self) -> Money:
+        return self.balance if self.balance > 0 else Money(0)
+
+    @property
+    def credit(self) -> Money:
+        return -self.balance if self.balance < 0 else Money(0)
+
+
+class TrialBalance(BaseModel):
+    as_of: Optional[datetime] = None
+    lines: list[AccountTotal]
+
+    @property
+    def total_debit(self) -> Money:
+        return Money.sum(line.debit for line in self.lines)
+
+    @property
+    def total_credit(self) -> Money:
+        return Money.sum(line.credit for line in self.lines)
+
+    @property
+    def is_balanced(self) -> bool:
+        return self.total_debit == self.total_credit
+
+
+class IncomeStatement(BaseModel):
+    start: Optional[datetime] = None
+    end: Optional[datetime] = None
+    income: list[AccountTotal]
+    expenses: list[AccountTotal]
+
+    @property
+    def total_income(self) -> Money:
+        return -Money.sum(line.balance for line in self.income)
+
+    @property
+    def total_expenses(self) -> Money:
+        return Money.sum(line.balance for line in self.expenses)
+
+    @property
+    def net_income(self) -> Money:
+        return self.total_income - self.total_expenses
+
+
+class BalanceSheet(BaseModel):
+    as_of: Optional[datetime] = None
+    assets: list[AccountTotal]
+    liabilities: list[AccountTotal]
+    equity: list[AccountTotal]
+    # Income and expenses not yet closed into an equity account
+    net_income: Money
+
+    @property
+    def total_assets(self) -> Money:
+        return Money.sum(line.balance for line in self.assets)
+
+    @property
+    def total_liabilities(self) -> Money:
+        return -Money.sum(line.balance for line in self.liabilities)
+
+    @property
+    def total_equity(self) -> Money:
+        return self.net_income - Money.sum(line.balance for line in self.equity)
+
+    @property
+    def is_balanced(self) -> bool:
+        return self.total_assets == self.total_liabilities + self.total_equity
+
+
+class PeriodTotal(BaseModel):
+    name: str
+    period: str
+    total: Money
+
+
+def totals_from_transactions(
+    transactions: Iterable[Transaction], as_of: Optional[datetime.date] = None
+) -> dict[str, Money]:
+    """Entries total per account uuid hex from a single pass over transactions
+
+    For transaction sources that have no maintained aggregates, such as a
+    stream read back from storage. Initial balances are not included.
+    """
+    end = as_datetime(as_of, end_of_day=True) if as_of else None
+    totals = defaultdict(Money)
+    for transaction in transactions:
+        if end is not None and transaction.date > end:
+            continue
+        for entry in transaction.iter_entries():
+            totals[entry.account.uuid.hex] += entry.amount
+    return dict(totals)
+
+
+class ReportEngine:
+    """Trial balance and financial statements for a book
+
+    Balances come from the aggregates the accounts already maintain, so a
+    report costs one step per account whatever the number of entries. Dated
+    reports use the date indexes, or a single reduction over the columnar
+    ledger when the book has one.
+    """
+
+    def __init__(self, book: Book, account_types: Optional[Mapping[str, str]] = None):
+        self.book = book
+        self.account_types = account_types or ChartOfAccounts.ACCOUNT_TYPES
+
+    def account_type(self, account: Account) -> Optional[str]:
+        """Type of the account, or of its closest ancestor that has one"""
+        for node in [account, *account.ancestors()]:
+            if node.name in self.account_types:
+                return self.account_types[node.name]
+        return None
+
+    def _total(self, account: Account, balance: Money) -> AccountTotal:
+        return AccountTotal(
+            uuid=account.uuid,
+            name=account.name,
+            type_=self.account_type(account),
+            balance=balance,
+        )
+
+    @instrumented
+    def account_totals(
+        self,
+        as_of: Optional[datetime.date] = None,
+        start: Optional[datetime.date] = None,
+    ) -> Iterator[AccountTotal]:
+        """Stream the balance of every account, one account at a time
+
+        With start, the movement between start and as_of is given instead of
+        the balance.
+        """
+        accounts = self.book.accounts.values()
+        dated = as_of is not None or start is not None
+
+        if dated and self.book.ledger is not None:
+            totals = self.book.ledger.totals_by_account(start, as_of)
+            for account in accounts:
+                total = totals.get(account.uuid.hex, Money(0))
+                if start is None:
+                    total += account.initial_balance
+                yield self._total(account, total)
+            return
+
+        for account in accounts:
+            if start is not None:
+                balance = account.balance_between(start, as_of or datetime.max)
+            elif as_of is not None:
+                balance = account.balance_as_of(as_of)
+            else:
+                balance = account.balance
+            yield self._total(account, balance)
+
+    @instrumented
+    def trial_balance(self, as_of: Optional[datetime.date] = None) -> TrialBalance:
+        as_of = as_datetime(as_of, end_of_day=True) if as_of else None
+        return TrialBalance(as_of=as_of, lines=list(self.account_totals(as_of)))
+
+    @instrumented
+    def income_statement(
+        self,
+        start: Optional[datetime.date] = None,
+        end: Optional[datetime.date] = None,
+    ) -> IncomeStatement:
+        start = as_datetime(start) if start else None
+        end = as_datetime(end, end_of_day=True) if end else None
+        groups = defaultdict(list)
+        for total in self.account_totals(as_of=end, start=start):
+            groups[total.type_].append(total)
+        return IncomeStatement(
+            start=start, end=end, income=groups[INCOME], expenses=groups[EXPENSE]
+        )
+
+    @instrumented
+    def balance_sheet(self, as_of: Optional[datetime.date] = None) -> BalanceSheet:
+        as_of = as_datetime(as_of, end_of_day=True) if as_of else None
+        groups = defaultdict(list)
+        for total in self.account_totals(as_of):
+            groups[total.type_].append(total)
+
+        net_income = -Money.sum(
+            total.balance for total in groups[INCOME] + groups[EXPENSE]
+        )
+        return BalanceSheet(
+            as_of=as_of,
+            assets=groups[ASSET],
+            liabilities=groups[LIABILITY],
+            equity=groups[EQUITY],
+            net_income=net_income,
+        )
+
+    @instrumented
+    def period_totals(
+        self,
+        unit: str,
+        start: datetime.date,
+        end: datetime.date,
+        names: Optional[Iterable[str]] = None,
+    ) -> list[PeriodTotal]:
+        """Net movement of accounts for every day, month or quarter in a range
+
+        Read from the account rollups, so it costs a few lookups per period
+        rather than a pass over the entries. names restricts the accounts.
+        """
+        if names is None:
+            accounts = list(self.book.accounts.values())
+        else:
+            accounts = [self.book.accounts.first("name", name) for name in names]
+        return [
+            PeriodTotal(name=account.name, period=period, total=total)
+            for account in accounts
+            for period, total in account.rollup.series(unit, start, end).items()
+        ]
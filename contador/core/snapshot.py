@@ -0,0 +1,200 @@
+from datetime import datetime
+from typing import Any, Iterator, NoReturn, Optional
+from uuid import UUID
+
+from pydantic import ConfigDict
+
+from .entities import (
+    Account,
+    Book,
+    CollectionType,
+    Document,
+    Entity,
+    EntityType,
+    Entry,
+    Transaction,
+)
+from .ledger import ColumnarLedger
+from .money import Money
+
+
+def _read_only(*args, **kwargs) -> NoReturn:
+    raise TypeError("A book snapshot is read-only")
+
+
+class Posted:
+    """Whether an entity was posted to a book when a snapshot was taken
+
+    Compares the number the book gave the entity when it was posted, see
+    BookState.posted, with the count at the snapshot. Entities without a
+    number were put in the book some other way, e.g. loaded, and count as
+    posted before any snapshot.
+    """
+
+    __slots__ = ("numbers", "limit")
+
+    def __init__(self, numbers: dict[UUID, int]):
+        self.numbers = numbers
+        self.limit = len(numbers)
+
+    def __call__(self, entity: Entity) -> bool:
+        return self.numbers.get(entity.uuid, -1) < self.limit
+
+
+class PostedCollection(CollectionType[EntityType]):
+    """The entities of a live collection that a snapshot sees, read-only
+
+    Lookups go to the live collection and leave out what was posted after
+    the snapshot. The first walk takes the live entities in one step and
+    keeps the ones seen, so it is safe while the writer adds to them.
+    """
+
+    def __init__(self, live: CollectionType[EntityType], posted: Posted):
+        super().__init__()
+        self._live = live
+        self._posted = posted
+        self._seen: Optional[dict[str, EntityType]] = None
+
+    @property
+    def indexes(self) -> dict:
+        return self._live.indexes
+
+    def _entities(self) -> dict[str, EntityType]:
+        if self._seen is None:
+            posted = self._posted
+            self._seen = {
+                key: entity
+                for key, entity in list(self._live.items())
+                if posted(entity)
+            }
+        return self._seen
+
+    def get(self, key: str, default: EntityType = None) -> Optional[EntityType]:
+        entity = self._live.get(key)
+        if entity is None or not self._posted(entity):
+            return default
+        return entity
+
+    def __getitem__(self, key: str) -> EntityType:
+        entity = self.get(key)
+        if entity is None:
+            raise KeyError(key)
+        return entity
+
+    def __contains__(self, key: object) -> bool:
+        return self.get(key) is not None
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._entities())
+
+    def __len__(self) -> int:
+        return len(self._entities())
+
+    def keys(self):
+        return self._entities().keys()
+
+    def values(self):
+        return self._entities().values()
+
+    def items(self):
+        return self._entities().items()
+
+    def by(self, name: str, value: Any) -> list[EntityType]:
+        return [entity for entity in self._live.by(name, value) if self._posted(entity)]
+
+    def first(self, name: str, value: Any) -> Optional[EntityType]:
+        return next(iter(self.by(name, value)), None)
+
+    __setitem__ = __delitem__ = pop = popitem = clear = update = _read_only
+    setdefault = add = remove = reindex = _read_only
+
+
+class AccountSnapshot(Account):
+    """An account as it was when its book snapshot was taken
+
+    Shares the date index lists of the live account, up to their length at
+    that point. Entries outside any transaction count in the balance but are
+    not listed.
+    """
+
+    model_config = ConfigDict(frozen=True)
+
+    def iter_entries(self) -> Iterator[Entry]:
+        yield from self._state.date_index.entries_between(datetime.min, datetime.max)
+        if self._ledger is not None:
+            yield from self._ledger.entries(account=self)
+
+    def _sum_entries(self) -> Money:
+        # There is nothing left to drift from
+        return self._state.entries_total
+
+    add_entry = credit = debit = move_to = _read_only
+    _apply_amount = _apply_entry = _index_entry = _push = _read_only
+
+
+class BookSnapshot(Book):
+    """Read-only view of a book at one version, see Book.snapshot()
+
+    Accounts, balances and entries are frozen. Transactions and documents
+    are shared with the live book, behind PostedCollection views that leave
+    out the ones posted after the snapshot. Links between them are seen the
+    same way through transactions_of() and documents_of(); the collections
+    on the entities themselves are the live ones.
+    """
+
+    model_config = ConfigDict(frozen=True)
+
+    # The Posted check of the snapshot is _posted, set by snapshot()
+
+    def transactions_of(self, document: Document) -> CollectionType[Transaction]:
+        return PostedCollection(document.transactions, self._posted)
+
+    def documents_of(self, transaction: Transaction) -> CollectionType[Document]:
+        return PostedCollection(transaction.documents, self._posted)
+
+    use_ledger = use_columnar_ledger = close_period = _read_only
+    add_account = add_document = add_transaction = unit_of_work = _read_only
+
+
+def snapshot(book: Book) -> BookSnapshot:
+    """Take a snapshot of book, see Book.snapshot()"""
+    ledger = book.ledger.snapshot() if book.ledger is not None else None
+    posted = Posted(book._state.posted)
+    view = BookSnapshot.trusted(
+        uuid=book.uuid,
+        name=book.name,
+        period=book.period,
+        accounts=CollectionType(indexes=book.accounts.indexes),
+        transactions=PostedCollection(book.transactions, posted),
+        documents=PostedCollection(book.documents, posted),
+    )
+    view.__dict__["_posted"] = posted
+    view._state.ledger = ledger
+    view._state.version = book.version
+
+    accounts = {}
+    for key, account in book.accounts.items():
+        accounts[key] = frozen = AccountSnapshot.trusted(
+            uuid=account.uuid,
+            name=account.name,
+            initial_balance=account.initial_balance,
+            book=view,
+        )
+        state, live = frozen._state, account._state
+        state.entries_total = live.entries_total
+        state.descendants_total = live.descendants_total
+        state.date_index = live.date_index.snapshot()
+    for key, account in book.accounts.items():
+        frozen = accounts[key]
+        if account.parent is not None:
+            parent = accounts[account.parent.uuid.hex]
+            frozen.__dict__["parent"] = parent
+            parent.children[key] = frozen
+        view.accounts[key] = frozen
+
+    if isinstance(ledger, ColumnarLedger):
+        # Entries built by the ledger refer to the snapshot accounts
+        ledger._accounts = [
+            accounts.get(account.uuid.hex, account) for account in ledger._accounts
+        ]
+    return view
@@ -0,0 +1,504 @@
+from bisect import bisect_left, insort
+from datetime import datetime
+from heapq import heapify, heappop, heappush, nlargest
+from itertools import count
+from operator import itemgetter
+from typing import Iterable, Iterator, NoReturn, Optional, Sequence
+
+from pydantic import BaseModel
+
+from .entities import Document, Payee, Transaction, trusted_model
+from .index import REMOVED, LayeredMap, as_datetime
+from .money import Money
+
+PAYABLE = "payable"
+RECEIVABLE = "receivable"
+SALARIES = "salaries"
+KINDS = (PAYABLE, RECEIVABLE, SALARIES)
+BROUGHT_FORWARD = "Balance brought forward"
+
+
+def _read_only(*args, **kwargs) -> NoReturn:
+    raise TypeError("A subledger snapshot is read-only")
+
+
+class OpenItem(BaseModel):
+    document: Document
+    kind: str
+    outstanding: Money
+
+    @property
+    def is_clear(self) -> bool:
+        return self.outstanding <= 0
+
+
+class OpenItems:
+    """Outstanding payable or receivable amount of every invoice
+
+    Invoices are opened for their full amount when they are posted and
+    payments are allocated to them in the order given, so checking an invoice
+    is a dictionary lookup. Cleared invoices are dropped from the open set,
+    which keeps open_invoices() and aging proportional to what is still owed.
+    """
+
+    def __init__(self):
+        self._items: dict[str, OpenItem] = {}
+        self._open: dict[str, dict[str, OpenItem]] = {PAYABLE: {}, RECEIVABLE: {}}
+        # Open items of the last snapshot, and the items changed since
+        self._published: Optional[dict[str, LayeredMap[str, OpenItem]]] = None
+        self._changed: dict[str, OpenItem] = {}
+
+    def __contains__(self, document: Document) -> bool:
+        return document.uuid.hex in self._items
+
+    def get(self, document: Document) -> Optional[OpenItem]:
+        return self._items.get(document.uuid.hex)
+
+    def _update(self, item: OpenItem, outstanding: Money):
+        item.outstanding = outstanding
+        key = item.document.uuid.hex
+        if self._published is not None:
+            self._changed[key] = item
+        if item.is_clear:
+            self._open[item.kind].pop(key, None)
+        else:
+            self._open[item.kind][key] = item
+
+    def open(self, document: Document, kind: str, amount: Money) -> OpenItem:
+        # Built from values that are already validated
+        item = trusted_model(
+            OpenItem, {"document": document, "kind": kind, "outstanding": Money(0)}
+        )
+        self._items[document.uuid.hex] = item
+        self._update(item, amount)
+        return item
+
+    def open_many(self, items: Iterable[tuple[Document, str, Money]]):
+        """Open many documents at once, as (document, kind, amount) rows"""
+        all_items = self._items
+        changed = self._changed if self._published is not None else {}
+        for document, kind, amount in items:
+            key = document.uuid.hex
+            item = all_items[key] = changed[key] = trusted_model(
+                OpenItem, {"document": document, "kind": kind, "outstanding": amount}
+            )
+            if item.is_clear:
+                self._open[kind].pop(key, None)
+            else:
+                self._open[kind][key] = item
+
+    def settle(
+        self, documents: Sequence[Document], amount: Money
+    ) -> list[tuple[Document, Money]]:
+        """Allocate a payment to documents in order, up to what each one owes
+
+        Whatever is left after the last document is applied to it as well, so
+        an overpayment shows as a negative outstanding amount. Returns the
+        amount applied to each tracked document.
+        """
+        items = [item for item in map(self.get, documents) if item is not None]
+        allocations = []
+        for position, item in enumerate(items):
+            last = position == len(items) - 1
+            applied = amount if last else min(amount, max(item.outstanding, Money(0)))
+            self._update(item, item.outstanding - applied)
+            allocations.append((item.document, applied))
+            amount -= applied
+        return allocations
+
+    def snapshot(self) -> "OpenItems":
+        """Read-only copy of the items that are still open, as they are now
+
+        The first one copies every open item. Later ones copy the items
+        changed since the one before and stack them on it, see LayeredMap.
+        Cleared items are left out, so the copy does not track them.
+        """
+        published = self._published
+        if published is None:
+            published = {
+                kind: LayeredMap(
+                    {key: item.model_copy() for key, item in items.items()}
+                )
+                for kind, items in self._open.items()
+            }
+        elif self._changed:
+            changes = {kind: {} for kind in published}
+            for key, item in self._changed.items():
+                # An item opened again may have changed kind
+                for kind in changes:
+                    changes[kind][key] = REMOVED
+                if not item.is_clear:
+                    changes[item.kind][key] = item.model_copy()
+            published = {
+                kind: published[kind].changed(changes[kind]) for kind in published
+            }
+        self._published = published
+        self._changed = {}
+        return OpenItemsSnapshot(published)
+
+    def outstanding(self, document: Document) -> Optional[Money]:
+        item = self.get(document)
+        return item.outstanding if item else None
+
+    def is_clear(self, document: Document) -> Optional[bool]:
+        """Whether the document is settled, or None if it is not tracked here"""
+        item = self.get(document)
+        return item.is_clear if item else None
+
+    def items(self, kind: Optional[str] = None) -> Iterator[OpenItem]:
+        """Items that are not cleared yet"""
+        kinds = [kind] if kind else [PAYABLE, RECEIVABLE]
+        for kind in kinds:
+            yield from list(self._open[kind].values())
+
+    def open_invoices(self, kind: Optional[str] = None) -> Iterator[Document]:
+        for item in self.items(kind):
+            yield item.document
+
+    def total(self, kind: str) -> Money:
+        return Money.sum(item.outstanding for item in self._open[kind].values())
+
+    def aging(
+        self,
+        kind: str,
+        as_of: datetime.date,
+        buckets: Iterable[int] = (30, 60, 90),
+    ) -> dict[str, Money]:
+        """Outstanding amounts grouped by how many days old the invoice is"""
+        limits = sorted(buckets)
+        labels = []
+        low = 0
+        for limit in limits:
+            labels.append(f"{low}-{limit}")
+            low = limit + 1
+        labels.append(f"{low}+")
+
+        as_of = as_datetime(as_of, end_of_day=True)
+        totals = {label: Money(0) for label in labels}
+        for item in self._open[kind].values():
+            age = (as_of - item.document.date).days
+            totals[labels[bisect_left(limits, age)]] += item.outstanding
+        return totals
+
+
+class OpenItemsSnapshot(OpenItems):
+    """Open items as they were when the snapshot was taken, read-only"""
+
+    def __init__(self, items: dict[str, LayeredMap[str, OpenItem]]):
+        self._open = items
+
+    def __contains__(self, document: Document) -> bool:
+        return self.get(document) is not None
+
+    def get(self, document: Document) -> Optional[OpenItem]:
+        key = document.uuid.hex
+        for items in self._open.values():
+            item = items.get(key)
+            if item is not None:
+                return item
+        return None
+
+    def snapshot(self) -> "OpenItems":
+        return self
+
+    open = open_many = settle = _update = _read_only
+
+
+class PayeePosting(BaseModel):
+    """A change to what is owed to or by a payee
+
+    Amounts add to the outstanding balance of their kind: an invoice or a
+    registered salary is positive, a payment negative.
+    """
+
+    date: datetime
+    kind: str
+    amount: Money
+    description: str
+    transaction: Optional[Transaction] = None
+    document: Optional[Document] = None
+
+
+def _posting_date(posting: PayeePosting) -> datetime:
+    return posting.date
+
+
+class PayeeStatementLine(BaseModel):
+    posting: PayeePosting
+    # Outstanding balance of the kinds in the statement after the posting
+    balance: Money
+
+
+class PayeeLedger:
+    """Postings and outstanding balances of every payee
+
+    Manager operations post here as they commit, so a payee statement reads
+    the postings of that payee only, in date order, and a balance is a
+    dictionary lookup. Each kind keeps a max-heap of balances in which
+    outdated ones are skipped and dropped as they surface, so the payees
+    that owe or are owed the most are found without a pass over all of them.
+    """
+
+    def __init__(self):
+        self._payees: dict[str, Payee] = {}
+        self._postings: dict[str, list[PayeePosting]] = {}
+        self._balances: dict[str, dict[str, Money]] = {kind: {} for kind in KINDS}
+        self._heaps: dict[str, list] = {kind: [] for kind in KINDS}
+        # Serial of the latest heap entry of every balance
+        self._serials: dict[str, dict[str, int]] = {kind: {} for kind in KINDS}
+        self._serial = count()
+        # Payees, postings and balances of the last snapshot, and the payees
+        # whose postings changed since
+        self._published: Optional[tuple[LayeredMap, LayeredMap, dict]] = None
+        self._changed: set[str] = set()
+
+    def __contains__(self, payee: Payee) -> bool:
+        return payee.uuid.hex in self._payees
+
+    def payees(self) -> Iterator[Payee]:
+        return iter(list(self._payees.values()))
+
+    def post(
+        self,
+        payee: Payee,
+        kind: str,
+        amount: Money,
+        date: datetime.date,
+        description: str,
+        transaction: Optional[Transaction] = None,
+        document: Optional[Document] = None,
+    ) -> PayeePosting:
+        if kind not in KINDS:
+            raise ValueError(f"Unknown payee balance {kind}")
+        posting = PayeePosting(
+            date=date,
+            kind=kind,
+            amount=amount,
+            description=description,
+            transaction=transaction,
+            document=document,
+        )
+        key = payee.uuid.hex
+        self._payees.setdefault(key, payee)
+        postings = self._postings.setdefault(key, [])
+        if postings and posting.date < postings[-1].date:
+            # Sorted into a new list, as snapshots share the old one
+            postings = self._postings[key] = postings.copy()
+            insort(postings, posting, key=_posting_date)
+        else:
+            postings.append(posting)
+        if self._published is not None:
+            self._changed.add(key)
+        self._move(kind, key, posting.amount)
+        return posting
+
+    def post_many(
+        self,
+        postings: Iterable[
+            tuple[Payee, str, Money, datetime, str, Transaction, Optional[Document]]
+        ],
+    ):
+        """Post many validated rows at once, in the order of post()'s arguments
+
+        Each balance is moved once, whatever the number of its postings.
+        """
+        changed: dict[tuple[str, str], Money] = {}
+        added: dict[str, list[PayeePosting]] = {}
+        for payee, kind, amount, date, description, transaction, document in postings:
+            if kind not in KINDS:
+                raise ValueError(f"Unknown payee balance {kind}")
+            key = payee.uuid.hex
+            group = added.get(key)
+            if group is None:
+                self._payees.setdefault(key, payee)
+                group = added[key] = []
+            group.append(
+                trusted_model(
+                    PayeePosting,
+                    {
+                        "date": date,
+                        "kind": kind,
+                        "amount": amount,
+                        "description": description,
+                        "transaction": transaction,
+                        "document": document,
+                    },
+                )
+            )
+            changed[kind, key] = changed.get((kind, key), Money(0)) + amount
+
+        for key, group in added.items():
+            existing = self._postings.setdefault(key, [])
+            start = max(len(existing) - 1, 0)
+            existing.extend(group)
+            dates = [posting.date for posting in existing[start:]]
+            if any(earlier > later for earlier, later in zip(dates, dates[1:])):
+                # Stable, so postings of the same date keep their order. A new
+                # list, as snapshots share the old one up to its length then
+                self._postings[key] = sorted(existing, key=_posting_date)
+        if self._published is not None:
+            self._changed.update(added)
+        for (kind, key), amount in changed.items():
+            self._move(kind, key, amount)
+
+    def _move(self, kind: str, key: str, amount: Money):
+        balance = self._balances[kind].get(key, Money(0)) + amount
+        self._balances[kind][key] = balance
+        serial = next(self._serial)
+        self._serials[kind][key] = serial
+        heap = self._heaps[kind]
+        heappush(heap, (-balance, serial, key))
+        if len(heap) > 2 * len(self._serials[kind]) + 64:
+            self._compact(kind)
+
+    def bring_forward(self, payee: Payee, kind: str, balance: Money) -> PayeePosting:
+        """Open a balance carried over from an earlier book or snapshot"""
+        return self.post(payee, kind, balance, datetime.min, BROUGHT_FORWARD)
+
+    def snapshot(self) -> "PayeeLedger":
+        """Read-only copy of the postings and balances as they are now
+
+        The first one takes every payee. Later ones take the payees that
+        posted since the one before and stack them on it, see LayeredMap.
+        Posting lists are only appended to or replaced by new ones, so the
+        copy shares them up to their length at this point.
+        """
+        if self._published is None:
+            payees = LayeredMap(self._payees)
+            postings = LayeredMap(
+                {key: (items, len(items)) for key, items in self._postings.items()}
+            )
+            balances = {kind: LayeredMap(self._balances[kind]) for kind in KINDS}
+        else:
+            payees, postings, balances = self._published
+            changed = self._changed
+            if changed:
+                payees = payees.changed({key: self._payees[key] for key in changed})
+                postings = postings.changed(
+                    {
+                        key: (self._postings[key], len(self._postings[key]))
+                        for key in changed
+                    }
+                )
+                balances = {
+                    kind: balances[kind].changed(
+                        {
+                            key: self._balances[kind][key]
+                            for key in changed
+                            if key in self._balances[kind]
+                        }
+                    )
+                    for kind in KINDS
+                }
+        self._published = payees, postings, balances
+        self._changed = set()
+        return PayeeLedgerSnapshot(payees, postings, balances)
+
+    def _postings_of(self, key: str) -> list[PayeePosting]:
+        return list(self._postings.get(key, ()))
+
+    def outstanding(self) -> Iterator[tuple[Payee, str, Money]]:
+        """Every balance that is not zero, with its payee and kind"""
+        for kind, balances in self._balances.items():
+            for key, balance in list(balances.items()):
+                if balance:
+                    yield self._payees[key], kind, balance
+
+    def _compact(self, kind: str):
+        serials = self._serials[kind]
+        self._heaps[kind] = [
+            entry for entry in self._heaps[kind] if serials[entry[2]] == entry[1]
+        ]
+        heapify(self._heaps[kind])
+
+    def balance(self, payee: Payee, kind: str) -> Money:
+        return self._balances[kind].get(payee.uuid.hex, Money(0))
+
+    def balances(self, payee: Payee) -> dict[str, Money]:
+        """Outstanding balance of the payee for every kind"""
+        return {kind: self.balance(payee, kind) for kind in KINDS}
+
+    def total(self, kind: str) -> Money:
+        return Money.sum(self._balances[kind].values())
+
+    def top(self, kind: str, n: int = 10) -> list[tuple[Payee, Money]]:
+        """Payees with the largest positive outstanding balance of a kind"""
+        heap = self._heaps[kind]
+        serials = self._serials[kind]
+        found = []
+        while heap and len(found) < n:
+            entry = heappop(heap)
+            negative, serial, key = entry
+            if serials[key] != serial:
+                continue  # Outdated, dropped for good
+            if negative >= 0:
+                heappush(heap, entry)
+                break
+            found.append(entry)
+        for entry in found:
+            heappush(heap, entry)
+        return [(self._payees[key], -negative) for negative, _, key in found]
+
+    def statement(
+        self,
+        payee: Payee,
+        kinds: Optional[Iterable[str]] = None,
+        start: Optional[datetime.date] = None,
+        end: Optional[datetime.date] = None,
+    ) -> Iterator[PayeeStatementLine]:
+        """Postings of a payee in date order, with the running balance
+
+        The balance adds up the postings of the given kinds, or of every
+        kind, including the ones before start.
+        """
+        kinds = set(kinds or KINDS)
+        start = as_datetime(start) if start else None
+        end = as_datetime(end, end_of_day=True) if end else None
+        balance = Money(0)
+        for posting in self._postings_of(payee.uuid.hex):
+            if posting.kind not in kinds:
+                continue
+            if end is not None and posting.date > end:
+                break
+            balance += posting.amount
+            if start is None or posting.date >= start:
+                yield PayeeStatementLine(posting=posting, balance=balance)
+
+
+class PayeeLedgerSnapshot(PayeeLedger):
+    """Postings and balances as they were when the snapshot was taken
+
+    Read-only. top() takes a pass over the balances of the kind, as the
+    heaps stay with the live ledger.
+    """
+
+    def __init__(
+        self,
+        payees: LayeredMap[str, Payee],
+        postings: LayeredMap[str, tuple[list[PayeePosting], int]],
+        balances: dict[str, LayeredMap[str, Money]],
+    ):
+        self._payees = payees
+        self._postings = postings
+        self._balances = balances
+
+    def top(self, kind: str, n: int = 10) -> list[tuple[Payee, Money]]:
+        found = nlargest(
+            n,
+            (
+                (key, balance)
+                for key, balance in self._balances[kind].items()
+                if balance > 0
+            ),
+            key=itemgetter(1),
+        )
+        return [(self._payees[key], balance) for key, balance in found]
+
+    def snapshot(self) -> "PayeeLedger":
+        return self
+
+    def _postings_of(self, key: str) -> list[PayeePosting]:
+        postings, length = self._postings.get(key, ((), 0))
+        return postings[:length]
+
+    post = post_many = bring_forward = _move = _compact = _read_only
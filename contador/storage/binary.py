@@ -0,0 +1,464 @@
+"""Binary export format for a whole book
+
+The file starts with a fixed header and the entry table, stored column-wise
+in little-endian fixed-width columns so that it can be memory-mapped. JSON
+lines with the book, payees, accounts, transactions and documents follow.
+Each entity is written once, and entities refer to each other by their
+position in their own section instead of through back-references.
+"""
+
+import json
+import mmap
+import os
+import struct
+import sys
+from array import array
+from datetime import datetime
+from heapq import merge
+from operator import itemgetter
+from typing import IO, Iterator, Union
+from uuid import UUID
+
+from ..core.entities import Account, Book, Document, Entry, Payee, Transaction
+from ..core.ledger import ColumnarLedger, date_key
+from ..core.money import Money
+
+MAGIC = b"CTDR"
+VERSION = 1
+# Magic, version and number of entries
+HEADER = struct.Struct("<4sIQ")
+UUID_SIZE = 16
+# Integer columns of the entry table, after the uuid column, in file order
+COLUMNS = ("account", "transaction", "units", "scale")
+# Transaction column value of entries outside any transaction
+NO_TRANSACTION = -1
+
+
+def _to_little_endian(column: array) -> array:
+    if sys.byteorder != "little":  # pragma: no cover
+        column = array(column.typecode, column)
+        column.byteswap()
+    return column
+
+
+def _line(file: IO[bytes], row):
+    file.write(json.dumps(row, separators=(",", ":")).encode())
+    file.write(b"\n")
+
+
+def _entry_date(entry: Entry) -> datetime:
+    return entry.transaction.date if entry.transaction else datetime.min
+
+
+def _dump_entries(
+    file: IO[bytes], accounts: list[Account], transaction_ids: dict[str, int]
+):
+    """Write the entry table of Entry objects
+
+    The table is built in compact integer arrays first, since its columns
+    follow one another.
+    """
+    uuids = bytearray()
+    columns = {name: array("q") for name in COLUMNS}
+    for account_id, account in enumerate(accounts):
+        # In date order, so that loading appends to the date indexes
+        for entry in sorted(account.iter_entries(), key=_entry_date):
+            uuids += entry.uuid.bytes
+            columns["account"].append(account_id)
+            columns["transaction"].append(
+                transaction_ids[entry.transaction.uuid.hex]
+                if entry.transaction
+                else NO_TRANSACTION
+            )
+            columns["units"].append(entry.amount.units)
+            columns["scale"].append(entry.amount.scale)
+
+    file.write(HEADER.pack(MAGIC, VERSION, len(columns["units"])))
+    file.write(uuids)
+    for name in COLUMNS:
+        file.write(_to_little_endian(columns[name]).tobytes())
+
+
+def _ledger_order(ledger: ColumnarLedger, entries: list[Entry], rows: array) -> array:
+    """Rows of an account merged by date with the entries it holds itself
+
+    Entries are given as negative rows, -1 for the first one, and come first
+    on the same date like they do in iter_entries().
+    """
+    if not entries:
+        return rows
+    held = [
+        (date_key(_entry_date(entry)), -1 - position)
+        for position, entry in enumerate(entries)
+    ]
+    stored = ((ledger.dates[row], row) for row in rows)
+    return array("q", (row for _, row in merge(held, stored, key=itemgetter(0))))
+
+
+def _dump_ledger(
+    file: IO[bytes],
+    ledger: ColumnarLedger,
+    accounts: list[Account],
+    transaction_ids: dict[str, int],
+):
+    """Write the entry table of a book whose entries are in a columnar ledger
+
+    Values are read straight from the ledger columns and written out one
+    account at a time, in a pass over the accounts for every column. No
+    Entry object is built; only the row numbers of each account are kept.
+    """
+    rows_by_account = ledger.rows_by_account()
+    orders = []
+    for account in accounts:
+        entries = sorted(account.entries.values(), key=_entry_date)
+        rows = rows_by_account.get(account.uuid.hex, array("q"))
+        orders.append((entries, _ledger_order(ledger, entries, rows)))
+    file.write(HEADER.pack(MAGIC, VERSION, sum(len(rows) for _, rows in orders)))
+
+    for entries, rows in orders:
+        file.write(
+            b"".join(
+                ledger.row_uuid(row).bytes if row >= 0 else entries[-1 - row].uuid.bytes
+                for row in rows
+            )
+        )
+
+    # File position of every ledger transaction, found on first use
+    positions: dict[int, int] = {}
+
+    def transaction_position(row: int) -> int:
+        ledger_id = ledger.transaction_ids[row]
+        position = positions.get(ledger_id)
+        if position is None:
+            transaction = ledger.transaction_of(row)
+            position = positions[ledger_id] = transaction_ids[transaction.uuid.hex]
+        return position
+
+    # Value of every column for a ledger row and for an entry held as object
+    stored = {
+        "transaction": transaction_position,
+        "units": ledger.amounts.__getitem__,
+        "scale": lambda row: ledger.scale,
+    }
+    held = {
+        "transaction": lambda entry: (
+            transaction_ids[entry.transaction.uuid.hex]
+            if entry.transaction
+            else NO_TRANSACTION
+        ),
+        "units": lambda entry: entry.amount.units,
+        "scale": lambda entry: entry.amount.scale,
+    }
+    for name in COLUMNS:
+        for account_id, (entries, rows) in enumerate(orders):
+            if name == "account":
+                column = array("q", [account_id]) * len(rows)
+            else:
+                row_value, entry_value = stored[name], held[name]
+                column = array(
+                    "q",
+                    (
+                        row_value(row) if row >= 0 else entry_value(entries[-1 - row])
+                        for row in rows
+                    ),
+                )
+            file.write(_to_little_endian(column).tobytes())
+
+
+def dump(book: Book, file: IO[bytes]):
+    """Write book to a binary file object, which does not need to be seekable
+
+    Entities are streamed out one line at a time, and so is the entry table
+    of a book with a columnar ledger.
+    """
+    accounts = list(book.accounts.values())
+    transactions = list(book.transactions.values())
+    documents = {document.uuid.hex: document for document in book.documents.values()}
+    for transaction in transactions:
+        for document in transaction.documents.values():
+            documents.setdefault(document.uuid.hex, document)
+    payees = {}
+    for document in documents.values():
+        if document.payee is not None:
+            payees.setdefault(document.payee.uuid.hex, document.payee)
+
+    transaction_ids = {
+        transaction.uuid.hex: position
+        for position, transaction in enumerate(transactions)
+    }
+    payee_ids = {key: position for position, key in enumerate(payees)}
+
+    if isinstance(book.ledger, ColumnarLedger):
+        _dump_ledger(file, book.ledger, accounts, transaction_ids)
+    else:
+        _dump_entries(file, accounts, transaction_ids)
+
+    _line(
+        file,
+        {
+            "uuid": book.uuid.hex,
+            "name": book.name,
+            "period": book.period,
+            "payees": len(payees),
+            "accounts": len(accounts),
+            "transactions": len(transactions),
+            "documents": len(documents),
+        },
+    )
+    for key, payee in payees.items():
+        _line(file, [key, payee.name])
+    account_ids = {
+        account.uuid.hex: position for position, account in enumerate(accounts)
+    }
+    for account in accounts:
+        balance = account.initial_balance
+        parent = account_ids[account.parent.uuid.hex] if account.parent else None
+        _line(
+            file,
+            [account.uuid.hex, account.name, balance.units, balance.scale, parent],
+        )
+    for transaction in transactions:
+        date = transaction.date.isoformat()
+        _line(file, [transaction.uuid.hex, date, transaction.description])
+    for key, document in documents.items():
+        _line(
+            file,
+            [
+                key,
+                document.date.isoformat(),
+                document.number,
+                document.type_,
+                document.amount.units,
+                document.amount.scale,
+                document.tax_amount.units,
+                document.tax_amount.scale,
+                payee_ids[document.payee.uuid.hex] if document.payee else None,
+                document.location,
+                [
+                    transaction_ids[transaction.uuid.hex]
+                    for transaction in document.transactions.values()
+                    if transaction.uuid.hex in transaction_ids
+                ],
+            ],
+        )
+
+
+def _count(header: bytes) -> int:
+    if len(header) < HEADER.size:
+        raise ValueError("Not a contador book file")
+    magic, version, count = HEADER.unpack(header[: HEADER.size])
+    if magic != MAGIC:
+        raise ValueError("Not a contador book file")
+    if version != VERSION:
+        raise ValueError(f"Unsupported book file version {version}")
+    return count
+
+
+def _lines(file: IO[bytes], count: int) -> Iterator[list]:
+    for _ in range(count):
+        yield json.loads(file.readline())
+
+
+def load(file: IO[bytes], columnar: bool = False, compact: bool = False) -> Book:
+    """Read a book written by dump()
+
+    With columnar, the book gets a ColumnarLedger and the entry table is
+    copied into it column by column instead of being turned into Entry
+    objects; entries outside any transaction are still kept as objects.
+    With compact, entries are read as CompactEntry objects.
+    """
+    count = _count(file.read(HEADER.size))
+    uuids = file.read(UUID_SIZE * count)
+    columns = {}
+    for name in COLUMNS:
+        column = array("q")
+        column.frombytes(file.read(column.itemsize * count))
+        columns[name] = _to_little_endian(column)
+
+    meta = json.loads(file.readline())
+    book = Book.trusted(
+        uuid=UUID(meta["uuid"]), name=meta["name"], period=meta["period"]
+    )
+    if columnar:
+        scale = max(columns["scale"], default=Money.DEFAULT_SCALE)
+        book.use_columnar_ledger(scale=scale)
+    if compact:
+        book.use_compact_entries()
+    payees = [
+        Payee.trusted(uuid=UUID(key), name=name)
+        for key, name in _lines(file, meta["payees"])
+    ]
+
+    accounts = []
+    parents = []
+    for key, name, units, scale, *parent in _lines(file, meta["accounts"]):
+        account = Account.trusted(
+            uuid=UUID(key), name=name, initial_balance=Money.from_units(units, scale)
+        )
+        book.add_account(account)
+        accounts.append(account)
+        parents.append(parent[0] if parent else None)
+    for account, parent in zip(accounts, parents):
+        if parent is not None:
+            account.move_to(accounts[parent])
+
+    transactions = []
+    for key, date, description in _lines(file, meta["transactions"]):
+        transaction = Transaction.trusted(
+            uuid=UUID(key),
+            date=datetime.fromisoformat(date),
+            description=sys.intern(description),
+            book=book,
+        )
+        book.transactions.add(transaction)
+        transactions.append(transaction)
+
+    for row in _lines(file, meta["documents"]):
+        key, date, number, type_, units, scale, tax_units, tax_scale = row[:8]
+        payee, location, linked = row[8:]
+        document = Document.trusted(
+            uuid=UUID(key),
+            date=datetime.fromisoformat(date),
+            number=number,
+            type_=sys.intern(type_),
+            amount=Money.from_units(units, scale),
+            tax_amount=Money.from_units(tax_units, tax_scale),
+            payee=payees[payee] if payee is not None else None,
+            location=location,
+            book=book,
+        )
+        book.documents.add(document)
+        for position in linked:
+            document.transactions.add(transactions[position])
+            transactions[position].documents.add(document)
+
+    if columnar:
+        _load_ledger(book, accounts, transactions, uuids, columns)
+    else:
+        _load_entries(accounts, transactions, uuids, columns)
+    return book
+
+
+def _rows(uuids: bytes, columns: dict[str, array]) -> Iterator[tuple]:
+    return zip(
+        (uuid for (uuid,) in struct.iter_unpack(f"{UUID_SIZE}s", uuids)),
+        *(columns[name] for name in COLUMNS),
+    )
+
+
+def _entry(account: Account, uuid: bytes, amount: Money) -> Entry:
+    return account.book.entry_type.trusted(
+        uuid=UUID(bytes=uuid), amount=amount, account=account
+    )
+
+
+def _load_entries(
+    accounts: list[Account],
+    transactions: list[Transaction],
+    uuids: bytes,
+    columns: dict[str, array],
+):
+    totals = [Money(0)] * len(accounts)
+    for uuid, account_id, transaction_id, units, scale in _rows(uuids, columns):
+        account = accounts[account_id]
+        amount = Money.from_units(units, scale)
+        entry = _entry(account, uuid, amount)
+        account.entries.add(entry)
+        totals[account_id] += amount
+        if transaction_id != NO_TRANSACTION:
+            transaction = transactions[transaction_id]
+            entry.transaction = transaction
+            transaction.entries.add(entry)
+            account._state.date_index.add(transaction.date, entry, amount)
+
+    # Running totals are set once per account
+    for account, total in zip(accounts, totals):
+        account._apply_amount(total)
+
+
+def _load_ledger(
+    book: Book,
+    accounts: list[Account],
+    transactions: list[Transaction],
+    uuids: bytes,
+    columns: dict[str, array],
+):
+    ledger = book.ledger
+    scale = ledger.scale
+    # Registered in file order, so that file ids and ledger ids are the same
+    for account in accounts:
+        ledger.account_id(account)
+    for transaction in transactions:
+        ledger.transaction_id(transaction)
+    keys = [date_key(transaction.date) for transaction in transactions]
+
+    if NO_TRANSACTION not in columns["transaction"] and all(
+        value == scale for value in columns["scale"]
+    ):
+        ledger.account_ids.extend(columns["account"])
+        ledger.transaction_ids.extend(columns["transaction"])
+        ledger.amounts.extend(columns["units"])
+        ledger.dates.extend(array("q", map(keys.__getitem__, columns["transaction"])))
+        ledger.uuids = uuids
+    else:
+        stored = bytearray()
+        for uuid, account_id, transaction_id, units, row_scale in _rows(uuids, columns):
+            account = accounts[account_id]
+            amount = Money.from_units(units, row_scale)
+            if transaction_id == NO_TRANSACTION:
+                account._apply_entry(_entry(account, uuid, amount))
+                continue
+            stored += uuid
+            ledger.account_ids.append(account_id)
+            ledger.transaction_ids.append(transaction_id)
+            ledger.amounts.append(amount.units_at(scale))
+            ledger.dates.append(keys[transaction_id])
+        ledger.uuids = bytes(stored)
+
+    for key, total in ledger.totals_by_account().items():
+        book.accounts[key]._apply_amount(total)
+
+
+class EntryTable:
+    """Memory-mapped entry table of a book file
+
+    The columns are views over the mapped file, so opening the table reads
+    nothing but the header. uuid holds 16 bytes per entry; account and
+    transaction are positions in the book file, units and scale the amount.
+    """
+
+    def __init__(self, path: Union[str, os.PathLike]):
+        with open(path, "rb") as file:
+            self._map = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        self._view = memoryview(self._map)
+        self.count = _count(self._view[: HEADER.size])
+
+        start, offset = HEADER.size, HEADER.size + UUID_SIZE * self.count
+        self.uuid = self._view[start:offset]
+        self.columns = {}
+        for name in COLUMNS:
+            end = offset + 8 * self.count
+            self.columns[name] = self._view[offset:end].cast("q")
+            offset = end
+
+    def __len__(self) -> int:
+        return self.count
+
+    def __getattr__(self, name: str) -> memoryview:
+        try:
+            return self.__dict__["columns"][name]
+        except KeyError:
+            raise AttributeError(name) from None
+
+    def close(self):
+        for column in self.columns.values():
+            column.release()
+        self.uuid.release()
+        self._view.release()
+        self._map.close()
+
+    def __enter__(self) -> "EntryTable":
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
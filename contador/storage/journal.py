@@ -0,0 +1,289 @@
+import json
+import os
+import struct
+import zlib
+from datetime import date, datetime
+from decimal import Decimal
+from typing import IO, Any, Iterator, Optional
+from uuid import UUID
+
+from pydantic import BaseModel
+
+from ..core.entities import Account, Book, Document, Entity, Payee, derived_uuids
+from ..core.manager import AccountManager
+from ..core.money import Money
+
+# Every record is its payload length and CRC32 followed by the JSON payload
+FRAME = struct.Struct(">II")
+
+OPEN = "open"
+
+
+def frame(record: dict) -> bytes:
+    payload = json.dumps(record, default=encode, separators=(",", ":")).encode()
+    return FRAME.pack(len(payload), zlib.crc32(payload)) + payload
+
+
+def read_frames(file: IO[bytes]) -> Iterator[tuple[int, bytes]]:
+    """Payloads of the records from the current position, with their end offset
+
+    Stops at the first record that is incomplete or fails its checksum, which
+    is what a crash in the middle of a write leaves behind.
+    """
+    while True:
+        header = file.read(FRAME.size)
+        if len(header) < FRAME.size:
+            return
+        length, checksum = FRAME.unpack(header)
+        payload = file.read(length)
+        if len(payload) < length or zlib.crc32(payload) != checksum:
+            return
+        yield file.tell(), payload
+
+
+def encode(value: Any) -> Any:
+    """JSON form of the values found in journaled arguments"""
+    if isinstance(value, Document):
+        return {
+            "$document": {
+                "uuid": value.uuid.hex,
+                "date": value.date,
+                "number": value.number,
+                "type_": value.type_,
+                "amount": value.amount,
+                "tax_amount": value.tax_amount,
+                "payee": value.payee,
+                "location": value.location,
+            }
+        }
+    if isinstance(value, Payee):
+        return {"$payee": {"uuid": value.uuid.hex, "name": value.name}}
+    if isinstance(value, BaseModel) and not isinstance(value, Entity):
+        # Rows of bulk operations, validated again when they are replayed
+        return dict(value)
+    if isinstance(value, datetime):
+        return {"$datetime": value.isoformat()}
+    if isinstance(value, date):
+        return {"$date": value.isoformat()}
+    if isinstance(value, (Money, Decimal)):
+        return {"$decimal": str(value)}
+    raise TypeError(f"Cannot journal {type(value).__name__}")
+
+
+def decoder(book: Optional[Book] = None):
+    """Object hook turning encoded values back into objects
+
+    Documents already in the book are looked up so replayed operations act on
+    them; the others are rebuilt from the journaled fields.
+    """
+
+    def decode(value: dict) -> Any:
+        if "$datetime" in value:
+            return datetime.fromisoformat(value["$datetime"])
+        if "$date" in value:
+            return date.fromisoformat(value["$date"])
+        if "$decimal" in value:
+            return Decimal(value["$decimal"])
+        if "$payee" in value:
+            return Payee(**value["$payee"])
+        if "$document" in value:
+            fields = value["$document"]
+            document = book.documents.get(fields["uuid"]) if book else None
+            return document or Document(**fields, book=book)
+        return value
+
+    return decode
+
+
+def book_record(manager: AccountManager, **extra) -> dict:
+    """The book and its accounts, written at the start of every journal"""
+    book = manager.book
+    return {
+        "op": OPEN,
+        "book": {"uuid": book.uuid.hex, "name": book.name, "period": book.period},
+        "accounts": [
+            {
+                "uuid": account.uuid.hex,
+                "name": account.name,
+                "initial_balance": account.initial_balance,
+                "balance": account.balance,
+                "parent": account.parent.uuid.hex if account.parent else None,
+            }
+            for account in book.accounts.values()
+        ],
+        **extra,
+    }
+
+
+def open_book(record: dict) -> AccountManager:
+    """Rebuild the book of a book record, with its accounts at their balance
+
+    As when a period is closed, the balance becomes the initial balance of
+    the account, so the rebuilt book has no entries to account for.
+    """
+    book = Book(**record["book"])
+    parents = {}
+    for fields in record["accounts"]:
+        fields["initial_balance"] = fields.pop("balance")
+        parent = fields.pop("parent", None)
+        account = Account(**fields, book=book)
+        if parent is not None:
+            parents[account.uuid.hex] = parent
+    for key, parent in parents.items():
+        book.accounts[key].move_to(book.accounts[parent])
+    return AccountManager(book)
+
+
+class Journal:
+    """Append-only log of the operations of an account manager
+
+    Records are length-prefixed and checksummed, buffered, and written and
+    fsynced together once group_size of them are waiting, so a single fsync
+    covers a whole group. With a snapshot path, a snapshot of the balances
+    and open items is taken every snapshot_every records; recover() starts
+    from it and replays only the records written after it.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        snapshot_path: Optional[str] = None,
+        group_size: int = 64,
+        snapshot_every: int = 10_000,
+    ):
+        self.path = path
+        self.snapshot_path = snapshot_path
+        self.group_size = group_size
+        self.snapshot_every = snapshot_every
+        self._file = open(path, "ab")
+        self._buffer = bytearray()
+        self._buffered = 0
+        self._since_snapshot = 0
+        self.position = self._file.tell()
+
+    def __enter__(self) -> "Journal":
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def append(self, record: dict):
+        data = frame(record)
+        self._buffer += data
+        self._buffered += 1
+        self.position += len(data)
+        if self._buffered >= self.group_size:
+            self.commit()
+
+    def attach(self, manager: AccountManager):
+        """Journal the operations of manager, starting with its book if empty"""
+        if self.position == 0:
+            self.append(book_record(manager))
+        manager.journal = self
+
+    def record(self, operation: str, seed: UUID, arguments: dict):
+        """Journal an operation, called once its postings commit"""
+        self.append({"op": operation, "seed": seed.hex, "arguments": arguments})
+        self._since_snapshot += 1
+
+    def checkpoint(self, manager: AccountManager):
+        """Take a snapshot if one is due
+
+        Called between operations, when no unit of work is open, so the
+        snapshot never holds part of a unit of work.
+        """
+        if self.snapshot_path and self._since_snapshot >= self.snapshot_every:
+            self.snapshot(manager)
+
+    def commit(self):
+        """Write the buffered records and wait until they are on disk"""
+        if self._buffer:
+            self._file.write(self._buffer)
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            self._buffer.clear()
+            self._buffered = 0
+
+    def close(self):
+        self.commit()
+        self._file.close()
+
+    def snapshot(self, manager: AccountManager):
+        """Save balances, open items and payee balances at the end of the journal
+
+        The snapshot is written next to its final path and renamed over it, so
+        a crash leaves either the previous snapshot or the new one.
+        """
+        self.commit()
+        items = [
+            {
+                "document": item.document,
+                "kind": item.kind,
+                "outstanding": item.outstanding,
+            }
+            for item in manager.open_items.items()
+        ]
+        payees = [
+            {"payee": payee, "kind": kind, "balance": balance}
+            for payee, kind, balance in manager.payees.outstanding()
+        ]
+        temporary = f"{self.snapshot_path}.tmp"
+        with open(temporary, "wb") as file:
+            file.write(frame(book_record(manager, offset=self.position)))
+            file.write(frame({"open_items": items, "payees": payees}))
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(temporary, self.snapshot_path)
+        self._since_snapshot = 0
+
+
+def replay(manager: AccountManager, record: dict):
+    arguments = record["arguments"]
+    with derived_uuids(UUID(record["seed"])):
+        getattr(manager, record["op"])(**arguments)
+
+
+def recover(
+    path: str, snapshot_path: Optional[str] = None, **options
+) -> AccountManager:
+    """Rebuild a manager from its latest snapshot and the journal after it
+
+    The returned manager writes to the journal again. A torn record at the
+    end of the journal, left by a crash, is dropped.
+    """
+    manager = None
+    offset = 0
+    if snapshot_path and os.path.exists(snapshot_path):
+        with open(snapshot_path, "rb") as file:
+            frames = read_frames(file)
+            _, payload = next(frames)
+            record = json.loads(payload, object_hook=decoder())
+            manager = open_book(record)
+            offset = record["offset"]
+            _, payload = next(frames)
+            items = json.loads(payload, object_hook=decoder(manager.book))
+        for item in items["open_items"]:
+            manager.open_items.open(item["document"], item["kind"], item["outstanding"])
+        for item in items.get("payees", ()):
+            manager.payees.bring_forward(
+                item["payee"], item["kind"], Money(item["balance"])
+            )
+
+    end = offset
+    if os.path.exists(path):
+        with open(path, "rb") as file:
+            file.seek(offset)
+            for end, payload in read_frames(file):
+                book = manager.book if manager else None
+                record = json.loads(payload, object_hook=decoder(book))
+                if record["op"] == OPEN:
+                    manager = open_book(record)
+                else:
+                    replay(manager, record)
+        with open(path, "r+b") as file:
+            file.truncate(end)
+
+    if manager is None:
+        raise ValueError(f"There is nothing to recover from {path}")
+    Journal(path, snapshot_path, **options).attach(manager)
+    return manager
@@ -0,0 +1,831 @@
+import json
+import sqlite3
+from collections import defaultdict
+from copy import copy
+from datetime import date, datetime, timedelta
+from decimal import ROUND_CEILING, ROUND_FLOOR
+from typing import Any, Callable, Iterable, Iterator, Optional, Union
+from uuid import UUID
+
+from ..core.entities import (
+    Account,
+    Book,
+    CollectionType,
+    Document,
+    Entity,
+    EntityType,
+    Entry,
+    Payee,
+    Transaction,
+    day,
+    new_uuid,
+)
+from ..core.index import as_datetime
+from ..core.ledger import date_key
+from ..core.money import Money
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS books (
+    uuid TEXT PRIMARY KEY,
+    name TEXT NOT NULL,
+    period TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS payees (
+    uuid TEXT PRIMARY KEY,
+    name TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS accounts (
+    uuid TEXT PRIMARY KEY,
+    book TEXT NOT NULL REFERENCES books,
+    name TEXT NOT NULL,
+    initial_units INTEGER NOT NULL,
+    initial_scale INTEGER NOT NULL,
+    parent TEXT REFERENCES accounts
+);
+CREATE TABLE IF NOT EXISTS transactions (
+    uuid TEXT PRIMARY KEY,
+    book TEXT NOT NULL REFERENCES books,
+    date TEXT NOT NULL,
+    description TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS transactions_date ON transactions (book, date);
+CREATE TABLE IF NOT EXISTS entries (
+    id INTEGER PRIMARY KEY,
+    uuid TEXT NOT NULL UNIQUE,
+    book TEXT NOT NULL REFERENCES books,
+    account TEXT NOT NULL REFERENCES accounts,
+    "transaction" TEXT REFERENCES transactions,
+    units INTEGER NOT NULL,
+    scale INTEGER NOT NULL,
+    date INTEGER
+);
+CREATE INDEX IF NOT EXISTS entries_account
+    ON entries (account, date, scale, units);
+CREATE INDEX IF NOT EXISTS entries_transaction ON entries ("transaction");
+-- Covers the balance aggregates, so opening a book reads no table rows
+CREATE INDEX IF NOT EXISTS entries_totals
+    ON entries (book, account, scale, date, units);
+CREATE TABLE IF NOT EXISTS documents (
+    uuid TEXT PRIMARY KEY,
+    book TEXT NOT NULL REFERENCES books,
+    date TEXT NOT NULL,
+    number TEXT NOT NULL,
+    type_ TEXT NOT NULL,
+    units INTEGER NOT NULL,
+    scale INTEGER NOT NULL,
+    tax_units INTEGER NOT NULL,
+    tax_scale INTEGER NOT NULL,
+    payee TEXT REFERENCES payees,
+    location TEXT
+);
+CREATE INDEX IF NOT EXISTS documents_number ON documents (book, number, date);
+CREATE INDEX IF NOT EXISTS documents_date ON documents (book, date);
+CREATE TABLE IF NOT EXISTS links (
+    document TEXT NOT NULL REFERENCES documents,
+    "transaction" TEXT NOT NULL REFERENCES transactions,
+    PRIMARY KEY (document, "transaction")
+);
+CREATE INDEX IF NOT EXISTS links_transaction ON links ("transaction");
+"""
+
+TRANSACTION_COLUMNS = "uuid, date, description"
+DOCUMENT_COLUMNS = (
+    "uuid, date, number, type_, units, scale, tax_units, tax_scale, payee, location"
+)
+ENTRY_COLUMNS = 'uuid, account, "transaction", units, scale'
+
+# Group keys of SQLiteLedger.select_totals(). Dates are seconds since
+# 0001-01-01, which is julian day 1721425.5
+GROUP_COLUMNS = {
+    "account": "account",
+    "month": "strftime('%Y-%m', date / 86400 + 1721424.5)",
+}
+
+# Indexed attributes that lookups can push down to a column
+DOCUMENT_INDEXES = {"number", "type_", "payee", "date"}
+TRANSACTION_INDEXES = {"date"}
+
+
+class LazyCollection(CollectionType[EntityType]):
+    """Collection of stored entities that are read on demand
+
+    Lookups by key or through an index are answered by the database, and what
+    they find is kept so an entity is always the same object. Walking the
+    collection loads it whole. Entities added in memory live alongside the
+    stored ones and are written by SQLiteStore.save().
+    """
+
+    def __init__(
+        self,
+        load_all: Callable[[], Iterable[EntityType]],
+        load_one: Optional[Callable[[str], Optional[EntityType]]] = None,
+        load_by: Optional[Callable[[str, Any], Iterable[EntityType]]] = None,
+        indexes: dict[str, Callable] = None,
+    ):
+        super().__init__(indexes=indexes)
+        self._load_all = load_all
+        self._load_one = load_one
+        self._load_by = load_by
+        self.loaded = False
+
+    def in_memory(self) -> list[EntityType]:
+        """Entities read or added so far, without going to the database"""
+        return list(super().values())
+
+    def _keep(self, entity: EntityType) -> EntityType:
+        kept = super().get(entity.uuid.hex)
+        if kept is None:
+            self[entity.uuid.hex] = kept = entity
+        return kept
+
+    def load(self):
+        if not self.loaded:
+            for entity in self._load_all():
+                self._keep(entity)
+            self.loaded = True
+
+    def get(self, key: str, default: EntityType = None) -> Optional[EntityType]:
+        entity = super().get(key)
+        if entity is None and not self.loaded:
+            if self._load_one is None:
+                self.load()
+                entity = super().get(key)
+            else:
+                entity = self._load_one(key)
+                if entity is not None:
+                    entity = self._keep(entity)
+        return default if entity is None else entity
+
+    def __getitem__(self, key: str) -> EntityType:
+        entity = self.get(key)
+        if entity is None:
+            raise KeyError(key)
+        return entity
+
+    def __contains__(self, key: object) -> bool:
+        return self.get(key) is not None
+
+    def __iter__(self) -> Iterator[str]:
+        self.load()
+        return super().__iter__()
+
+    def __len__(self) -> int:
+        self.load()
+        return super().__len__()
+
+    def keys(self):
+        self.load()
+        return super().keys()
+
+    def values(self):
+        self.load()
+        return super().values()
+
+    def items(self):
+        self.load()
+        return super().items()
+
+    def by(self, name: str, value: Any) -> list[EntityType]:
+        if not self.loaded:
+            if self._load_by is None:
+                self.load()
+            else:
+                for entity in self._load_by(name, value):
+                    self._keep(entity)
+        return super().by(name, value)
+
+    def first(self, name: str, value: Any) -> Optional[EntityType]:
+        return next(iter(self.by(name, value)), None)
+
+
+def in_memory(collection: CollectionType) -> list[Entity]:
+    if isinstance(collection, LazyCollection):
+        return collection.in_memory()
+    return list(collection.values())
+
+
+def lazy(template: CollectionType, *loaders: Callable) -> LazyCollection:
+    """Lazy replacement for a collection, with the same indexes"""
+    return LazyCollection(*loaders, indexes=template.indexes)
+
+
+def money(units: int, scale: int) -> Money:
+    return Money.from_units(units, scale)
+
+
+def key_of(value: Union[UUID, str]) -> str:
+    return value.hex if isinstance(value, UUID) else value
+
+
+class SQLiteLedger:
+    """Entries of a book kept in the database rather than in memory
+
+    Has the interface of ColumnarLedger, so a book can use it through
+    Book.use_ledger(). Appended entries are buffered and written in batches
+    of batch_size rows, and totals are SQL aggregates over the stored rows.
+    """
+
+    def __init__(self, store: "SQLiteStore", book: Book, batch_size: int = 1000):
+        self.store = store
+        self.book = book
+        self.batch_size = batch_size
+        self._pending: list[tuple] = []
+        # Last entry id a snapshot sees, None for the live ledger
+        self._limit: Optional[int] = None
+
+    def __len__(self) -> int:
+        self.flush()
+        (count,) = self.store.connection.execute(
+            f"SELECT COUNT(*) FROM entries WHERE {self._book_rows}",
+            self._book_parameters,
+        ).fetchone()
+        return count
+
+    @property
+    def _book_rows(self) -> str:
+        return "book = ?" if self._limit is None else "book = ? AND id <= ?"
+
+    @property
+    def _book_parameters(self) -> list:
+        parameters = [self.book.uuid.hex]
+        if self._limit is not None:
+            parameters.append(self._limit)
+        return parameters
+
+    def snapshot(self) -> "SQLiteLedger":
+        """Read-only view of the entries stored so far
+
+        Entry ids only grow, so the view reads the rows up to the last id
+        written when it was taken.
+        """
+        self.flush()
+        (limit,) = self.store.connection.execute(
+            "SELECT COALESCE(MAX(id), 0) FROM entries"
+        ).fetchone()
+        view = copy(self)
+        view._pending = []
+        view._limit = limit
+        return view
+
+    def _row(
+        self, account: Account, transaction: Optional[Transaction], amount: Money
+    ) -> tuple:
+        return (
+            new_uuid().hex,
+            self.book.uuid.hex,
+            account.uuid.hex,
+            transaction.uuid.hex if transaction else None,
+            amount.units,
+            amount.scale,
+            date_key(transaction.date) if transaction else None,
+        )
+
+    def append(self, account: Account, transaction: Transaction, amount: Money):
+        """Buffer one entry, writing the buffer out once it is full"""
+        if self._limit is not None:
+            raise TypeError("A ledger snapshot is read-only")
+        if not isinstance(amount, Money):
+            amount = Money(amount)
+        self._pending.append(self._row(account, transaction, amount))
+        if len(self._pending) >= self.batch_size:
+            self.flush()
+
+    def extend(self, rows: Iterable[tuple[Account, Transaction, Money]]):
+        """Buffer the entries of several rows, all of them or none
+
+        Rows that were buffered earlier stay buffered if writing fails.
+        """
+        if self._limit is not None:
+            raise TypeError("A ledger snapshot is read-only")
+        rows = [
+            self._row(
+                account,
+                transaction,
+                amount if isinstance(amount, Money) else Money(amount),
+            )
+            for account, transaction, amount in rows
+        ]
+        length = len(self._pending)
+        self._pending.extend(rows)
+        if len(self._pending) >= self.batch_size:
+            try:
+                self.flush()
+            except BaseException:
+                del self._pending[length:]
+                raise
+
+    def post(
+        self,
+        transaction: Transaction,
+        postings: Iterable[tuple[Account, Money]],
+    ):
+        """Store balanced postings without building Entry objects"""
+        postings = [(account, Money(amount)) for account, amount in postings]
+        if Money.sum(amount for _, amount in postings) != 0:
+            raise ValueError("Entries are unbalanced")
+        for account, amount in postings:
+            self.append(account, transaction, amount)
+            account._apply_amount(amount)
+            account._roll_up(transaction.date, amount)
+        self.book._state.version += 1
+
+    def flush(self):
+        if self._pending and self._limit is None:
+            with self.store.connection:
+                self.store._insert_entries(self._pending)
+            self._pending = []
+
+    def _total(self, where: str, *parameters) -> Money:
+        rows = self.store.connection.execute(
+            "SELECT scale, SUM(units) FROM entries "
+            f"WHERE {self._book_rows} AND {where} GROUP BY scale",
+            (*self._book_parameters, *parameters),
+        )
+        return Money.sum(money(units, scale) for scale, units in rows)
+
+    def account_total(self, account: Account) -> Money:
+        self.flush()
+        return self._total("account = ?", account.uuid.hex)
+
+    def account_total_between(
+        self, account: Account, start: Optional[date], end: date
+    ) -> Money:
+        self.flush()
+        start = date_key(as_datetime(start)) if start else 0
+        return self._total(
+            "account = ? AND date BETWEEN ? AND ?",
+            account.uuid.hex,
+            start,
+            date_key(end),
+        )
+
+    def transaction_total(self, transaction: Transaction) -> Money:
+        """Total of the stored and the buffered entries of a transaction
+
+        Called for every posting, so the buffer is added up in place instead of
+        being written out early.
+        """
+        key = transaction.uuid.hex
+        pending = Money.sum(
+            money(row[4], row[5]) for row in self._pending if row[3] == key
+        )
+        return pending + self._total('"transaction" = ?', key)
+
+    def daily_totals(self, account: Account) -> dict[date, Money]:
+        """Entries total of an account for every day it has entries on"""
+        self.flush()
+        rows = self.store.connection.execute(
+            "SELECT date / 86400, scale, SUM(units) FROM entries "
+            f"WHERE {self._book_rows} AND account = ? AND date IS NOT NULL "
+            "GROUP BY date / 86400, scale",
+            (*self._book_parameters, account.uuid.hex),
+        )
+        totals = defaultdict(Money)
+        for ordinal, scale, units in rows:
+            totals[date.fromordinal(ordinal)] += money(units, scale)
+        return dict(totals)
+
+    def totals_by_account(
+        self, start: Optional[date] = None, end: Optional[date] = None
+    ) -> dict[str, Money]:
+        """Entries total of every account, keyed by uuid hex, in a single query
+
+        start and end restrict the totals to the entries dated between them.
+        Without either, entries that are not part of a transaction count too.
+        """
+        self.flush()
+        where = ""
+        parameters = self._book_parameters
+        if start is not None or end is not None:
+            where = "AND date BETWEEN ? AND ?"
+            parameters.append(date_key(as_datetime(start)) if start else 0)
+            parameters.append(date_key(end) if end else date_key(datetime.max))
+        rows = self.store.connection.execute(
+            "SELECT account, scale, SUM(units) FROM entries "
+            f"WHERE {self._book_rows} {where} GROUP BY account, scale",
+            parameters,
+        )
+        totals = defaultdict(Money)
+        for account, scale, units in rows:
+            totals[account] += money(units, scale)
+        return dict(totals)
+
+    def entries(
+        self,
+        account: Optional[Account] = None,
+        transaction: Optional[Transaction] = None,
+    ) -> Iterator[Entry]:
+        """Build Entry objects for the matching rows while reading the cursor"""
+        self.flush()
+        where = self._book_rows
+        parameters = self._book_parameters
+        if account is not None:
+            where += " AND account = ?"
+            parameters.append(account.uuid.hex)
+        if transaction is not None:
+            where += ' AND "transaction" = ?'
+            parameters.append(transaction.uuid.hex)
+        return self._read(f"WHERE {where} ORDER BY id", parameters)
+
+    def _read(self, clauses: str, parameters: list) -> Iterator[Entry]:
+        cursor = self.store.connection.execute(
+            f"SELECT {ENTRY_COLUMNS} FROM entries {clauses}", parameters
+        )
+        accounts = self.book.accounts
+        transactions = self.book.transactions
+        for key, account_key, transaction_key, units, scale in cursor:
+            yield Entry.trusted(
+                uuid=UUID(key),
+                amount=money(units, scale),
+                account=accounts[account_key],
+                transaction=(
+                    transactions.get(transaction_key) if transaction_key else None
+                ),
+            )
+
+    def _selection(
+        self,
+        accounts: Optional[Iterable[Account]] = None,
+        transactions: Optional[Iterable[Transaction]] = None,
+        start: Optional[datetime] = None,
+        end: Optional[datetime] = None,
+        minimum: Optional[Money] = None,
+        maximum: Optional[Money] = None,
+    ) -> tuple[str, list]:
+        """WHERE clause and parameters of the dated entries that match filters
+
+        Accounts and transactions are passed as one JSON list each, so any
+        number of them takes a single parameter. Amounts are compared in the
+        units of every scale stored, rounded so that no entry is let in or
+        left out by the rounding.
+        """
+        self.flush()
+        where = [self._book_rows, "date IS NOT NULL"]
+        parameters = self._book_parameters
+        if accounts is not None:
+            where.append("account IN (SELECT value FROM json_each(?))")
+            parameters.append(json.dumps([account.uuid.hex for account in accounts]))
+        if transactions is not None:
+            where.append('"transaction" IN (SELECT value FROM json_each(?))')
+            parameters.append(
+                json.dumps([transaction.uuid.hex for transaction in transactions])
+            )
+        if start is not None:
+            where.append("date >= ?")
+            parameters.append(date_key(start))
+        if end is not None:
+            where.append("date <= ?")
+            parameters.append(date_key(end))
+        if minimum is not None or maximum is not None:
+            scales = [
+                scale
+                for (scale,) in self.store.connection.execute(
+                    f"SELECT DISTINCT scale FROM entries WHERE {self._book_rows}",
+                    self._book_parameters,
+                )
+            ]
+            for bound, operator, rounding in (
+                (minimum, ">=", ROUND_CEILING),
+                (maximum, "<=", ROUND_FLOOR),
+            ):
+                if bound is None or not scales:
+                    continue
+                clauses = []
+                for scale in scales:
+                    clauses.append(f"(scale = ? AND units {operator} ?)")
+                    parameters.extend((scale, bound.units_at(scale, rounding)))
+                where.append(f"({' OR '.join(clauses)})")
+        return " AND ".join(where), parameters
+
+    def select(self, **filters) -> Iterator[Entry]:
+        """Entries that match filters in date order, see _selection()"""
+        where, parameters = self._selection(**filters)
+        return self._read(f"WHERE {where} ORDER BY date, id", parameters)
+
+    def select_count(self, **filters) -> int:
+        where, parameters = self._selection(**filters)
+        (count,) = self.store.connection.execute(
+            f"SELECT COUNT(*) FROM entries WHERE {where}", parameters
+        ).fetchone()
+        return count
+
+    def select_total(self, **filters) -> Money:
+        where, parameters = self._selection(**filters)
+        rows = self.store.connection.execute(
+            f"SELECT scale, SUM(units) FROM entries WHERE {where} GROUP BY scale",
+            parameters,
+        )
+        return Money.sum(money(units, scale) for scale, units in rows)
+
+    def select_totals(self, group: str, **filters) -> dict[str, Money]:
+        """Total of the matching entries by account uuid hex or by month"""
+        column = GROUP_COLUMNS[group]
+        where, parameters = self._selection(**filters)
+        rows = self.store.connection.execute(
+            f"SELECT {column}, scale, SUM(units) FROM entries WHERE {where} "
+            f"GROUP BY {column}, scale",
+            parameters,
+        )
+        totals = defaultdict(Money)
+        for key, scale, units in rows:
+            totals[key] += money(units, scale)
+        return dict(totals)
+
+
+class SQLiteStore:
+    """Books saved in an SQLite database
+
+    A saved book is opened again without reading its entries: account
+    balances come from SQL aggregates, entries stay in the database behind an
+    SQLiteLedger, and transactions and documents are read as they are looked
+    up. Memory use then follows what is touched rather than the book size.
+
+    The connection may be used from any thread, so a PostingQueue can write
+    through it from its writer thread while readers query their views.
+    Writes must still come from one thread at a time, as with the book.
+    """
+
+    def __init__(self, path: str = ":memory:", batch_size: int = 1000):
+        # SQLite serialises the calls made on one connection in its default
+        # serialized mode, see sqlite3.threadsafety
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.executescript(SCHEMA)
+        self.batch_size = batch_size
+        self._payees: dict[str, Payee] = {}
+
+    def close(self):
+        self.connection.close()
+
+    def __enter__(self) -> "SQLiteStore":
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def attach(self, book: Book) -> SQLiteLedger:
+        """Save a book that has no transactions yet and keep its entries here"""
+        ledger = book.use_ledger(SQLiteLedger(self, book, self.batch_size))
+        self.save(book)
+        return ledger
+
+    def _insert_entries(self, rows: list[tuple]):
+        self.connection.executemany(
+            "INSERT OR REPLACE INTO entries "
+            '(uuid, book, account, "transaction", units, scale, date) '
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            rows,
+        )
+
+    def save(self, book: Book):
+        """Write the book and everything it holds in memory
+
+        Everything goes in one database transaction, one batched statement per
+        table. Saving again replaces the stored rows of the same entities.
+        """
+        ledger = book.ledger
+        stored = isinstance(ledger, SQLiteLedger) and ledger.store is self
+        if stored:
+            ledger.flush()
+
+        accounts = list(book.accounts.values())
+        transactions = in_memory(book.transactions)
+        documents = {
+            document.uuid.hex: document for document in in_memory(book.documents)
+        }
+        links = []
+        for transaction in transactions:
+            for document in in_memory(transaction.documents):
+                documents[document.uuid.hex] = document
+                links.append((document.uuid.hex, transaction.uuid.hex))
+        payees = {
+            document.payee.uuid.hex: document.payee
+            for document in documents.values()
+            if document.payee is not None
+        }
+
+        entries = []
+        moved = []
+        for account in accounts:
+            if stored:
+                # Entries outside any transaction, the rest is already stored
+                moved.extend(account.entries.values())
+                for entry in account.entries.values():
+                    entries.append(ledger._row(account, None, entry.amount))
+                continue
+            for entry in account.iter_entries():
+                transaction = entry.transaction
+                entries.append(
+                    (
+                        entry.uuid.hex,
+                        book.uuid.hex,
+                        account.uuid.hex,
+                        transaction.uuid.hex if transaction else None,
+                        entry.amount.units,
+                        entry.amount.scale,
+                        date_key(transaction.date) if transaction else None,
+                    )
+                )
+
+        with self.connection as connection:
+            connection.execute(
+                "INSERT OR REPLACE INTO books VALUES (?, ?, ?)",
+                (book.uuid.hex, book.name, book.period),
+            )
+            connection.executemany(
+                "INSERT OR REPLACE INTO payees VALUES (?, ?)",
+                [(key, payee.name) for key, payee in payees.items()],
+            )
+            connection.executemany(
+                "INSERT OR REPLACE INTO accounts VALUES (?, ?, ?, ?, ?, ?)",
+                [
+                    (
+                        account.uuid.hex,
+                        book.uuid.hex,
+                        account.name,
+                        account.initial_balance.units,
+                        account.initial_balance.scale,
+                        account.parent.uuid.hex if account.parent else None,
+                    )
+                    for account in accounts
+                ],
+            )
+            connection.executemany(
+                "INSERT OR REPLACE INTO transactions VALUES (?, ?, ?, ?)",
+                [
+                    (
+                        transaction.uuid.hex,
+                        book.uuid.hex,
+                        transaction.date.isoformat(),
+                        transaction.description,
+                    )
+                    for transaction in transactions
+                ],
+            )
+            connection.executemany(
+                "INSERT OR REPLACE INTO documents "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                [
+                    (
+                        key,
+                        book.uuid.hex,
+                        document.date.isoformat(),
+                        document.number,
+                        document.type_,
+                        document.amount.units,
+                        document.amount.scale,
+                        document.tax_amount.units,
+                        document.tax_amount.scale,
+                        document.payee.uuid.hex if document.payee else None,
+                        document.location,
+                    )
+                    for key, document in documents.items()
+                ],
+            )
+            connection.executemany("INSERT OR IGNORE INTO links VALUES (?, ?)", links)
+            self._insert_entries(entries)
+
+        # The ledger takes over the entries once they are stored
+        for entry in moved:
+            entry.account.entries.pop(entry.uuid.hex, None)
+
+    def books(self) -> list[tuple[UUID, str, str]]:
+        """uuid, name and period of every saved book"""
+        rows = self.connection.execute("SELECT uuid, name, period FROM books")
+        return [(UUID(key), name, period) for key, name, period in rows]
+
+    def load(self, uuid: Union[UUID, str]) -> Book:
+        """Open a saved book, reading its accounts and their balances only"""
+        key = key_of(uuid)
+        row = self.connection.execute(
+            "SELECT name, period FROM books WHERE uuid = ?", (key,)
+        ).fetchone()
+        if row is None:
+            raise ValueError(f"There is no book {key}")
+
+        name, period = row
+        book = Book.trusted(uuid=UUID(key), name=name, period=period)
+        ledger = book.use_ledger(SQLiteLedger(self, book, self.batch_size))
+        rows = self.connection.execute(
+            "SELECT uuid, name, initial_units, initial_scale, parent FROM accounts "
+            "WHERE book = ?",
+            (key,),
+        )
+        parents = {}
+        for account_key, name, units, scale, parent in rows:
+            account = Account.trusted(
+                uuid=UUID(account_key), name=name, initial_balance=money(units, scale)
+            )
+            book.add_account(account)
+            if parent is not None:
+                parents[account_key] = parent
+        for account_key, parent in parents.items():
+            book.accounts[account_key].move_to(book.accounts[parent])
+        for account_key, total in ledger.totals_by_account().items():
+            book.accounts[account_key]._apply_amount(total)
+
+        book.transactions = lazy(
+            book.transactions,
+            lambda: self._select_transactions(book),
+            lambda key: next(self._select_transactions(book, "uuid = ?", key), None),
+            lambda name, value: self._select_transactions(
+                book, *self._where(TRANSACTION_INDEXES, name, value)
+            ),
+        )
+        book.documents = lazy(
+            book.documents,
+            lambda: self._select_documents(book),
+            lambda key: next(self._select_documents(book, "uuid = ?", key), None),
+            lambda name, value: self._select_documents(
+                book, *self._where(DOCUMENT_INDEXES, name, value)
+            ),
+        )
+        return book
+
+    @staticmethod
+    def _where(columns: set[str], name: str, value: Any) -> tuple:
+        """Condition matching the entities that an index maps value to"""
+        if name not in columns:
+            raise KeyError(name)
+        if name == "date":
+            start = day(value)
+            end = start + timedelta(days=1)
+            return "date >= ? AND date < ?", start.isoformat(), end.isoformat()
+        if isinstance(value, Entity):
+            value = value.uuid
+        if isinstance(value, UUID):
+            value = value.hex
+        if value is None:
+            return (f"{name} IS NULL",)
+        return f"{name} = ?", value
+
+    def _select_transactions(
+        self, book: Book, where: str = "1", *parameters
+    ) -> Iterator[Transaction]:
+        cursor = self.connection.execute(
+            f"SELECT {TRANSACTION_COLUMNS} FROM transactions "
+            f"WHERE book = ? AND {where} ORDER BY date",
+            (book.uuid.hex, *parameters),
+        )
+        for key, date_, description in cursor:
+            transaction = Transaction.trusted(
+                uuid=UUID(key),
+                date=datetime.fromisoformat(date_),
+                description=description,
+                book=book,
+            )
+            transaction.documents = lazy(
+                transaction.documents,
+                lambda key=key: self._linked(book.documents, "document", key),
+            )
+            yield transaction
+
+    def _select_documents(
+        self, book: Book, where: str = "1", *parameters
+    ) -> Iterator[Document]:
+        cursor = self.connection.execute(
+            f"SELECT {DOCUMENT_COLUMNS} FROM documents "
+            f"WHERE book = ? AND {where} ORDER BY date",
+            (book.uuid.hex, *parameters),
+        )
+        for row in cursor:
+            key, date_, number, type_, units, scale, tax_units, tax_scale = row[:8]
+            payee, location = row[8:]
+            document = Document.trusted(
+                uuid=UUID(key),
+                date=datetime.fromisoformat(date_),
+                number=number,
+                type_=type_,
+                amount=money(units, scale),
+                tax_amount=money(tax_units, tax_scale),
+                payee=self._payee(payee) if payee else None,
+                location=location,
+                book=book,
+            )
+            document.transactions = lazy(
+                document.transactions,
+                lambda key=key: self._linked(book.transactions, '"transaction"', key),
+            )
+            yield document
+
+    def _linked(self, collection: CollectionType, column: str, key: str) -> list:
+        """Entities of collection linked to the entity with uuid hex key"""
+        table, other = (
+            ("transactions", "document")
+            if column == '"transaction"'
+            else ("documents", '"transaction"')
+        )
+        rows = self.connection.execute(
+            f"SELECT links.{column} FROM links JOIN {table} ON uuid = links.{column} "
+            f"WHERE links.{other} = ? ORDER BY {table}.date",
+            (key,),
+        )
+        return [collection[linked] for (linked,) in rows.fetchall()]
+
+    def _payee(self, key: str) -> Payee:
+        payee = self._payees.get(key)
+        if payee is None:
+            (name,) = self.connection.execute(
+                "SELECT name FROM payees WHERE uuid = ?", (key,)
+            ).fetchone()
+            payee = self._payees[key] = Payee.trusted(uuid=UUID(key), name=name)
+        return payee
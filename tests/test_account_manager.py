@@ -1,8 +1,18 @@
 from datetime import datetime
 from decimal import Decimal
+from io import BytesIO
+from sys import intern
 
-from contador.core.entities import Book, Payee
+from pydantic import ValidationError
+from pytest import mark, raises
+
+from contador.core.accounting import ChartOfAccounts
+from contador.core.entities import Book, Payee, Transaction
 from contador.core.manager import AccountManager
+from contador.core.money import Money
+from contador.core.posting import PostingBatch
+from contador.core.reports import ReportEngine
+from contador.storage.binary import load
 
 
 def test_create_account_manager(book: Book):
@@ -76,7 +86,7 @@ def test_accounting(account_manager: AccountManager):
 
     # Register revenue
     sale_amount = Decimal(500)
-    sale_taxes = sale_amount * Decimal(0.13)
+    sale_taxes = Money(sale_amount * Decimal(0.13))
     sale_invoice_1 = account_manager.add_sale_invoice(
         date=date,
         number="00001",
@@ -91,7 +101,7 @@ def test_accounting(account_manager: AccountManager):
     assert account_manager.is_invoice_clear(sale_invoice_1) is False
 
     # Pay salaries
-    tax_retention1 = salary1 * Decimal(0.1)
+    tax_retention1 = Money(salary1 * Decimal(0.1))
     payment1 = salary1 - tax_retention1
     account_manager.pay_salary(
         date,
@@ -100,7 +110,7 @@ def test_accounting(account_manager: AccountManager):
         payee=Payee(name="Employee 1"),
     )
 
-    tax_retention2 = salary2 * Decimal(0.1)
+    tax_retention2 = Money(salary2 * Decimal(0.1))
     payment2 = salary2 - tax_retention2
     account_manager.pay_salary(
         date,
@@ -142,3 +152,341 @@ def test_accounting(account_manager: AccountManager):
     assert account_manager.chart.taxes.balance == 0
     new_balance -= owed_taxes
     assert account_manager.chart.bank_account.balance == new_balance
+
+
+def test_bulk_posting(account_manager: AccountManager):
+    date = datetime(2021, 1, 1)
+    vendor = Payee(name="Vendor 1")
+    expense_invoices = account_manager.post_expense_invoices(
+        [
+            {"date": date, "number": "00001", "amount": 100, "invoice_url": "//1"},
+            {
+                "date": date,
+                "number": "00002",
+                "amount": Decimal(150.0),
+                "invoice_url": "//2",
+                "payee": vendor,
+            },
+        ]
+    )
+    assert [invoice.number for invoice in expense_invoices] == ["00001", "00002"]
+    assert expense_invoices[1].payee is vendor
+    assert account_manager.chart.accounts_payable.balance == Decimal(-250.0)
+    assert account_manager.chart.expenses.balance == Decimal(250.0)
+    assert account_manager.is_invoice_clear(expense_invoices[0]) is False
+
+    sale_invoices = account_manager.post_sale_invoices(
+        [
+            {
+                "date": date,
+                "number": "00001",
+                "amount": Decimal(500),
+                "tax_amount": Decimal(65),
+                "invoice_url": "//sale1",
+                "payee": {"name": "Customer 1"},
+            }
+        ]
+    )
+    assert account_manager.chart.accounts_receivable.balance == Decimal(565)
+    assert account_manager.chart.taxes.balance == Decimal(-65)
+    assert sale_invoices[0].tax_amount == Decimal(65)
+
+    account_manager.register_salaries(
+        [{"date": date, "amount": Decimal(350.0), "payee": {"name": "Employee 1"}}]
+    )
+    assert account_manager.chart.salaries.balance == Decimal(-350.0)
+
+    assert len(account_manager.book.transactions) == 4
+    for transaction in account_manager.book.transactions.values():
+        assert transaction.description is intern(transaction.description)
+    for account in account_manager.book.accounts.values():
+        assert account.verify_balance() == 0
+        assert account.balance_as_of(date) == account.balance
+
+
+def test_bulk_posting_rejects_invalid_rows(account_manager: AccountManager):
+    with raises(ValidationError):
+        account_manager.post_expense_invoices(
+            [
+                {"date": "2021-01-01", "number": "1", "amount": 1, "invoice_url": "//"},
+                {"date": "2021-01-01", "number": "2", "amount": "many"},
+            ]
+        )
+    assert not account_manager.book.transactions
+    assert account_manager.chart.accounts_payable.balance == 0
+
+
+def test_posting_batch_is_all_or_nothing(account_manager: AccountManager):
+    bank = account_manager.chart.bank_account
+    taxes = account_manager.chart.taxes
+    batch = PostingBatch(account_manager.book)
+    batch.transaction(date=datetime(2021, 1, 1), description="balanced")
+    batch.post([(bank, Decimal(-10)), (taxes, Decimal(10))])
+    batch.transaction(date=datetime(2021, 1, 2), description="unbalanced")
+    batch.post([(bank, Decimal(-10))])
+
+    with raises(ValueError):
+        batch.commit()
+    assert not account_manager.book.transactions
+    assert bank.balance == 0 and not bank.entries
+
+
+def test_posting_batch_updates_indexes(account_manager: AccountManager):
+    book = account_manager.book
+    bank = account_manager.chart.bank_account
+    taxes = account_manager.chart.taxes
+    account_manager.pay_taxes(datetime(2021, 1, 10), Decimal(5))
+    bank.rollup
+    version = book.version
+
+    # In date order, then backdated
+    batch = PostingBatch(book)
+    for day in (20, 25, 1):
+        batch.transaction(date=datetime(2021, 1, day), description=f"Day {day}")
+        batch.post([(bank, Decimal(-day)), (taxes, Decimal(day))])
+    batch.commit()
+
+    assert book.version == version + 1
+    assert len(bank.entries) == len(taxes.entries) == 4
+    assert all(entry.transaction.book is book for entry in bank.entries.values())
+    assert bank.balance == Money(-51)
+    assert bank.balance_as_of(datetime(2021, 1, 15)) == Money(-6)
+    assert bank.rollup.total_between(datetime(2021, 1, 1), datetime(2021, 1, 9)) == -1
+    assert bank.balance_between(datetime(2021, 1, 1), datetime(2021, 1, 20)) == -26
+    assert len(book.transactions) == 4
+    for account in book.accounts.values():
+        assert account.verify_balance() == 0
+
+
+def test_unit_of_work(account_manager: AccountManager):
+    date = datetime(2021, 1, 1)
+    bank = account_manager.chart.bank_account
+
+    with account_manager.unit_of_work():
+        invoice = account_manager.add_expense_invoice(
+            date, "00001", Decimal(100), "//invoice"
+        )
+        account_manager.pay_invoices([invoice], date, Decimal(100))
+        account_manager.post_expense_invoices(
+            [{"date": date, "number": "00002", "amount": 50, "invoice_url": "//2"}]
+        )
+        assert bank.balance == 0
+        assert not account_manager.book.transactions
+
+    assert bank.balance == Decimal(-100)
+    assert account_manager.chart.accounts_payable.balance == Decimal(-50)
+    assert len(account_manager.book.transactions) == 3
+    assert len(invoice.transactions) == 2
+    assert account_manager.is_invoice_clear(invoice) is True
+
+
+def test_unit_of_work_rollback(account_manager: AccountManager):
+    date = datetime(2021, 1, 1)
+    bank = account_manager.chart.bank_account
+    invoice = account_manager.add_expense_invoice(
+        date, "00001", Decimal(100), "//invoice"
+    )
+
+    try:
+        with account_manager.unit_of_work():
+            account_manager.pay_invoices([invoice], date, Decimal(100))
+            account_manager.pay_salary(date, Decimal(10), Payee(name="Employee"))
+            raise RuntimeError("import failed")
+    except RuntimeError:
+        pass
+
+    assert bank.balance == 0 and not bank.entries
+    assert len(account_manager.book.transactions) == 1
+    assert len(invoice.transactions) == 1
+    assert account_manager.is_invoice_clear(invoice) is False
+
+    # unbalanced postings are rejected when the unit of work commits
+    try:
+        with account_manager.unit_of_work():
+            account_manager.pay_taxes(date, Decimal(20))
+            transaction = Transaction(date=date, description="bad", book=bank.book)
+            transaction.add_entries([bank.credit(Decimal(5))])
+    except ValueError:
+        pass
+    else:
+        assert False, "Unbalanced transaction was committed"
+
+    assert bank.balance == 0
+    assert account_manager.chart.taxes.balance == 0
+    assert len(account_manager.book.transactions) == 1
+
+
+@mark.parametrize("posting", ["unit of work", "batch"])
+def test_failing_ledger_leaves_the_book_as_it_was(
+    book: Book, posting: str, monkeypatch
+):
+    date = datetime(2021, 1, 1)
+    ledger = book.use_columnar_ledger()
+    manager = AccountManager(book)
+    manager.pay_taxes(date, Decimal(5))
+    bank, taxes = manager.chart.bank_account, manager.chart.taxes
+    bank.rollup
+
+    # The second row stored fails halfway through
+    account_id = ledger.account_id
+    calls = iter(range(100))
+
+    def failing_account_id(account):
+        if next(calls) == 1:
+            raise BufferError("Existing exports of data: object cannot be re-sized")
+        return account_id(account)
+
+    monkeypatch.setattr(ledger, "account_id", failing_account_id)
+    with raises(BufferError):
+        if posting == "batch":
+            batch = PostingBatch(book)
+            batch.transaction(date=date, description="Payment for taxes")
+            batch.post([(bank, Decimal(-10)), (taxes, Decimal(10))])
+            batch.commit()
+        else:
+            with manager.unit_of_work():
+                manager.pay_taxes(date, Decimal(10))
+    monkeypatch.undo()
+
+    assert len(ledger) == 2
+    columns = (ledger.account_ids, ledger.transaction_ids, ledger.amounts, ledger.dates)
+    assert {len(column) for column in columns} == {2}
+    assert len(book.transactions) == 1
+    assert bank.balance == Money(-5) and taxes.balance == Money(5)
+    assert bank.rollup.total_between(date, date) == Money(-5)
+    manager.pay_taxes(date, Decimal(1))
+    for account in book.accounts.values():
+        assert account.verify_balance() == 0
+    assert ReportEngine(book).trial_balance().is_balanced
+
+
+def test_pay_salary_without_retention(account_manager: AccountManager):
+    account_manager.pay_salary(datetime(2021, 1, 1), Decimal(300), Payee(name="E"))
+    assert account_manager.chart.bank_account.balance == Decimal(-300)
+    assert account_manager.chart.taxes.balance == 0
+
+
+@mark.parametrize("columnar", [False, True])
+def test_close_period(book: Book, columnar: bool):
+    if columnar:
+        book.use_columnar_ledger()
+    manager = AccountManager(book)
+    customer = Payee(name="Customer")
+    paid = manager.add_expense_invoice(
+        datetime(2021, 3, 1), "00001", Decimal(100), "//1"
+    )
+    manager.pay_invoices([paid], datetime(2021, 3, 5), Decimal(100))
+    unpaid = manager.add_expense_invoice(
+        datetime(2021, 12, 1), "00002", Decimal(40), "//2"
+    )
+    sale = manager.add_sale_invoice(
+        datetime(2021, 12, 10), "00003", Decimal(500), "//3", customer, Decimal(65)
+    )
+    manager.receive_payment([sale], datetime(2021, 12, 20), Decimal(300))
+
+    archive = BytesIO()
+    closed = manager.close_period("2022", archive=archive)
+    new_book = closed.book
+    assert new_book.period == "2022"
+    assert (new_book.ledger is not None) == columnar
+    assert len(new_book.transactions) == 0
+    for account in book.accounts.values():
+        carried = new_book.accounts[account.uuid.hex]
+        assert carried.name == account.name
+        assert carried.initial_balance == carried.balance == account.balance
+        assert not carried.entries
+
+    # Open invoices carry over with what they still owe
+    assert {item.document.number for item in closed.open_items.items()} == {
+        "00002",
+        "00003",
+    }
+    carried_sale = new_book.documents[sale.uuid.hex]
+    assert carried_sale.book is new_book
+    assert closed.open_items.outstanding(carried_sale) == Money(265)
+    closed.receive_payment([carried_sale], datetime(2022, 1, 10), Decimal(265))
+    assert closed.is_invoice_clear(carried_sale)
+    assert closed.chart.accounts_receivable.balance == 0
+    assert unpaid.uuid.hex in new_book.documents
+
+    # The closed period can be read back from the archive
+    archive.seek(0)
+    archived = load(archive)
+    assert len(archived.transactions) == len(book.transactions)
+    assert archived.accounts.first("name", "Revenue").balance == Money(-500)
+
+
+def test_close_period_inside_unit_of_work(account_manager: AccountManager):
+    with raises(ValueError):
+        with account_manager.unit_of_work():
+            account_manager.close_period("2022")
+
+
+def test_chart_of_accounts_tree(account_manager: AccountManager):
+    chart = account_manager.chart
+    assert [account.name for account in chart.children("Assets")] == [
+        "Bank Account",
+        "Accounts Receivable",
+    ]
+    assert chart.taxes.parent is chart.liabilities
+    assert chart.expenses.parent is None
+
+    # One receivable per customer, each posting moves its ancestors
+    customers = [
+        chart.add_account(f"Customer {number}", parent="Accounts Receivable")
+        for number in range(2000)
+    ]
+    for number, customer in enumerate(customers):
+        transaction = Transaction(
+            date=datetime(2021, 1, 1), description="Sale", book=account_manager.book
+        )
+        amount = Decimal(number % 7)
+        transaction.add_entries([customer.debit(amount), chart.revenue.credit(amount)])
+    expected = sum(Decimal(number % 7) for number in range(2000))
+    assert chart.accounts_receivable.balance == 0
+    assert chart.balance("Accounts Receivable") == expected
+    assert chart.assets.total_balance == expected
+    assert chart.balance("Revenue") == -expected
+
+    # Moving a subtree moves its balance along
+    chart.add_account("Collections", parent="Assets").move_to(chart.liabilities)
+    customers[6].move_to(chart.account("Collections"))
+    assert chart.balance("Collections") == 6
+    assert chart.balance("Assets") == expected - 6
+    assert chart.balance("Liabilities") == 6
+    assert chart.add_account("Customer 6", parent="Assets") is customers[6]
+    with raises(ValueError):
+        chart.liabilities.move_to(customers[6])
+
+    report = ReportEngine(account_manager.book).balance_sheet()
+    assert report.is_balanced
+    assert report.total_assets == expected - 6
+
+
+def test_chart_of_accounts_initial_balances(account_manager: AccountManager):
+    chart = account_manager.chart
+    bank = chart.bank_account
+    bank.initial_balance = Decimal(1000)
+    assert chart.balance("Assets") == Money(1000)
+
+    bank.initial_balance = Decimal(1200)
+    assert chart.balance("Assets") == Money(1200)
+    bank.move_to(None)
+    assert chart.balance("Assets") == 0
+    bank.move_to(chart.liabilities)
+    assert chart.balance("Liabilities") == Money(1200)
+    for account in account_manager.book.accounts.values():
+        assert account.verify_balance() == 0
+
+    # Descendant totals moved behind the tree's back
+    chart.liabilities._state.descendants_total = Money(0)
+    with raises(ValueError):
+        chart.liabilities.verify_balance()
+    assert chart.liabilities.verify_balance(fix=True) == Money(1200)
+    assert chart.balance("Liabilities") == Money(1200)
+
+
+def test_custom_chart_of_accounts(book: Book):
+    chart = ChartOfAccounts(book, parents={"Taxes": "Tax Office"})
+    assert chart.taxes.parent.name == "Tax Office"
+    assert chart.bank_account.parent is None
@@ -0,0 +1,162 @@
+from datetime import date, datetime
+from decimal import Decimal
+from io import BytesIO
+
+from pytest import fixture, mark, raises
+
+from contador.core import entities
+from contador.core import ledger as ledger_module
+from contador.core.manager import AccountManager
+from contador.core.money import Money
+from contador.storage.binary import EntryTable, dump, load
+
+
+@fixture(params=["objects", "columnar"])
+def manager(request, book: entities.Book) -> AccountManager:
+    if request.param == "columnar":
+        book.use_columnar_ledger()
+    manager = AccountManager(book)
+    customer = entities.Payee(name="Customer 1")
+    invoice = manager.add_expense_invoice(
+        date(2021, 1, 10), "00001", Decimal(100), "//invoice"
+    )
+    manager.pay_invoices([invoice], date(2021, 1, 20), Decimal(60))
+    sale = manager.add_sale_invoice(
+        date(2021, 2, 5), "00002", Decimal(500), "//sale", customer, Decimal(65)
+    )
+    manager.receive_payment([sale], date(2021, 2, 25), Decimal(565))
+    manager.chart.bank_account.debit(Money("0.125", scale=3))
+    return manager
+
+
+def balances(book: entities.Book) -> dict[str, Money]:
+    return {account.name: account.balance for account in book.accounts.values()}
+
+
+@mark.parametrize("columnar", [False, True])
+def test_dump_and_load(manager: AccountManager, columnar: bool):
+    book = manager.book
+    file = BytesIO()
+    dump(book, file)
+    file.seek(0)
+    loaded = load(file, columnar=columnar)
+
+    assert loaded.uuid == book.uuid
+    assert balances(loaded) == balances(book)
+    assert (loaded.ledger is not None) == columnar
+    for account in loaded.accounts.values():
+        assert account.verify_balance() == 0
+        original = book.accounts[account.uuid.hex]
+        assert account.total_balance == original.total_balance
+        assert set(account.children) == set(original.children)
+        assert account.balance_as_of(date(2021, 1, 31)) == original.balance_as_of(
+            date(2021, 1, 31)
+        )
+
+    # Back-references point at the loaded entities
+    invoice = loaded.documents.first("number", "00001")
+    transactions = list(invoice.transactions.values())
+    assert [transaction.description for transaction in transactions] == [
+        "Invoice 00001",
+        "Payment for invoices",
+    ]
+    assert all(transaction.book is loaded for transaction in transactions)
+    assert invoice in transactions[1].documents.values()
+    assert loaded.documents.first("number", "00002").payee.name == "Customer 1"
+    for transaction in loaded.transactions.values():
+        for entry in transaction.iter_entries():
+            assert entry.transaction is transaction
+            assert entry.account is loaded.accounts[entry.account.uuid.hex]
+
+    # Entries keep their uuid, also when they are loaded into a ledger
+    for account in loaded.accounts.values():
+        original = book.accounts[account.uuid.hex]
+        assert {entry.uuid for entry in account.iter_entries()} == {
+            entry.uuid for entry in original.iter_entries()
+        }
+
+
+def test_entry_table(tmp_path, manager: AccountManager):
+    path = tmp_path / "book.ctdr"
+    with open(path, "wb") as file:
+        dump(manager.book, file)
+
+    with EntryTable(path) as table:
+        assert len(table) == 11
+        assert len(table.uuid) == 16 * 11
+        assert (
+            sum(table.units[i] for i in range(len(table)) if table.scale[i] == 2) == 0
+        )
+        assert list(table.transaction).count(-1) == 1
+
+
+def test_load_rejects_other_files():
+    with raises(ValueError):
+        load(BytesIO(b"not a book"))
+
+
+def test_load_columns_into_ledger(book: entities.Book):
+    manager = AccountManager(book)
+    for number in range(3):
+        manager.add_expense_invoice(
+            date(2021, 1, 10 + number), str(number), Decimal(100), "//invoice"
+        )
+    file = BytesIO()
+    dump(book, file)
+    file.seek(0)
+    loaded = load(file, columnar=True)
+
+    assert len(loaded.ledger) == 6
+    assert balances(loaded) == balances(book)
+    expenses = loaded.accounts.first("name", "Expenses")
+    assert expenses.balance_as_of(date(2021, 1, 11)) == Money(200)
+
+    # And through another round trip
+    uuids = {entry.uuid for entry in expenses.iter_entries()}
+    assert uuids == {
+        entry.uuid for entry in book.accounts[expenses.uuid.hex].iter_entries()
+    }
+    file = BytesIO()
+    dump(loaded, file)
+    file.seek(0)
+    again = load(file, columnar=True).accounts[expenses.uuid.hex]
+    assert {entry.uuid for entry in again.iter_entries()} == uuids
+
+
+@mark.parametrize("numpy", [True, False])
+def test_dump_columnar_ledger(book: entities.Book, monkeypatch, numpy: bool):
+    if not numpy:
+        monkeypatch.setattr(ledger_module, "numpy", None)
+    ledger = book.use_columnar_ledger()
+    manager = AccountManager(book)
+    manager.pay_taxes(date(2021, 1, 20), Decimal(5))
+    manager.pay_taxes(date(2021, 1, 10), Decimal(7))
+    bank = manager.chart.bank_account
+    bank.debit(Money("0.125", scale=3))
+    expected = [
+        (entry.uuid.bytes, entry.amount)
+        for account in book.accounts.values()
+        for entry in sorted(
+            account.iter_entries(),
+            key=lambda entry: (
+                entry.transaction.date if entry.transaction else datetime.min
+            ),
+        )
+    ]
+
+    # Written from the ledger columns, without Entry objects
+    monkeypatch.setattr(type(ledger), "_entry", None)
+    file = BytesIO()
+    dump(book, file)
+    monkeypatch.undo()
+
+    file.seek(0)
+    loaded = load(file)
+    assert [
+        (entry.uuid.bytes, entry.amount)
+        for account in loaded.accounts.values()
+        for entry in account.iter_entries()
+    ] == expected
+    assert balances(loaded) == balances(book)
+    taxes = loaded.accounts.first("name", "Taxes")
+    assert taxes.balance_as_of(date(2021, 1, 15)) == Money(7)
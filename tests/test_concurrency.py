@@ -0,0 +1,223 @@
+import asyncio
+import threading
+import time
+from datetime import date
+from decimal import Decimal
+
+from pytest import fixture, raises
+
+from contador.core.concurrency import PostingQueue
+from contador.core.entities import Book, Payee
+from contador.core.manager import AccountManager
+from contador.core.money import Money
+from contador.core.reports import ReportEngine
+from contador.core.subledger import PAYABLE
+from contador.storage.sqlite import SQLiteStore
+
+THREADS = 8
+TASKS = 50
+POSTINGS = 100
+
+
+@fixture(params=["objects", "columnar", "sqlite"])
+def manager(request, book: Book) -> AccountManager:
+    if request.param == "columnar":
+        book.use_columnar_ledger()
+    elif request.param == "sqlite":
+        # Made on this thread, written by the writer thread, read by the readers
+        store = SQLiteStore()
+        request.addfinalizer(store.close)
+        store.attach(book)
+    return AccountManager(book)
+
+
+def test_concurrent_posting(manager: AccountManager):
+    errors = []
+    stop = threading.Event()
+
+    def read_balances(postings: PostingQueue):
+        # Every consistent view of the book balances
+        while not stop.is_set():
+            balances = postings.balances()
+            if Money.sum(balances.values()) != 0:
+                errors.append(balances)
+
+    def read_entries(manager: AccountManager) -> tuple:
+        taxes = manager.chart.taxes
+        salaries = manager.chart.salaries
+        return (
+            Money.sum(entry.amount for entry in taxes.iter_entries()),
+            taxes.balance,
+            Money.sum(entry.amount for entry in salaries.iter_entries()),
+            salaries.balance_as_of(date(2021, 12, 31)),
+        )
+
+    def read_ledger(postings: PostingQueue):
+        while not stop.is_set():
+            taxes, taxes_balance, salaries, salaries_balance = postings.read(
+                read_entries
+            )
+            if taxes != taxes_balance or salaries != salaries_balance:
+                errors.append((taxes, taxes_balance, salaries, salaries_balance))
+
+    def read_links(manager: AccountManager) -> list:
+        book = manager.book
+        return [
+            key
+            for document in book.documents.values()
+            for key in book.transactions_of(document)
+            if key not in book.transactions
+        ]
+
+    def read_documents(postings: PostingQueue):
+        # Walks the collections while the writer adds to the live ones
+        while not stop.is_set():
+            try:
+                missing = postings.read(read_links)
+            except Exception as error:
+                errors.append(error)
+                return
+            if missing:
+                errors.append(missing)
+
+    def read_totals(manager: AccountManager) -> tuple:
+        return (
+            -manager.chart.accounts_payable.balance,
+            manager.open_items.total(PAYABLE),
+            manager.payees.total(PAYABLE),
+        )
+
+    def read_subledgers(postings: PostingQueue):
+        # Open items and payee balances are published with the book
+        while not stop.is_set():
+            totals = postings.read(read_totals)
+            if len(set(totals)) != 1:
+                errors.append(totals)
+
+    def post_invoices(postings: PostingQueue):
+        supplier = Payee(name="Supplier")
+        for number in range(POSTINGS):
+            invoice = postings.post(
+                "add_expense_invoice",
+                date(2021, 3, 1),
+                f"I{number}",
+                Decimal(5),
+                "//invoice",
+                supplier,
+            )
+            postings.post("pay_invoices", [invoice], date(2021, 3, 2), Decimal(5))
+
+    def post_from_thread(postings: PostingQueue, thread: int):
+        payee = Payee(name=f"Employee {thread}")
+        for number in range(POSTINGS):
+            day = date(2021, 1, 1 + number % 28)
+            postings.post("register_salary", day, Decimal(10), payee)
+
+    async def post_from_tasks(postings: PostingQueue):
+        async def task(number: int):
+            await postings.post_async("pay_taxes", date(2021, 2, 1), Decimal(1))
+
+        await asyncio.gather(*(task(number) for number in range(TASKS)))
+
+    with PostingQueue(manager) as postings:
+        readers = [
+            threading.Thread(target=reader, args=(postings,))
+            for reader in (
+                read_balances,
+                read_balances,
+                read_ledger,
+                read_documents,
+                read_subledgers,
+            )
+        ]
+        writers = [
+            threading.Thread(target=post_from_thread, args=(postings, thread))
+            for thread in range(THREADS)
+        ]
+        writers.append(threading.Thread(target=post_invoices, args=(postings,)))
+        for thread in readers + writers:
+            thread.start()
+        asyncio.run(post_from_tasks(postings))
+        for thread in writers:
+            thread.join()
+        stop.set()
+        for thread in readers:
+            thread.join()
+
+        assert postings.read(lambda manager: len(manager.book.transactions)) == (
+            THREADS * POSTINGS + TASKS + 2 * POSTINGS
+        )
+        assert postings.read(lambda manager: len(manager.book.documents)) == POSTINGS
+
+    assert not errors
+    chart = manager.chart
+    assert chart.salaries.balance == Money(-10 * THREADS * POSTINGS)
+    assert chart.taxes.balance == Money(TASKS)
+    assert ReportEngine(manager.book).trial_balance().is_balanced
+    for account in manager.book.accounts.values():
+        assert account.verify_balance() == 0
+    assert len(list(chart.taxes.iter_entries())) == TASKS
+
+
+def test_read_only_view(account_manager: AccountManager):
+    with PostingQueue(account_manager) as postings:
+        postings.post("pay_taxes", date(2021, 1, 1), Decimal(5))
+        with raises(TypeError):
+            postings.read(lambda manager: manager.pay_taxes(date(2021, 1, 2), 1))
+        assert postings.read(lambda manager: manager.chart.taxes.balance) == Money(5)
+        # Views are made again only after the book changed
+        view = postings._view
+        postings.balances()
+        assert postings._view is view
+        postings.post("pay_taxes", date(2021, 1, 3), Decimal(5))
+        assert postings.balances(["Taxes"]) == {"Taxes": Money(10)}
+    assert account_manager.chart.taxes.balance == Money(10)
+
+
+def test_posting_errors(account_manager: AccountManager):
+    postings = PostingQueue(account_manager)
+    with raises(RuntimeError):
+        postings.submit("pay_taxes", date(2021, 1, 1), Decimal(1))
+
+    with postings:
+        with raises(AttributeError):
+            postings.submit("_on_commit", None)
+        with raises(ValueError):
+            postings.post("register_salaries", [{"date": "not a date"}])
+        # The writer carries on after a failed operation
+        postings.post("pay_taxes", date(2021, 1, 1), Decimal(5))
+    assert account_manager.chart.taxes.balance == Money(5)
+
+
+def test_submit_while_closing(account_manager: AccountManager):
+    started, release = threading.Event(), threading.Event()
+
+    def block():
+        started.set()
+        release.wait()
+
+    account_manager.block = block
+    postings = PostingQueue(account_manager)
+    postings.start()
+    blocked = postings.submit("block")
+    started.wait()
+
+    # Closing waits for the blocked operation, with the stop already queued
+    closing = threading.Thread(target=postings.close)
+    closing.start()
+    while not postings._closed:
+        time.sleep(0.001)
+    with raises(RuntimeError):
+        postings.submit("pay_taxes", date(2021, 1, 1), Decimal(1))
+    with raises(RuntimeError):
+        postings.post("pay_taxes", date(2021, 1, 1), Decimal(1))
+
+    release.set()
+    closing.join()
+    assert blocked.result() is None
+    assert account_manager.chart.taxes.balance == 0
+
+    # It can be started again
+    with postings:
+        postings.post("pay_taxes", date(2021, 1, 1), Decimal(1))
+    assert account_manager.chart.taxes.balance == Money(1)
@@ -0,0 +1,72 @@
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date
+from decimal import Decimal
+
+from pytest import fixture
+
+from contador.core.consolidation import BinaryFile, SQLiteBook, consolidate
+from contador.core.entities import Book
+from contador.core.manager import AccountManager
+from contador.core.money import Money
+from contador.storage import binary
+from contador.storage.sqlite import SQLiteStore
+
+
+def company(number: int) -> AccountManager:
+    manager = AccountManager(Book(name=f"Company {number}", period="2021"))
+    manager.chart.add_account(f"Office {number}", "Expenses")
+    invoice = manager.add_expense_invoice(
+        date(2021, 1, 10), "1", Decimal(100 * number), "//invoice"
+    )
+    manager.pay_invoices([invoice], date(2021, 2, 1), Decimal(100 * number))
+    manager.pay_taxes(date(2021, 3, 1), Decimal(number))
+    return manager
+
+
+@fixture
+def sources(tmp_path) -> list:
+    sources = []
+    for number in (1, 2, 3):
+        path = tmp_path / f"company-{number}.ctdr"
+        with open(path, "wb") as file:
+            binary.dump(company(number).book, file)
+        sources.append(BinaryFile(path=str(path)))
+
+    path = str(tmp_path / "books.db")
+    with SQLiteStore(path) as store:
+        book = Book(name="Company 4", period="2021")
+        store.attach(book)
+        manager = AccountManager(book)
+        manager.pay_taxes(date(2021, 1, 5), Decimal(4))
+        store.save(book)
+        book.ledger.flush()
+    sources.append(SQLiteBook(path=path, uuid=book.uuid))
+    return sources
+
+
+def test_consolidate(sources: list):
+    in_memory = company(5).book
+    report = consolidate([*sources, in_memory], max_workers=2, shard_size=2)
+    assert report == consolidate([*sources, in_memory], max_workers=0)
+    assert report.is_balanced
+
+    lines = {line.name: line for line in report.lines}
+    assert lines["Bank Account"].balance == Money(-1 - 2 - 3 - 4 - 5 - 1100)
+    assert lines["Taxes"].balance == Money(15)
+    assert lines["Expenses"].balance == Money(1100)
+    assert lines["Office 2"].balance == 0
+    assert lines["Taxes"].type_ == "liability"
+    assert [line.name for line in report.lines][:2] == ["Expenses", "Revenue"]
+
+    report = consolidate(sources, as_of=date(2021, 1, 31), max_workers=2)
+    lines = {line.name: line for line in report.lines}
+    assert lines["Bank Account"].balance == Money(-4)
+    assert lines["Accounts Payable"].balance == Money(-600)
+
+
+def test_consolidate_with_executor(sources: list):
+    with ThreadPoolExecutor(2) as executor:
+        report = consolidate(sources, executor=executor)
+        # The executor is left running for its owner
+        assert executor.submit(len, sources).result() == 4
+    assert report == consolidate(sources, max_workers=0)
@@ -1,7 +1,16 @@
+from datetime import date, datetime, timedelta
 from decimal import Decimal
+from random import Random
+from sys import intern
 from uuid import uuid4
 
+from pydantic import BaseModel
+from pytest import raises
+
 from contador.core import entities
+from contador.core.index import Rollup
+from contador.core.manager import AccountManager
+from contador.core.money import Money
 
 
 def test_create_book():
@@ -50,6 +59,7 @@ def test_create_account(book):
 def test_dump_account(account: entities.Account):
     data = account.model_dump()
     assert data["name"] == account.name
+    assert "_state" not in data and "_state" not in repr(account)
     new_account = entities.Account(**data)
     assert new_account.uuid == account.uuid
 
@@ -155,3 +165,200 @@ def test_link_documents_and_transactions(
     del document.transactions[transaction.uuid.hex]
     assert transaction.documents.get(document.uuid.hex) is None
     assert document.transactions.get(transaction.uuid.hex) is None
+
+
+def test_account_running_balance(account: entities.Account):
+    account.initial_balance = Decimal(50.00)
+    account.debit(Decimal(100.00))
+    account.credit(Decimal(30.00))
+    assert account.balance == Decimal(120.00)
+
+    account.initial_balance = Decimal(0.0)
+    assert account.balance == Decimal(70.00)
+    assert account.verify_balance() == 0
+
+
+def test_account_balance_drift(account: entities.Account):
+    account.debit(Decimal(100.00))
+    entry = account.debit(Decimal(20.00))
+
+    # entries edited behind the account's back
+    entry.amount = Decimal(25.00)
+
+    try:
+        account.verify_balance()
+    except ValueError:
+        pass
+    else:
+        assert False, "Balance drift was not detected"
+
+    entities.Account.verify_balances = True
+    try:
+        account.balance
+    except ValueError:
+        pass
+    else:
+        assert False, "Balance drift was not detected"
+    finally:
+        entities.Account.verify_balances = False
+
+    assert account.verify_balance(fix=True) == Decimal(5.00)
+    assert account.balance == Decimal(125.00)
+
+
+def test_account_point_in_time_balances(book: entities.Book, account: entities.Account):
+    other = entities.Account(name="other account", book=book)
+    account.initial_balance = Decimal(10.00)
+
+    def post(date, amount):
+        transaction = entities.Transaction(date=date, description="post", book=book)
+        transaction.add_entries([account.debit(amount), other.credit(amount)])
+
+    post("2021-01-10", Decimal(100.00))
+    post("2021-03-01", Decimal(50.00))
+    assert account.balance_as_of(date(2021, 1, 31)) == Decimal(110.00)
+    assert account.balance_as_of(date(2021, 3, 1)) == Decimal(160.00)
+
+    # backdated posting lands between the existing ones
+    post("2021-02-15", Decimal(25.00))
+    assert account.balance_as_of(date(2020, 12, 31)) == Decimal(10.00)
+    assert account.balance_as_of(date(2021, 2, 15)) == Decimal(135.00)
+    assert account.balance_as_of(datetime(2021, 12, 31)) == account.balance
+    assert account.balance_between(date(2021, 2, 1), date(2021, 3, 1)) == Decimal(75)
+    assert account.balance_between(date(2021, 3, 2), date(2021, 4, 1)) == 0
+    assert other.balance_between(date(2021, 1, 1), date(2021, 2, 28)) == Decimal(
+        -125.00
+    )
+
+    # undated entries only count towards the current balance
+    account.debit(Decimal(5.00))
+    assert account.balance_as_of(date(2021, 12, 31)) == Decimal(185.00)
+    assert account.balance == Decimal(190.00)
+
+    # several backdated postings are merged in on the next query
+    post("2021-01-05", Decimal(1.00))
+    post("2021-01-01", Decimal(2.00))
+    post("2021-04-01", Decimal(3.00))
+    assert account.balance_as_of(date(2021, 1, 5)) == Decimal(13.00)
+    assert account.balance_as_of(date(2021, 12, 31)) == Decimal(191.00)
+
+
+def test_account_rollup(book: entities.Book, account: entities.Account):
+    random = Random(7)
+    other = entities.Account(name="other account", book=book)
+    postings = []
+    for _ in range(300):
+        day = date(2020, 1, 1) + timedelta(days=random.randrange(800))
+        amount = Money.from_units(random.randrange(-10_000, 10_000))
+        transaction = entities.Transaction(date=day, description="t", book=book)
+        transaction.add_entries([account.debit(amount), other.credit(amount)])
+        postings.append((day, amount))
+        if len(postings) == 150:
+            # Built from the date index, then kept up by the postings
+            assert account.rollup.total_between() == account.balance
+
+    for _ in range(50):
+        start = date(2019, 12, 1) + timedelta(days=random.randrange(900))
+        end = start + timedelta(days=random.randrange(400))
+        expected = Money.sum(amount for day, amount in postings if start <= day <= end)
+        assert account.rollup.total_between(start, end) == expected
+        assert account.balance_between(start, end) == expected
+
+    series = account.rollup.series("quarter", date(2020, 2, 15), date(2021, 3, 1))
+    assert list(series) == [f"2020-Q{quarter}" for quarter in range(1, 5)] + ["2021-Q1"]
+    assert Money.sum(series.values()) == account.rollup.total_between(
+        date(2020, 2, 15), date(2021, 3, 1)
+    )
+    with raises(ValueError):
+        account.rollup.series("week")
+
+    # An empty rollup with only one bound has nothing in range
+    empty = Rollup()
+    assert empty.total_between() == empty.total_between(date(2021, 1, 1)) == 0
+    assert empty.total_between(end=date(2021, 1, 1)) == 0
+    assert empty.series("month", date(2021, 1, 1)) == {}
+    assert empty.series("day", end=date(2021, 1, 1)) == {}
+
+
+def test_collection_indexes(book: entities.Book, payee: entities.Payee):
+    documents = [
+        entities.Document(
+            date=f"2021-01-0{day}",
+            number=str(day),
+            type_="invoice",
+            amount=Decimal(day),
+            payee=payee if day % 2 else None,
+            book=book,
+        )
+        for day in range(1, 6)
+    ]
+    first, second = documents[:2]
+
+    assert book.documents.by("number", "2") == [second]
+    assert book.documents.first("number", "9") is None
+    assert book.documents.by("payee", payee) == documents[::2]
+    assert book.documents.by("date", date(2021, 1, 1)) == [first]
+    assert len(book.documents.by("type_", "invoice")) == 5
+
+    # indexes follow removals
+    book.documents.remove(first)
+    del book.documents[second.uuid.hex]
+    book.documents.pop(documents[2].uuid.hex)
+    assert book.documents.by("payee", payee) == [documents[4]]
+    assert book.documents.first("number", "2") is None
+
+    # and attribute changes once the entity is reindexed
+    documents[3].number = "renumbered"
+    book.documents.reindex(documents[3])
+    assert book.documents.first("number", "renumbered") is documents[3]
+    assert book.documents.by("number", "4") == []
+
+    book.documents.clear()
+    assert book.documents.by("type_", "invoice") == []
+
+
+def test_book_indexes(book: entities.Book):
+    account = entities.Account(name="indexed account", book=book)
+    assert book.accounts.first("name", "indexed account") is account
+
+    transaction = entities.Transaction(
+        date="2021-05-01T10:30:00", description="test", book=book
+    )
+    assert book.transactions.by("date", date(2021, 5, 1)) == [transaction]
+
+
+def test_book_with_explicit_collections():
+    book = entities.Book(
+        name="test book", period="testing", accounts={}, transactions={}, documents={}
+    )
+    assert set(book.accounts.indexes) == {"name"}
+    assert set(book.documents.indexes) == {"number", "type_", "payee", "date"}
+
+    manager = AccountManager(book)
+    assert book.accounts.first("name", "Bank Account") is manager.chart.bank_account
+
+
+def test_trusted_model(book: entities.Book):
+    # trusted_model() fills in the instance layout of pydantic models itself
+    assert BaseModel.__slots__ == entities.MODEL_SLOTS
+    values = {"uuid": uuid4(), "date": datetime(2021, 1, 1), "description": "Rent"}
+    trusted = entities.trusted_model(entities.Transaction, values)
+    constructed = entities.Transaction.model_construct(**values)
+    for slot in entities.MODEL_SLOTS:
+        assert getattr(trusted, slot) == getattr(constructed, slot)
+    assert trusted == constructed
+    assert trusted.model_dump() == constructed.model_dump()
+    assert (
+        trusted.entries
+        is not entities.trusted_model(entities.Transaction, values).entries
+    )
+
+    # Interned like validated fields
+    description = " ".join(["Rent", "January"])
+    assert entities.trusted_model(
+        entities.Transaction, {"description": description}
+    ).description is intern("Rent January")
+
+    trusted.description = "Water"
+    assert trusted.model_fields_set == {"uuid", "date", "description"}
+    assert entities.Entity.trusted(uuid=values["uuid"]).uuid == values["uuid"]
@@ -0,0 +1,102 @@
+import io
+from datetime import date
+
+from contador.core.importer import Importer, read_csv, read_jsonl
+from contador.core.manager import AccountManager
+from contador.core.money import Money
+
+INVOICES = """date,number,amount,invoice_url,payee
+2021-01-10,00001,100.00,//1,Supplier
+2021-01-11,00002,250.50,//2,Supplier
+2021-01-11,00002,250.50,//2,Supplier
+2021-01-12,00003,not a number,//3,Supplier
+2021-01-13,00004,20,//4,
+"""
+
+STATEMENT = """{"date": "2021-02-01", "amount": "-100.00", "reference": "00001"}
+{"date": "2021-02-01", "amount": "-100.00", "reference": "00001"}
+{"date": "2021-02-02", "amount": "-5.00", "reference": "99999"}
+
+{"date": "2021-02-03", "amount": "-250.50", "reference": "00002"}
+"""
+
+
+def test_import_invoices_and_statement(account_manager: AccountManager):
+    reports = []
+    importer = Importer(
+        account_manager, "expense_invoice", chunk_size=2, progress=reports.append
+    )
+    report = importer.run(read_csv(io.StringIO(INVOICES)))
+
+    assert (report.read, report.posted, report.duplicates, report.rejected) == (
+        5,
+        3,
+        1,
+        1,
+    )
+    assert report.rejections[0].line == 5
+    assert report.rejections[0].reason.startswith("amount")
+    assert len(reports) == 2
+    assert account_manager.chart.accounts_payable.balance == Money("-370.50")
+    supplier = account_manager.book.documents.first("number", "00001").payee
+    assert account_manager.book.documents.first("number", "00002").payee is supplier
+
+    # Importing the same file again posts nothing
+    again = Importer(account_manager, "expense_invoice").run(
+        read_csv(io.StringIO(INVOICES))
+    )
+    assert (again.posted, again.duplicates) == (0, 4)
+
+    statement = Importer(account_manager, "bank_statement", chunk_size=10)
+    report = statement.run(read_jsonl(io.StringIO(STATEMENT)))
+    assert (report.read, report.posted, report.duplicates, report.rejected) == (
+        4,
+        2,
+        1,
+        1,
+    )
+    assert "99999" in report.rejections[0].reason
+    assert account_manager.chart.bank_account.balance == Money("-350.50")
+    invoice = account_manager.book.documents.first("number", "00002")
+    assert account_manager.is_invoice_clear(invoice)
+
+    # Payments already in the book are duplicates
+    again = Importer(account_manager, "bank_statement").run(
+        read_jsonl(io.StringIO(STATEMENT))
+    )
+    assert (again.posted, again.duplicates, again.rejected) == (0, 3, 1)
+    assert account_manager.chart.bank_account.balance == Money("-350.50")
+
+
+def test_import_file(tmp_path, account_manager: AccountManager):
+    path = tmp_path / "salaries.jsonl"
+    path.write_text(
+        '{"date": "2021-03-01", "amount": 200, "payee": "Employee"}\n'
+        '{"date": "2021-03-01", "amount": 300, "payee": "Other"}\n'
+    )
+    report = Importer(account_manager, "salary").import_file(path)
+    assert report.posted == 2
+    assert account_manager.chart.salaries.balance == Money(-500)
+    assert account_manager.chart.salaries.balance_as_of(date(2021, 2, 28)) == 0
+
+    # Salaries already in the book are duplicates
+    again = Importer(account_manager, "salary").import_file(path)
+    assert (again.posted, again.duplicates) == (0, 2)
+    assert account_manager.chart.salaries.balance == Money(-500)
+
+
+def test_import_rejects_unreadable_lines(account_manager: AccountManager):
+    lines = io.StringIO(
+        '{"date": "2021-03-01", "amount": 200, "payee": "Employee"}\n'
+        '{"date": "2021-03-01", "amount": \n'
+        '["2021-03-01", 100, "Other"]\n'
+        '{"date": "2021-03-02", "amount": 300, "payee": "Other"}\n'
+    )
+    report = Importer(account_manager, "salary").run(read_jsonl(lines))
+
+    assert (report.read, report.posted, report.rejected) == (4, 2, 2)
+    assert [rejection.line for rejection in report.rejections] == [2, 3]
+    assert report.rejections[0].reason.startswith("Invalid JSON")
+    assert report.rejections[0].row == {"text": '{"date": "2021-03-01", "amount": '}
+    assert report.rejections[1].reason == "Not a JSON object"
+    assert account_manager.chart.salaries.balance == Money(-500)
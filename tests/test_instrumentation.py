@@ -0,0 +1,106 @@
+import time
+from datetime import date
+from decimal import Decimal
+
+from pytest import raises
+
+from contador.core import instrumentation
+from contador.core.entities import Book, Payee, Transaction
+from contador.core.instrumentation import Metrics, hooked
+from contador.core.manager import AccountManager
+from contador.core.reports import ReportEngine
+
+
+def test_metrics(account_manager: AccountManager):
+    payee = Payee(name="Customer")
+    account_manager.pay_taxes(date(2021, 1, 1), Decimal(1))
+
+    with hooked(Metrics()) as metrics:
+        invoice = account_manager.add_sale_invoice(
+            date(2021, 1, 2), "1", Decimal(100), "//invoice", payee, Decimal(21)
+        )
+        account_manager.receive_payment([invoice], date(2021, 1, 3), Decimal(121))
+        account_manager.register_salaries(
+            [{"date": date(2021, 1, 28), "amount": Decimal(10), "payee": payee}]
+        )
+        ReportEngine(account_manager.book).trial_balance()
+        with raises(ValueError):
+            account_manager.register_salaries([{"date": "not a date"}])
+    assert not instrumentation.hooks
+
+    # Postings after the hook is removed are not measured
+    account_manager.pay_taxes(date(2021, 1, 4), Decimal(1))
+
+    snapshot = metrics.snapshot()
+    assert snapshot.counters == {
+        "entries": 8,
+        "AccountManager.add_sale_invoice.entries": 4,
+        "AccountManager.receive_payment.entries": 2,
+        "AccountManager.register_salaries.entries": 2,
+        "AccountManager.register_salaries.errors": 1,
+        "validate_rows.errors": 1,
+    }
+    histograms = snapshot.histograms
+    assert histograms["AccountManager.add_sale_invoice"].count == 1
+    assert histograms["AccountManager.register_salaries"].count == 2
+    assert histograms["UnitOfWork.validate"].count == 2
+    assert histograms["PostingBatch.validate"].count == 1
+    # Model validation is timed apart from balancing and posting
+    assert histograms["validate_rows"].count == 2
+    assert histograms["Entity.__init__"].count > 0
+    assert histograms["ReportEngine.account_totals"].count == 1
+    assert "AccountManager.pay_taxes" not in histograms
+
+    latency = histograms["ReportEngine.trial_balance"]
+    assert 0 < latency.minimum <= latency.mean <= latency.maximum
+    assert latency.quantile(0.5) == latency.maximum
+    assert sum(calls for _, calls in latency.buckets) == 1
+    assert snapshot.model_dump()["counters"]["entries"] == 8
+
+    metrics.reset()
+    assert metrics.snapshot().counters == {}
+
+
+def test_entries_counted_where_applied(book: Book):
+    chart = AccountManager(book).chart
+    with hooked(Metrics()) as metrics:
+        transaction = Transaction(date=date(2021, 1, 1), description="Tax", book=book)
+        transaction.add_entries(
+            [chart.taxes.credit(Decimal(1)), chart.bank_account.debit(Decimal(1))]
+        )
+    assert metrics.snapshot().counters == {"entries": 2}
+
+    columnar = Book(name="Columnar Book", period="Testing")
+    ledger = columnar.use_columnar_ledger()
+    chart = AccountManager(columnar).chart
+    with hooked(Metrics()) as metrics:
+        transaction = Transaction(
+            date=date(2021, 1, 1), description="Tax", book=columnar
+        )
+        ledger.post(transaction, [(chart.taxes, 1), (chart.bank_account, -1)])
+        with columnar.unit_of_work():
+            transaction.add_entries(
+                [chart.taxes.credit(Decimal(1)), chart.bank_account.debit(Decimal(1))]
+            )
+    assert metrics.snapshot().counters == {
+        "entries": 4,
+        "UnitOfWork.commit.entries": 2,
+    }
+
+
+def test_instrumented_generator():
+    @instrumentation.instrumented
+    def slow_items():
+        for item in range(3):
+            time.sleep(0.01)
+            yield item
+
+    with hooked(Metrics()) as metrics:
+        for item in slow_items():
+            # Time spent by the consumer is not the generator's
+            time.sleep(0.05)
+            if item == 1:
+                break
+    (histogram,) = metrics.snapshot().histograms.values()
+    assert histogram.count == 1
+    assert 0.02 <= histogram.total < 0.05
@@ -0,0 +1,177 @@
+from datetime import date
+from decimal import Decimal
+
+from pytest import raises
+
+from contador.core import entities
+from contador.core.manager import AccountManager
+from contador.core.money import Money
+from contador.core.subledger import BROUGHT_FORWARD, SALARIES
+from contador.storage.journal import Journal, recover
+
+
+def post_activity(manager: AccountManager) -> entities.Document:
+    employee = entities.Payee(name="Employee")
+    invoice = manager.add_expense_invoice(
+        date(2021, 1, 10), "00001", Decimal(100), "//invoice"
+    )
+    manager.pay_invoices([invoice], date(2021, 1, 20), Decimal("60.50"))
+    sale = manager.add_sale_invoice(
+        date(2021, 2, 5), "00002", Decimal(500), "//sale", employee, Decimal(65)
+    )
+    manager.receive_payment([sale], date(2021, 2, 25), Decimal(565))
+    manager.register_salary(date(2021, 3, 1), Decimal(200), employee)
+    manager.pay_salary(date(2021, 3, 5), Decimal(180), employee, Decimal(20))
+    manager.pay_taxes(date(2021, 3, 10), Decimal(45))
+    return invoice
+
+
+def balances(manager: AccountManager) -> dict[str, Money]:
+    return {account.name: account.balance for account in manager.book.accounts.values()}
+
+
+def total_balances(manager: AccountManager) -> dict[str, Money]:
+    accounts = manager.book.accounts.values()
+    return {account.name: account.total_balance for account in accounts}
+
+
+def assert_same_state(recovered: AccountManager, manager: AccountManager):
+    assert recovered.book.uuid == manager.book.uuid
+    assert balances(recovered) == balances(manager)
+    assert total_balances(recovered) == total_balances(manager)
+    assert [
+        (item.document.uuid, item.outstanding) for item in recovered.open_items.items()
+    ] == [(item.document.uuid, item.outstanding) for item in manager.open_items.items()]
+
+
+def test_recover_from_journal(tmp_path, book: entities.Book):
+    path = tmp_path / "book.journal"
+    manager = AccountManager(book, journal=Journal(path, group_size=4))
+    invoice = post_activity(manager)
+    manager.journal.close()
+
+    recovered = recover(path)
+    assert_same_state(recovered, manager)
+    document = recovered.book.documents[invoice.uuid.hex]
+    assert document.number == "00001"
+    assert set(document.transactions) == set(invoice.transactions)
+
+    # The recovered manager keeps writing to the same journal
+    recovered.pay_invoices([document], date(2021, 4, 1), Decimal("39.50"))
+    recovered.journal.close()
+    again = recover(path)
+    assert again.is_invoice_clear(again.book.documents[invoice.uuid.hex])
+    assert balances(again) == balances(recovered)
+
+
+def test_recover_from_snapshot(tmp_path, book: entities.Book):
+    path, snapshot_path = tmp_path / "book.journal", tmp_path / "book.snapshot"
+    journal = Journal(path, snapshot_path, group_size=1, snapshot_every=3)
+    manager = AccountManager(book, journal=journal)
+    invoice = post_activity(manager)
+    assert snapshot_path.exists()
+
+    # Without closing, as after a crash, and with a torn record at the end
+    with open(path, "ab") as file:
+        file.write(b"\x00\x00\x01\x00partial")
+
+    recovered = recover(path, snapshot_path)
+    assert_same_state(recovered, manager)
+    for account in recovered.book.accounts.values():
+        assert account.verify_balance() == 0
+        assert account.balance_as_of(date(2021, 12, 31)) == account.balance
+    assert recovered.open_items.outstanding(
+        recovered.book.documents[invoice.uuid.hex]
+    ) == Money("39.50")
+    recovered.journal.close()
+    assert_same_state(recover(path), manager)
+
+
+def test_snapshot_after_outer_unit_of_work(tmp_path, book: entities.Book):
+    path, snapshot_path = tmp_path / "book.journal", tmp_path / "book.snapshot"
+    journal = Journal(path, snapshot_path, group_size=1, snapshot_every=3)
+    manager = AccountManager(book, journal=journal)
+    with manager.unit_of_work():
+        invoice = post_activity(manager)
+        assert not snapshot_path.exists()
+    assert snapshot_path.exists()
+    manager.pay_invoices([invoice], date(2021, 4, 1), Decimal("39.50"))
+
+    recovered = recover(path, snapshot_path)
+    assert_same_state(recovered, manager)
+    assert recovered.is_invoice_clear(recovered.book.documents[invoice.uuid.hex])
+
+
+def test_rolled_back_operations_are_not_journaled(tmp_path, book: entities.Book):
+    path = tmp_path / "book.journal"
+    manager = AccountManager(book, journal=Journal(path))
+    manager.pay_taxes(date(2021, 1, 1), Decimal(10))
+    with raises(RuntimeError):
+        with manager.unit_of_work():
+            manager.pay_taxes(date(2021, 1, 2), Decimal(20))
+            raise RuntimeError
+    manager.journal.close()
+
+    assert balances(recover(path))["Taxes"] == Money(10)
+
+
+def test_recover_without_journal(tmp_path):
+    with raises(ValueError):
+        recover(tmp_path / "missing.journal")
+
+
+def test_recover_payee_balances(tmp_path, book: entities.Book):
+    path, snapshot_path = tmp_path / "book.journal", tmp_path / "book.snapshot"
+    journal = Journal(path, snapshot_path, group_size=1, snapshot_every=2)
+    manager = AccountManager(book, journal=journal)
+    employee = entities.Payee(name="Employee")
+    manager.register_salary(date(2021, 1, 31), Decimal(100), employee)
+    manager.register_salary(date(2021, 2, 28), Decimal(100), employee)
+    manager.pay_salary(date(2021, 3, 1), Decimal(150), employee)
+
+    # Balances come from the snapshot, postings after it from the journal
+    recovered = recover(path, snapshot_path)
+    assert recovered.payees.balance(employee, SALARIES) == Money(50)
+    assert [
+        line.posting.description for line in recovered.payees.statement(employee)
+    ] == [BROUGHT_FORWARD, "Salary payment to Employee"]
+
+
+def test_recover_bulk_operations(tmp_path, book: entities.Book):
+    path = tmp_path / "book.journal"
+    manager = AccountManager(book, journal=Journal(path))
+    employee = entities.Payee(name="Employee")
+    expenses = manager.post_expense_invoices(
+        {
+            "date": date(2021, 1, day),
+            "number": f"E{day}",
+            "amount": 10,
+            "invoice_url": "",
+        }
+        for day in (1, 2)
+    )
+    manager.post_sale_invoices(
+        [
+            {
+                "date": date(2021, 1, 3),
+                "number": "S1",
+                "amount": 100,
+                "invoice_url": "//s1",
+                "payee": employee,
+                "tax_amount": 5,
+            }
+        ]
+    )
+    manager.register_salaries(
+        [{"date": date(2021, 1, 31), "amount": 200, "payee": employee}]
+    )
+    manager.journal.close()
+
+    recovered = recover(path)
+    assert_same_state(recovered, manager)
+    assert set(recovered.book.documents) == set(book.documents)
+    assert (
+        recovered.is_invoice_clear(recovered.book.documents[expenses[0].uuid.hex])
+        is False
+    )
+    assert recovered.payees.balance(employee, SALARIES) == Money(200)
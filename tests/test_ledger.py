@@ -0,0 +1,119 @@
+import time
+from datetime import date
+from decimal import Decimal
+
+from pytest import fixture
+
+from contador.core import entities, ledger, query
+from contador.core.manager import AccountManager
+
+
+@fixture(params=["numpy", "python"])
+def columnar_book(request, monkeypatch) -> entities.Book:
+    if request.param == "python":
+        monkeypatch.setattr(ledger, "numpy", None)
+        monkeypatch.setattr(query, "numpy", None)
+    book = entities.Book(name="Columnar Book", period="Testing")
+    book.use_columnar_ledger()
+    return book
+
+
+def test_columnar_ledger_posting(columnar_book: entities.Book):
+    manager = AccountManager(columnar_book)
+    invoice = manager.add_expense_invoice(
+        date(2021, 1, 10), "0001", Decimal(100.00), "//invoice"
+    )
+    manager.pay_invoices([invoice], date(2021, 2, 10), Decimal(100.00))
+
+    bank = manager.chart.bank_account
+    payable = manager.chart.accounts_payable
+    assert len(columnar_book.ledger) == 4
+    assert not bank.entries and not payable.entries
+    assert bank.balance == Decimal(-100.00)
+    assert payable.balance == 0
+    assert payable.balance_as_of(date(2021, 1, 31)) == Decimal(-100.00)
+    assert bank.balance_between(date(2021, 2, 1), date(2021, 2, 28)) == Decimal(-100)
+    assert bank.verify_balance() == 0
+    assert manager.is_invoice_clear(invoice) is True
+
+    entries = list(payable.iter_entries())
+    assert [entry.amount for entry in entries] == [Decimal(-100), Decimal(100)]
+    assert all(entry.account is payable for entry in entries)
+    assert entries[0].uuid == next(payable.iter_entries()).uuid
+
+    totals = columnar_book.ledger.totals_by_account()
+    assert totals[manager.chart.expenses.uuid.hex] == Decimal(100.00)
+    assert totals[bank.uuid.hex] == Decimal(-100.00)
+
+
+def test_columnar_ledger_post(columnar_book: entities.Book):
+    cash = entities.Account(name="cash", book=columnar_book)
+    sales = entities.Account(name="sales", book=columnar_book)
+    transaction = entities.Transaction(
+        date="2021-03-01", description="sale", book=columnar_book
+    )
+
+    columnar_book.ledger.post(
+        transaction, [(cash, Decimal("10.25")), (sales, Decimal("-10.25"))]
+    )
+    assert cash.balance == Decimal("10.25")
+    assert [entry.amount for entry in transaction.iter_entries()] == [
+        Decimal("10.25"),
+        Decimal("-10.25"),
+    ]
+
+    try:
+        columnar_book.ledger.post(transaction, [(cash, Decimal(1))])
+    except ValueError:
+        pass
+    else:
+        assert False, "Unbalanced postings were stored"
+    assert len(columnar_book.ledger) == 2
+
+
+def test_columnar_ledger_must_be_chosen_first(book: entities.Book):
+    entities.Transaction(date="2021-01-01", description="test", book=book)
+    try:
+        book.use_columnar_ledger()
+    except ValueError:
+        pass
+    else:
+        assert False, "The ledger was enabled on a book with transactions"
+
+
+def test_columnar_ledger_post_while_reading(columnar_book: entities.Book):
+    manager = AccountManager(columnar_book)
+    for day in (1, 2, 3):
+        manager.pay_taxes(date(2021, 1, day), Decimal(1))
+
+    # Reads must not hold on to the columns, or the next append cannot grow them
+    for _ in manager.chart.taxes.iter_entries():
+        manager.pay_taxes(date(2021, 2, 1), Decimal(1))
+    for _ in columnar_book.query().account("Taxes"):
+        manager.pay_taxes(date(2021, 3, 1), Decimal(1))
+
+    bank = manager.chart.bank_account
+    assert bank.balance == Decimal(-12)
+    assert bank.verify_balance() == 0
+    assert len(columnar_book.ledger) == 24
+
+
+def test_columnar_ledger_posting_scales(columnar_book: entities.Book):
+    chart = AccountManager(columnar_book).chart
+
+    def seconds_per_transaction(count: int) -> float:
+        start = time.perf_counter()
+        for _ in range(count):
+            transaction = entities.Transaction(
+                date=date(2021, 1, 1), description="Tax", book=columnar_book
+            )
+            transaction.add_entries(
+                [chart.taxes.credit(Decimal(1)), chart.bank_account.debit(Decimal(1))]
+            )
+        return (time.perf_counter() - start) / count
+
+    # Checking that a transaction balances must not read the earlier ones
+    small = min(seconds_per_transaction(250) for _ in range(3))
+    large = seconds_per_transaction(2000)
+    assert large < 3 * small
+    assert chart.bank_account.verify_balance() == 0
@@ -0,0 +1,114 @@
+import pickle
+from decimal import ROUND_HALF_EVEN, Decimal, getcontext
+
+from pydantic import BaseModel, ValidationError
+
+from contador.core import entities
+from contador.core.money import Money
+from contador.core.reports import TrialBalance
+
+
+def test_create_money():
+    assert Money(10).units == 1000
+    assert Money("10.005").units == 1001
+    assert Money("10.005", rounding=ROUND_HALF_EVEN).units == 1000
+    assert Money(2.675).units == 268
+    assert Money(Decimal("-1.5"), scale=0).units == -2
+    assert Money("1.2345", scale=4).units == 12345
+    assert Money.from_units(150) == Money("1.50")
+
+    for value in [None, "ten", "Infinity", object()]:
+        try:
+            Money(value)
+        except (TypeError, ValueError, ArithmeticError):
+            pass
+        else:
+            assert False, f"Money was built from {value!r}"
+
+
+def test_money_arithmetic():
+    assert Money("10.10") + Money("0.90") == Money(11)
+    assert Money(10) - Decimal("0.01") == Money("9.99")
+    assert 5 - Money(1) == Money(4)
+    assert -Money(3) == Money(-3)
+    assert abs(Money(-3)) == Money(3)
+    assert -1 * Money("2.50") == Money("-2.50")
+    assert Money(500) * Decimal("0.13") == Money(65)
+    assert Money(10) / 3 == Money("3.33")
+    assert sum([Money(1), Money(2)]) == Money(3)
+
+    # mixed scales widen to the larger one
+    total = Money("1.25") + Money("0.005", scale=3)
+    assert total.scale == 3 and total.units == 1255
+    assert Money.sum([Money(1), Money("0.001", scale=3), 2]) == Money("3.001", scale=3)
+
+
+def test_money_comparisons():
+    assert Money(0) == 0
+    assert not Money(0)
+    assert Money("65.00") == Money(Decimal(500) * Decimal(0.13))
+    assert Money(150) == 150.0
+    # Exact, like the hashes
+    assert Money("65.00") != Decimal(500) * Decimal(0.13)
+    assert Money(0) != Decimal("0.001") and Money(0) != 0.004
+    assert Money(0) < Decimal("0.001") and Money("0.1") != 0.1
+    assert Money("0.5") == 0.5 and hash(Money("0.5")) == hash(0.5)
+    assert Money(1) != "1.00"
+    assert Money(1) < Money("1.01") <= 2
+    assert Money(3) > 2 and Money(3) >= Decimal(3)
+    assert Money(1) != "one" and Money(1) != None  # noqa: E711
+    assert hash(Money(1)) == hash(Money("1.000", scale=3)) == hash(1)
+    assert str(Money("-3.5")) == "-3.50"
+    assert f"{Money(1234):,.2f}" == "1,234.00"
+
+
+def test_money_is_not_limited_by_decimal_context():
+    assert getcontext().prec == 28
+    assert Money("12345678901234567890.12") + Money("0.01") == Money(
+        "12345678901234567890.13"
+    )
+
+
+def test_money_pydantic_integration():
+    class Invoice(BaseModel):
+        amount: Money
+
+    invoice = Invoice(amount="10.50")
+    assert invoice.amount == Money("10.50")
+    assert invoice.model_dump()["amount"] is invoice.amount
+    assert invoice.model_dump_json() == '{"amount":"10.50"}'
+    assert Invoice.model_validate_json(invoice.model_dump_json()) == invoice
+
+    try:
+        Invoice(amount="a lot")
+    except ValidationError:
+        pass
+    else:
+        assert False, "Invalid amount was accepted"
+
+    assert pickle.loads(pickle.dumps(invoice.amount)) == invoice.amount
+
+
+def test_money_json_schema():
+    schema = entities.Document.model_json_schema()
+    assert schema["properties"]["amount"]["anyOf"] == [
+        {"type": "number"},
+        {"type": "string"},
+    ]
+    schema = entities.Document.model_json_schema(mode="serialization")
+    assert schema["properties"]["amount"]["type"] == "string"
+    for model in (entities.Entry, entities.Account, TrialBalance):
+        assert model.model_json_schema()
+
+    class Invoice(BaseModel):
+        amount: Money
+
+    # Numbers in JSON are read exactly, like strings
+    assert Invoice.model_validate_json('{"amount": 2.675}').amount.units == 268
+    assert Invoice.model_validate_json('{"amount": "0.1"}').amount == Money("0.10")
+
+
+def test_large_balances(account: entities.Account):
+    account.debit(Decimal("12345.67"))
+    account.debit(Decimal("99999.99"))
+    assert account.balance == Money("112345.66")
@@ -0,0 +1,87 @@
+from datetime import date
+from decimal import Decimal
+
+from pytest import fixture, raises
+
+from contador.core import entities, ledger, query
+from contador.core.manager import AccountManager
+from contador.core.money import Money
+from contador.storage.sqlite import SQLiteStore
+
+
+@fixture(params=["objects", "columnar", "python", "sqlite"])
+def manager(request, book: entities.Book, monkeypatch) -> AccountManager:
+    if request.param == "python":
+        monkeypatch.setattr(ledger, "numpy", None)
+        monkeypatch.setattr(query, "numpy", None)
+    if request.param in ("columnar", "python"):
+        book.use_columnar_ledger()
+    if request.param == "sqlite":
+        store = SQLiteStore()
+        request.addfinalizer(store.close)
+        store.attach(book)
+    manager = AccountManager(book)
+    supplier = entities.Payee(name="Supplier")
+    customer = entities.Payee(name="Customer")
+    for month, amount in [(2, 500), (3, 1500), (4, 800), (5, 2500), (6, 3000)]:
+        manager.add_expense_invoice(
+            date(2021, month, 10), f"E{month}", Decimal(amount), "//e", supplier
+        )
+    manager.add_expense_invoice(date(2021, 4, 1), "X", Decimal(4000), "//x")
+    sale = manager.add_sale_invoice(
+        date(2021, 4, 20), "S1", Decimal(1000), "//s", customer, Decimal(210)
+    )
+    manager.receive_payment([sale], date(2021, 5, 2), Decimal(1210))
+    return manager
+
+
+def test_filters(manager: AccountManager):
+    query = manager.book.query()
+    expenses = query.account("Expenses")
+    spring = expenses.payee("Supplier").between(date(2021, 3, 1), date(2021, 5, 31))
+
+    entries = list(spring.amount(minimum=1000))
+    assert [entry.amount for entry in entries] == [Money(1500), Money(2500)]
+    assert all(entry.account.name == "Expenses" for entry in entries)
+    assert spring.count() == 3
+    assert spring.sum() == Money(4800)
+
+    # Filters give new queries and leave the original alone
+    assert expenses.count() == 6
+    assert query.document_type("sale invoice").count() == 6
+    payee = manager.book.documents.first("number", "S1").payee
+    received = query.payee(payee).account("Bank Account")
+    assert [entry.amount for entry in received] == [Money(1210)]
+    assert query.between(end=date(2021, 2, 28)).count() == 2
+    assert query.amount(maximum=-2500).sum() == Money(-9500)
+    # Zero is a bound like any other
+    assert query.payee(payee).amount(minimum=0).sum() == Money(2420)
+    assert query.payee(payee).amount(maximum=Money(0)).count() == 3
+
+    with raises(LookupError):
+        query.account("Nowhere")
+
+
+def test_pages_and_aggregates(manager: AccountManager):
+    query = manager.book.query().account("Expenses", "Accounts Payable")
+    entries = list(query)
+    assert [entry.transaction.date for entry in entries] == sorted(
+        entry.transaction.date for entry in entries
+    )
+    assert query.page(0, size=5) == entries[:5]
+    assert query.page(2, size=5) == entries[10:]
+    assert query.first() == entries[0]
+
+    assert query.group_by("account") == {
+        "Expenses": Money(12300),
+        "Accounts Payable": Money(-12300),
+    }
+    assert query.account("Expenses").group_by("month") == {
+        "2021-02": Money(500),
+        "2021-03": Money(1500),
+        "2021-04": Money(4800),
+        "2021-05": Money(2500),
+        "2021-06": Money(3000),
+    }
+    with raises(ValueError):
+        query.group_by("payee")
@@ -0,0 +1,69 @@
+from datetime import date
+from decimal import Decimal
+
+from pytest import mark
+
+from contador.core.entities import Book
+from contador.core.manager import AccountManager
+from contador.core.money import Money
+
+
+@mark.parametrize("columnar", [False, True])
+def test_reconcile_bank_statement(book: Book, columnar: bool):
+    if columnar:
+        book.use_columnar_ledger()
+    manager = AccountManager(book)
+    for day, amount in [(3, 50), (3, 50), (10, 80), (12, 30), (20, 99)]:
+        manager.pay_taxes(date(2021, 1, day), Decimal(amount))
+
+    report = manager.reconcile_bank_statement(
+        [
+            {"date": "2021-01-03", "amount": "-50.00"},
+            {"date": "2021-01-13", "amount": "-30.00", "reference": "T-2"},
+            {"date": "2021-01-04", "amount": "-50.00"},
+            {"date": "2021-01-10", "amount": "-80.10"},
+            {"date": "2021-01-25", "amount": "-99.00"},
+        ],
+        days=3,
+        amount_tolerance=Decimal("0.25"),
+    )
+
+    matched = {
+        (match.line.date.day, match.entry.transaction.date.day, match.exact)
+        for match in report.matches
+    }
+    assert matched == {(3, 3, True), (13, 12, False), (4, 3, False), (10, 10, False)}
+    assert [line.date.day for line in report.unmatched_lines] == [25]
+    assert [entry.amount for entry in report.unmatched_entries] == [Money(-99)]
+    assert not report.is_complete
+
+    # Reconciled entries are left out of the next run
+    reconciler = manager.reconciler
+    assert len(reconciler.reconciled) == 4
+    assert [entry.amount for entry in reconciler.unreconciled()] == [Money(-99)]
+    report = manager.reconcile_bank_statement(
+        [{"date": "2021-01-22", "amount": "-99.00"}]
+    )
+    assert report.is_complete
+    assert reconciler.is_reconciled(report.matches[0].entry)
+
+
+def test_reconcile_pairs_in_day_order(account_manager: AccountManager):
+    for day in (1, 2, 6):
+        account_manager.pay_taxes(date(2021, 1, day), Decimal(10))
+
+    # A greedy match of the first line to the closest entry would leave the
+    # second line without one
+    report = account_manager.reconcile_bank_statement(
+        [
+            {"date": "2021-01-03", "amount": "-10"},
+            {"date": "2021-01-04", "amount": "-10"},
+            {"date": "2021-01-08", "amount": "-10"},
+        ],
+        days=2,
+    )
+    assert report.is_complete
+    assert sorted(
+        (match.line.date.day, match.entry.transaction.date.day)
+        for match in report.matches
+    ) == [(3, 1), (4, 2), (8, 6)]
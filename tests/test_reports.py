@@ -0,0 +1,111 @@
+from datetime import date
+from decimal import Decimal
+
+from pytest import fixture
+
+from contador.core import entities
+from contador.core.manager import AccountManager
+from contador.core.money import Money
+from contador.core.reports import ReportEngine, totals_from_transactions
+
+
+@fixture(params=["objects", "columnar"])
+def manager(request, book: entities.Book) -> AccountManager:
+    if request.param == "columnar":
+        book.use_columnar_ledger()
+    manager = AccountManager(book)
+
+    customer = entities.Payee(name="Customer 1")
+    invoice = manager.add_expense_invoice(
+        date(2021, 1, 10), "00001", Decimal(100), "//invoice"
+    )
+    manager.pay_invoices([invoice], date(2021, 1, 20), Decimal(100))
+    sale = manager.add_sale_invoice(
+        date(2021, 2, 5), "00001", Decimal(500), "//sale", customer, Decimal(65)
+    )
+    manager.receive_payment([sale], date(2021, 2, 25), Decimal(565))
+    manager.register_salary(date(2021, 3, 1), Decimal(200), customer)
+    return manager
+
+
+def test_trial_balance(manager: AccountManager):
+    engine = ReportEngine(manager.book)
+
+    trial_balance = engine.trial_balance()
+    assert trial_balance.is_balanced
+    assert trial_balance.total_debit == Money(765)
+    lines = {line.name: line for line in trial_balance.lines}
+    assert lines["Bank Account"].debit == Money(465)
+    assert lines["Revenue"].credit == Money(500)
+    assert lines["Salaries"].type_ == "liability"
+
+    january = engine.trial_balance(as_of=date(2021, 1, 31))
+    assert january.is_balanced
+    assert {line.name: line.balance for line in january.lines}["Bank Account"] == -100
+
+    totals = totals_from_transactions(manager.book.transactions.values())
+    for line in trial_balance.lines:
+        assert totals.get(line.uuid.hex, 0) == line.balance
+
+
+def test_income_statement(manager: AccountManager):
+    engine = ReportEngine(manager.book)
+
+    statement = engine.income_statement()
+    assert statement.total_income == Money(500)
+    assert statement.total_expenses == Money(300)
+    assert statement.net_income == Money(200)
+
+    february = engine.income_statement(date(2021, 2, 1), date(2021, 2, 28))
+    assert february.total_income == Money(500)
+    assert february.total_expenses == 0
+
+
+def test_balance_sheet(manager: AccountManager):
+    engine = ReportEngine(manager.book)
+
+    sheet = engine.balance_sheet()
+    assert sheet.is_balanced
+    assert sheet.total_assets == Money(465)
+    assert sheet.total_liabilities == Money(265)
+    assert sheet.total_equity == Money(200)
+
+    january = engine.balance_sheet(as_of=date(2021, 1, 31))
+    assert january.is_balanced
+    assert january.net_income == Money(-100)
+
+
+def test_period_totals(manager: AccountManager):
+    engine = ReportEngine(manager.book)
+
+    months = engine.period_totals(
+        "month", date(2021, 1, 1), date(2021, 3, 31), ["Bank Account", "Taxes"]
+    )
+    assert [(line.name, line.period, line.total) for line in months] == [
+        ("Bank Account", "2021-01", Money(-100)),
+        ("Bank Account", "2021-02", Money(565)),
+        ("Bank Account", "2021-03", Money(0)),
+        ("Taxes", "2021-01", Money(0)),
+        ("Taxes", "2021-02", Money(-65)),
+        ("Taxes", "2021-03", Money(0)),
+    ]
+    quarters = engine.period_totals(
+        "quarter", date(2021, 1, 25), date(2021, 12, 31), ["Bank Account"]
+    )
+    assert [(line.period, line.total) for line in quarters] == [
+        ("2021-Q1", Money(565)),
+        ("2021-Q2", Money(0)),
+        ("2021-Q3", Money(0)),
+        ("2021-Q4", Money(0)),
+    ]
+
+    # Once built, rollups follow new postings
+    manager.pay_taxes(date(2021, 3, 10), Decimal(65))
+    bank = manager.chart.bank_account
+    assert bank.rollup.total_between(date(2021, 3, 1), date(2021, 3, 31)) == -65
+    assert bank.rollup.total_between() == bank.balance
+    assert bank.rollup.series("day", date(2021, 1, 19), date(2021, 1, 21)) == {
+        "2021-01-19": Money(0),
+        "2021-01-20": Money(-100),
+        "2021-01-21": Money(0),
+    }
@@ -0,0 +1,114 @@
+from datetime import date
+from decimal import Decimal
+
+from pytest import fixture, raises
+
+from contador.core import entities
+from contador.core.manager import AccountManager
+from contador.core.money import Money
+from contador.core.reports import ReportEngine
+from contador.core.subledger import PAYABLE
+
+
+@fixture(params=["objects", "columnar"])
+def manager(request, book: entities.Book) -> AccountManager:
+    if request.param == "columnar":
+        book.use_columnar_ledger()
+    manager = AccountManager(book)
+    invoice = manager.add_expense_invoice(
+        date(2021, 1, 10), "00001", Decimal(100), "//invoice"
+    )
+    manager.pay_invoices([invoice], date(2021, 1, 20), Decimal(60))
+    manager.pay_taxes(date(2021, 2, 1), Decimal(30))
+    return manager
+
+
+def test_snapshot_is_stable(manager: AccountManager):
+    book = manager.book
+    snapshot = book.snapshot()
+    open_items = manager.open_items.snapshot()
+    before = ReportEngine(snapshot).trial_balance(date(2021, 12, 31))
+    bank = snapshot.accounts.first("name", "Bank Account")
+    assert snapshot.version == book.version
+    assert bank.balance == Money(-90)
+
+    # Postings after the snapshot, including backdated ones
+    invoice = book.documents.first("number", "00001")
+    manager.pay_invoices([invoice], date(2021, 1, 15), Decimal(40))
+    manager.pay_taxes(date(2021, 3, 1), Decimal(5))
+    assert book.version > snapshot.version
+
+    after = ReportEngine(snapshot).trial_balance(date(2021, 12, 31))
+    assert after.lines == before.lines
+    assert bank.balance == Money(-90)
+    assert bank.balance_as_of(date(2021, 1, 31)) == Money(-60)
+    assert bank.rollup.total_between(date(2021, 1, 1), date(2021, 1, 31)) == -60
+    assert Money.sum(entry.amount for entry in bank.iter_entries()) == -90
+    assert snapshot.accounts.first("name", "Taxes").parent.name == "Liabilities"
+    assert snapshot.query().account("Bank Account").sum() == Money(-90)
+    assert open_items.total(PAYABLE) == Money(40)
+    assert manager.open_items.total(PAYABLE) == 0
+
+    live = book.accounts.first("name", "Bank Account")
+    assert live.balance == Money(-135)
+    assert live.balance_as_of(date(2021, 1, 31)) == Money(-100)
+    assert book.snapshot().accounts[live.uuid.hex].balance == Money(-135)
+
+
+def test_snapshot_is_read_only(manager: AccountManager):
+    snapshot = manager.book.snapshot()
+    account = snapshot.accounts.first("name", "Taxes")
+    with raises(TypeError):
+        account.debit(Money(1))
+    with raises(TypeError):
+        snapshot.add_account(entities.Account(name="New"))
+    with raises(TypeError):
+        AccountManager(snapshot).pay_taxes(date(2021, 1, 1), Decimal(1))
+    with raises(ValueError):
+        account.name = "Renamed"
+
+
+def test_version_moves_once_per_commit(book: entities.Book):
+    chart = AccountManager(book).chart
+
+    def post(entries: int) -> int:
+        before = book.version
+        with book.unit_of_work():
+            transaction = entities.Transaction(
+                date=date(2021, 1, 1), description="Split", book=book
+            )
+            credits = [chart.taxes.credit(Decimal(1)) for _ in range(entries)]
+            transaction.add_entries([*credits, chart.bank_account.debit(entries)])
+        return book.version - before
+
+    assert post(1) == post(100) > 0
+    assert book.snapshot().version == book.version
+
+
+def test_snapshot_leaves_out_later_postings(manager: AccountManager):
+    book = manager.book
+    supplier = entities.Payee(name="Supplier")
+    invoice = manager.add_expense_invoice(
+        date(2021, 3, 1), "00002", Decimal(50), "//invoice", supplier
+    )
+    snapshot = book.snapshot()
+    transactions, documents = len(snapshot.transactions), len(snapshot.documents)
+    before = snapshot.query().payee(supplier).count()
+
+    # A payment links a new transaction to the invoice, posted before
+    manager.pay_invoices([invoice], date(2021, 3, 10), Decimal(50))
+    later = manager.add_expense_invoice(
+        date(2021, 3, 2), "00003", Decimal(10), "//invoice", supplier
+    )
+    assert len(book.transactions) == transactions + 2
+
+    assert snapshot.query().payee(supplier).count() == before == 2
+    assert len(snapshot.transactions) == transactions
+    assert len(snapshot.documents) == documents
+    assert later.uuid.hex not in snapshot.documents
+    assert snapshot.documents.by("payee", supplier) == [invoice]
+    assert snapshot.documents.first("number", "00003") is None
+    assert len(snapshot.transactions_of(invoice)) == 1
+    assert len(book.transactions_of(invoice)) == 2
+    with raises(TypeError):
+        snapshot.transactions_of(invoice).add(later)
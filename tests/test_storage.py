@@ -0,0 +1,140 @@
+import sqlite3
+from datetime import date
+from decimal import Decimal
+
+from pytest import fixture, raises
+
+from contador.core import entities
+from contador.core.manager import AccountManager
+from contador.core.money import Money
+from contador.core.reports import ReportEngine
+from contador.storage.sqlite import LazyCollection, SQLiteStore
+
+
+def post_activity(manager: AccountManager) -> entities.Document:
+    customer = entities.Payee(name="Customer 1")
+    invoice = manager.add_expense_invoice(
+        date(2021, 1, 10), "00001", Decimal(100), "//invoice"
+    )
+    manager.pay_invoices([invoice], date(2021, 1, 20), Decimal(60))
+    sale = manager.add_sale_invoice(
+        date(2021, 2, 5), "00002", Decimal(500), "//sale", customer, Decimal(65)
+    )
+    manager.receive_payment([sale], date(2021, 2, 25), Decimal(565))
+    return invoice
+
+
+@fixture(params=["objects", "columnar"])
+def saved_book(request, tmp_path, book: entities.Book):
+    if request.param == "columnar":
+        book.use_columnar_ledger()
+    post_activity(AccountManager(book))
+    with SQLiteStore(tmp_path / "books.db") as store:
+        store.save(book)
+    return book, tmp_path / "books.db"
+
+
+def test_save_and_load(saved_book):
+    book, path = saved_book
+    with SQLiteStore(path) as store:
+        loaded = store.load(book.uuid)
+        assert isinstance(loaded.transactions, LazyCollection)
+        assert not loaded.transactions.loaded
+
+        # Balances come from aggregates, nothing else is read
+        for account in book.accounts.values():
+            stored = loaded.accounts[account.uuid.hex]
+            assert stored.balance == account.balance
+            assert stored.balance_as_of(date(2021, 1, 31)) == account.balance_as_of(
+                date(2021, 1, 31)
+            )
+            assert stored.verify_balance() == 0
+            assert stored.total_balance == account.total_balance
+            if account.parent is not None:
+                assert stored.parent.uuid == account.parent.uuid
+        assert not loaded.transactions.in_memory()
+
+        invoice = loaded.documents.first("number", "00001")
+        assert invoice.amount == Money(100)
+        assert not loaded.documents.loaded
+        assert [t.description for t in invoice.transactions.values()] == [
+            "Invoice 00001",
+            "Payment for invoices",
+        ]
+        assert loaded.documents.by("date", date(2021, 2, 5))[0].payee.name == (
+            "Customer 1"
+        )
+
+        # Entries are read through the ledger and share the loaded objects
+        bank = loaded.accounts.first("name", "Bank Account")
+        entries = list(bank.iter_entries())
+        assert Money.sum(entry.amount for entry in entries) == bank.balance
+        assert (
+            entries[0].transaction
+            is loaded.transactions[entries[0].transaction.uuid.hex]
+        )
+        assert len(loaded.transactions) == len(book.transactions)
+
+        original = ReportEngine(book).trial_balance(date(2021, 1, 31))
+        report = ReportEngine(loaded).trial_balance(date(2021, 1, 31))
+        assert report.lines == original.lines
+
+
+def test_load_unknown_book(tmp_path):
+    with SQLiteStore(tmp_path / "books.db") as store:
+        with raises(ValueError):
+            store.load(entities.Book(name="Missing", period="Testing").uuid)
+
+
+def test_attached_book(tmp_path, book: entities.Book):
+    path = tmp_path / "books.db"
+    with SQLiteStore(path, batch_size=3) as store:
+        ledger = store.attach(book)
+        manager = AccountManager(book)
+        invoice = post_activity(manager)
+        bank = manager.chart.bank_account
+
+        assert not bank.entries
+        assert len(ledger) == 10
+        assert bank.balance == Money(505)
+        assert bank.verify_balance() == 0
+        assert manager.is_invoice_clear(invoice) is False
+        store.save(book)
+
+    with SQLiteStore(path) as store:
+        loaded = store.load(book.uuid)
+        manager = AccountManager(loaded)
+        invoice = loaded.documents.first("number", "00001")
+        manager.pay_invoices([invoice], date(2021, 3, 1), Decimal(40))
+        assert manager.chart.bank_account.balance == Money(465)
+        assert manager.is_invoice_clear(invoice) is True
+        store.save(loaded)
+
+    with SQLiteStore(path) as store:
+        loaded = store.load(book.uuid)
+        assert loaded.accounts.first("name", "Bank Account").balance == Money(465)
+        invoice = loaded.documents.first("number", "00001")
+        assert len(invoice.transactions) == 3
+
+
+def test_attached_book_write_error(tmp_path, book: entities.Book, monkeypatch):
+    with SQLiteStore(tmp_path / "books.db", batch_size=3) as store:
+        ledger = store.attach(book)
+        manager = AccountManager(book)
+        manager.pay_taxes(date(2021, 1, 5), Decimal(5))
+
+        def insert_entries(rows):
+            raise sqlite3.OperationalError("database is locked")
+
+        monkeypatch.setattr(store, "_insert_entries", insert_entries)
+        with raises(sqlite3.OperationalError):
+            with manager.unit_of_work():
+                manager.pay_taxes(date(2021, 1, 6), Decimal(10))
+        monkeypatch.undo()
+
+        # The rows buffered before are kept, the ones of the failed commit not
+        assert len(ledger) == 2
+        assert len(book.transactions) == 1
+        assert manager.chart.taxes.balance == Money(5)
+        for account in book.accounts.values():
+            assert account.verify_balance() == 0
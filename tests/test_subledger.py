@@ -0,0 +1,274 @@
+from datetime import date
+from decimal import Decimal
+
+from pytest import raises
+
+from contador.core.entities import Payee
+from contador.core.index import REMOVED, LayeredMap
+from contador.core.manager import AccountManager, ExpenseInvoiceRow
+from contador.core.money import Money
+from contador.core.subledger import BROUGHT_FORWARD, PAYABLE, RECEIVABLE, SALARIES
+
+
+def test_open_items(account_manager: AccountManager):
+    open_items = account_manager.open_items
+    invoice1 = account_manager.add_expense_invoice(
+        date(2021, 1, 1), "00001", Decimal(100), "//1"
+    )
+    invoice2 = account_manager.add_expense_invoice(
+        date(2021, 1, 5), "00002", Decimal(150), "//2"
+    )
+    sale = account_manager.add_sale_invoice(
+        date(2021, 1, 10), "00001", Decimal(500), "//s", Payee(name="C"), Decimal(65)
+    )
+    assert open_items.outstanding(sale) == Money(565)
+    assert list(open_items.open_invoices(PAYABLE)) == [invoice1, invoice2]
+    assert open_items.total(PAYABLE) == Money(250)
+
+    # a partial payment is allocated in the order the invoices are given
+    account_manager.pay_invoices([invoice1, invoice2], date(2021, 2, 1), Decimal(120))
+    assert open_items.outstanding(invoice1) == 0
+    assert open_items.outstanding(invoice2) == Money(130)
+    assert account_manager.is_invoice_clear(invoice1) is True
+    assert account_manager.is_invoice_clear(invoice2) is False
+    assert list(open_items.open_invoices()) == [invoice2, sale]
+
+    account_manager.receive_payment([sale], date(2021, 2, 1), Decimal(600))
+    assert open_items.outstanding(sale) == Money(-35)
+    assert account_manager.is_invoice_clear(sale) is True
+    assert list(open_items.open_invoices(RECEIVABLE)) == []
+
+
+def test_open_items_aging(account_manager: AccountManager):
+    for number, day in [("1", date(2021, 3, 25)), ("2", date(2021, 2, 15))]:
+        account_manager.add_expense_invoice(day, number, Decimal(10), "//")
+    account_manager.post_expense_invoices(
+        [{"date": date(2020, 12, 1), "number": "3", "amount": 40, "invoice_url": "//"}]
+    )
+
+    aging = account_manager.open_items.aging(PAYABLE, as_of=date(2021, 3, 31))
+    assert aging == {
+        "0-30": Money(10),
+        "31-60": Money(10),
+        "61-90": Money(0),
+        "91+": Money(40),
+    }
+
+
+def test_open_items_follow_rollbacks(account_manager: AccountManager):
+    invoice = account_manager.add_expense_invoice(
+        date(2021, 1, 1), "00001", Decimal(100), "//1"
+    )
+    try:
+        with account_manager.unit_of_work():
+            account_manager.pay_invoices([invoice], date(2021, 1, 2), Decimal(100))
+            raise RuntimeError
+    except RuntimeError:
+        pass
+    assert account_manager.open_items.outstanding(invoice) == Money(100)
+
+
+def test_invoice_clear_without_open_items(account_manager: AccountManager):
+    invoice = account_manager.add_expense_invoice(
+        date(2021, 1, 1), "00001", Decimal(100), "//1"
+    )
+    account_manager.pay_invoices([invoice], date(2021, 1, 2), Decimal(60))
+
+    # another manager on the same book has no open item for the invoice
+    other = AccountManager(account_manager.book)
+    assert other.open_items.get(invoice) is None
+    assert other.is_invoice_clear(invoice) is False
+    account_manager.pay_invoices([invoice], date(2021, 1, 3), Decimal(40))
+    assert other.is_invoice_clear(invoice) is True
+
+
+def test_payee_ledger(account_manager: AccountManager):
+    payees = account_manager.payees
+    vendor, customer, employee = (Payee(name=name) for name in ("V", "C", "E"))
+    first = account_manager.add_expense_invoice(
+        date(2021, 1, 5), "1", Decimal(100), "//1", vendor
+    )
+    second = account_manager.add_expense_invoice(
+        date(2021, 1, 1), "2", Decimal(50), "//2", vendor
+    )
+    account_manager.add_expense_invoice(date(2021, 1, 1), "3", Decimal(80), "//3")
+    sale = account_manager.add_sale_invoice(
+        date(2021, 1, 10), "1", Decimal(500), "//s", customer, Decimal(65)
+    )
+    account_manager.post_sale_invoices(
+        [
+            {
+                "date": date(2021, 1, 12),
+                "number": "2",
+                "amount": 35,
+                "invoice_url": "//s2",
+                "payee": customer,
+            }
+        ]
+    )
+    account_manager.pay_invoices([first, second], date(2021, 2, 1), Decimal(120))
+    account_manager.receive_payment([sale], date(2021, 2, 3), Decimal(400))
+    account_manager.register_salaries(
+        [{"date": date(2021, 1, 28), "amount": 300, "payee": employee}]
+    )
+    account_manager.pay_salary(date(2021, 2, 1), Decimal(250), employee, Decimal(20))
+
+    assert payees.balances(vendor) == {
+        PAYABLE: Money(30),
+        RECEIVABLE: Money(0),
+        SALARIES: Money(0),
+    }
+    assert payees.balance(customer, RECEIVABLE) == Money(200)
+    assert payees.balance(employee, SALARIES) == Money(30)
+    assert payees.total(PAYABLE) == Money(30)
+
+    lines = list(payees.statement(vendor))
+    assert [(line.posting.description, line.balance) for line in lines] == [
+        ("Invoice 2", Money(50)),
+        ("Invoice 1", Money(150)),
+        ("Payment for invoices", Money(50)),
+        ("Payment for invoices", Money(30)),
+    ]
+    assert lines[0].posting.document is second
+    lines = list(payees.statement(customer, start=date(2021, 2, 1)))
+    assert [line.balance for line in lines] == [Money(200)]
+
+    assert payees.top(RECEIVABLE) == [(customer, Money(200))]
+    assert payees.top(PAYABLE, 1) == [(vendor, Money(30))]
+    account_manager.pay_invoices([second], date(2021, 2, 2), Decimal(30))
+    assert payees.top(PAYABLE) == []
+
+    closed = account_manager.close_period("next")
+    assert closed.payees.balances(customer)[RECEIVABLE] == Money(200)
+    (line,) = closed.payees.statement(employee)
+    assert (line.posting.description, line.balance) == (BROUGHT_FORWARD, Money(30))
+
+
+def test_payee_ledger_top(account_manager: AccountManager):
+    payees = account_manager.payees
+    people = [Payee(name=str(number)) for number in range(50)]
+    for round_ in range(4):
+        for number, payee in enumerate(people):
+            amount = Money((number * 7 + round_ * 13) % 50 - 10)
+            payees.post(payee, SALARIES, amount, date(2021, 1, 1), "Salary")
+
+    expected = sorted(
+        (
+            (payees.balance(payee, SALARIES), payee.name)
+            for payee in people
+            if payees.balance(payee, SALARIES) > 0
+        ),
+        reverse=True,
+    )
+    top = payees.top(SALARIES, 5)
+    assert [balance for _, balance in top] == [balance for balance, _ in expected[:5]]
+    assert len(payees.top(SALARIES, 100)) == len(expected)
+    # Outdated balances are dropped from the heap
+    assert len(payees._heaps[SALARIES]) <= 2 * len(people) + 64
+
+
+def test_payee_ledger_bulk(account_manager: AccountManager):
+    payees = account_manager.payees
+    vendor = Payee(name="V")
+    account_manager.add_expense_invoice(
+        date(2021, 1, 10), "1", Decimal(100), "//1", vendor
+    )
+    # Models are taken as they are, dicts validated, backdated rows sorted in
+    rows = [
+        ExpenseInvoiceRow(
+            date=date(2021, 1, day),
+            number=str(day),
+            amount=day,
+            invoice_url="//",
+            payee=vendor,
+        )
+        for day in (20, 5)
+    ]
+    rows.append(
+        {
+            "date": date(2021, 1, 15),
+            "number": "15",
+            "amount": 15,
+            "invoice_url": "//",
+            "payee": vendor,
+        }
+    )
+    invoices = account_manager.post_expense_invoices(rows)
+
+    assert [invoice.number for invoice in invoices] == ["20", "5", "15"]
+    assert account_manager.open_items.total(PAYABLE) == Money(140)
+    assert payees.balance(vendor, PAYABLE) == Money(140)
+    assert [
+        (line.posting.description, line.balance) for line in payees.statement(vendor)
+    ] == [
+        ("Invoice 5", Money(5)),
+        ("Invoice 1", Money(105)),
+        ("Invoice 15", Money(120)),
+        ("Invoice 20", Money(140)),
+    ]
+
+
+def test_subledger_snapshots(account_manager: AccountManager):
+    open_items = account_manager.open_items
+    payees = account_manager.payees
+    vendor = Payee(name="V")
+    invoices = [
+        account_manager.add_expense_invoice(
+            date(2021, 1, day), str(day), Decimal(100), "//invoice", vendor
+        )
+        for day in (1, 2, 3)
+    ]
+    first = open_items.snapshot()
+    first_payees = payees.snapshot()
+
+    account_manager.pay_invoices([invoices[0]], date(2021, 2, 1), Decimal(100))
+    account_manager.add_expense_invoice(
+        date(2020, 12, 31), "0", Decimal(10), "//backdated", vendor
+    )
+    second = open_items.snapshot()
+    second_payees = payees.snapshot()
+
+    # Each snapshot only copies what changed since the one before
+    assert second.get(invoices[1]) is first.get(invoices[1])
+    assert first.outstanding(invoices[0]) == Money(100)
+    assert invoices[0] not in second
+    assert list(first.open_invoices()) == invoices
+    assert list(second.open_invoices())[:2] == invoices[1:]
+    assert (first.total(PAYABLE), second.total(PAYABLE)) == (Money(300), Money(210))
+
+    assert first_payees.balance(vendor, PAYABLE) == Money(300)
+    assert second_payees.balance(vendor, PAYABLE) == Money(210)
+    assert [line.balance for line in first_payees.statement(vendor)] == [
+        Money(100),
+        Money(200),
+        Money(300),
+    ]
+    assert len(list(second_payees.statement(vendor))) == 5
+    assert first_payees.top(PAYABLE) == [(vendor, Money(300))]
+    assert second_payees.top(PAYABLE) == payees.top(PAYABLE)
+
+    with raises(TypeError):
+        second.settle(invoices[1:], Money(10))
+    with raises(TypeError):
+        second_payees.post(vendor, PAYABLE, Money(1), date(2021, 1, 1), "Invoice")
+
+
+def test_layered_map():
+    layered = LayeredMap({"a": 1, "b": 2})
+    changed = layered.changed({"a": REMOVED, "c": 3, "d": REMOVED})
+    assert dict(layered) == {"a": 1, "b": 2}
+    assert dict(changed) == {"b": 2, "c": 3}
+    assert len(changed) == 2 and "a" not in changed and changed.get("d") is None
+
+    expected = dict(changed)
+    for number in range(1000):
+        key = str(number % 300)
+        value = REMOVED if number % 7 == 0 else number
+        changed = changed.changed({key: value})
+        if value is REMOVED:
+            expected.pop(key, None)
+        else:
+            expected[key] = value
+    assert dict(changed) == expected and len(changed) == len(expected)
+    # Layers are merged as they grow, so lookups stay short
+    assert len(changed._layers) <= 11